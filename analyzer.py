@@ -1,85 +1,277 @@
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import os
+import pickle
 import re
 from datetime import datetime
 import pandas as pd
 import plotly.graph_objects as go
-from collections import defaultdict
+from loader.locale import Locale
+
+BUCKET_MINUTES = 3  # 图表的时间粒度
+STATE_FILE = 'analyzer_state.pkl'
+
+TIME_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3}')
+SEPARATOR = "-------------------------------------------"
+SEPARATOR_BYTES = SEPARATOR.encode('utf-8')
+RESOURCE_PATTERN = re.compile(r'.* - INFO - (\S+): (\d+(?:\.\d+)?)')
+BUILDING_PATTERN = re.compile(r'  - 建筑\d+: (.+?), 等级:(\d+)(?:\((.*?)\))?')
+
+
+class SnapshotParser:
+    """
+    逐行解析日志中的状态快照 (两条分隔线之间的内容)。
+    解析状态都保存在属性中, 可以和读取位置一起保存, 之后从中断处继续解析。
+    """
+    def __init__(self):
+        self.timestamp = None
+        self.in_snapshot = False
+        self.in_resources = False
+        self.in_buildings = False
+        self.resources = {}
+        self.buildings = {}  # {建筑名称: {等级: {'complete': 数量, 'under_construction': 数量}}}
+
+    def feed(self, line):
+        """解析一行 (已去掉首尾空白), 一个快照结束时返回该快照, 否则返回 None"""
+        # 解析时间戳
+        time_match = TIME_PATTERN.match(line)
+        if time_match:
+            self.timestamp = datetime.strptime(time_match.group(1), '%Y-%m-%d %H:%M:%S')
+
+        # 检测分隔符
+        if SEPARATOR in line:
+            snapshot = None
+            if self.in_snapshot and self.timestamp:
+                # 结束当前快照
+                snapshot = {
+                    'timestamp': self.timestamp,
+                    'resources': self.resources,
+                    'buildings': self.buildings,
+                }
+                self.resources = {}
+                self.buildings = {}
+            self.in_snapshot = not self.in_snapshot
+            return snapshot
+
+        if self.in_snapshot:
+            if "当前资源：" in line:
+                self.in_resources = True
+                self.in_buildings = False
+                return None
+            elif "已探索的星球及建筑：" in line:
+                self.in_resources = False
+                self.in_buildings = True
+                return None
+
+            if self.in_resources:
+                # 匹配资源数据
+                res_match = RESOURCE_PATTERN.match(line)
+                if res_match:
+                    name = Locale.render(res_match.group(1).strip())
+                    self.resources[name] = float(res_match.group(2))
+
+            if self.in_buildings and "建筑" in line:
+                # 匹配建筑数据
+                building_match = BUILDING_PATTERN.search(line)
+                if building_match:
+                    name = Locale.render(building_match.group(1).strip())
+                    level = int(building_match.group(2))
+                    stats = self.buildings.setdefault(name, {}).setdefault(level, {'complete': 0, 'under_construction': 0})
+                    stats['complete'] += 1
+                    if building_match.group(3):
+                        stats['under_construction'] += 1
+        return None
 
 
 def parse_log(file_path):
+    """一次性解析整个日志, 返回所有快照"""
+    parser = SnapshotParser()
     snapshots = []
-    current_resources = {}
-    current_buildings = defaultdict(lambda: defaultdict(lambda: {'complete': 0, 'under_construction': 0}))
-    timestamp = None
-    in_snapshot = False
-    in_resources = False
-    in_buildings = False
-
     with open(file_path, 'r', encoding='utf-8') as f:
         for line in f:
-            line = line.strip()
-
-            # 解析时间戳
-            time_match = re.match(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3}', line)
-            if time_match:
-                timestamp = datetime.strptime(time_match.group(1), '%Y-%m-%d %H:%M:%S')
-
-            # 检测分隔符
-            if "-------------------------------------------" in line:
-                if in_snapshot and timestamp:
-                    # 结束当前快照
-                    snapshots.append({
-                        'timestamp': timestamp,
-                        'resources': dict(current_resources),
-                        'buildings': dict(current_buildings)
-                    })
-                    current_resources = {}
-                    current_buildings = defaultdict(lambda: defaultdict(lambda: {'complete': 0, 'under_construction': 0}))
-                in_snapshot = not in_snapshot
-                continue
-
-            if in_snapshot:
-                if "当前资源：" in line:
-                    in_resources = True
-                    in_buildings = False
-                    continue
-                elif "已探索的星球及建筑：" in line:
-                    in_resources = False
-                    in_buildings = True
-                    continue
-
-                if in_resources:
-                    # 匹配资源数据
-                    res_match = re.match(r'.* - INFO - (\S+): (\d+(?:\.\d+)?)', line)
-                    if res_match:
-                        name = res_match.group(1).strip()
-                        value = float(res_match.group(2))
-                        current_resources[name] = value
-
-                if in_buildings and "建筑" in line:
-                    # 匹配建筑数据
-                    building_match = re.search(r'  - 建筑\d+: (.+?), 等级:(\d+)(?:\((.*?)\))?', line)
-                    if building_match:
-                        name = building_match.group(1).strip()
-                        level = int(building_match.group(2))
-                        status = building_match.group(3)
-                        current_buildings[name][level]['complete'] += 1
-                        if status:
-                            current_buildings[name][level]['under_construction'] += 1
-
+            snapshot = parser.feed(line.strip())
+            if snapshot:
+                snapshots.append(snapshot)
     return snapshots
 
 
-def generate_charts(snapshots):
-    # 处理资源数据
-    resources_data = []
-    for snap in snapshots:
-        row = {'timestamp': snap['timestamp']}
-        row.update(snap['resources'])
-        resources_data.append(row)
+def _init_worker(language, table):
+    """解析进程使用与主进程相同的本地化文本"""
+    Locale.language = language
+    Locale.table = table
+
+
+def _parse_chunk(file_path, start, end, parser_state):
+    """
+    在解析进程中解析日志的 [start, end) 部分 (以快照开始的分隔线为起点, 以完整的行结束)。
+    返回 (快照列表, 解析结束时的解析状态)。
+    """
+    parser = SnapshotParser()
+    if parser_state:
+        parser.__dict__.update(parser_state)
+    snapshots = []
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for raw_line in mm[start:end].splitlines():
+            snapshot = parser.feed(raw_line.decode('utf-8', errors='replace').strip())
+            if snapshot:
+                snapshots.append(snapshot)
+    return snapshots, vars(parser)
+
+
+def find_chunks(mm, start, end, chunk_bytes):
+    """
+    把 [start, end) 切成大约 chunk_bytes 大小的块, 切分点都在快照开始的分隔线所在行的行首,
+    每一块都可以从空的解析状态开始独立解析。要求 start 处不在快照之中。
+    """
+    bounds = [start]
+    target = start + chunk_bytes
+    opening = True  # 下一条分隔线是快照的开始
+    pos = mm.find(SEPARATOR_BYTES, start, end)
+    while pos != -1:
+        line_start = mm.rfind(b'\n', 0, pos) + 1
+        if opening and line_start >= target and line_start > bounds[-1]:
+            bounds.append(line_start)
+            target = line_start + chunk_bytes
+        opening = not opening
+        line_end = mm.find(b'\n', pos, end)
+        if line_end == -1:
+            break
+        pos = mm.find(SEPARATOR_BYTES, line_end, end)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def bucket_of(timestamp):
+    """快照所在时间段的起点 (按 BUCKET_MINUTES 对齐)"""
+    return timestamp.replace(minute=timestamp.minute - timestamp.minute % BUCKET_MINUTES, second=0, microsecond=0)
 
-    df_res = pd.DataFrame(resources_data)
-    df_res.set_index('timestamp', inplace=True)
-    df_res = df_res.resample('3T').last().ffill()  # 3分钟切片，取最后一个值并填充
+
+class LogAnalyzer:
+    """
+    增量分析日志: 记住已经读到的字节位置和解析状态, 每次只解析新写入的内容,
+    快照按时间段预先聚合 (每个时间段内每一列取最后的值), 和读取位置一起保存在状态文件中。
+    日志被截断或替换 (开头的内容变了) 时从头重新分析。
+    """
+    HEAD_SIZE = 256  # 用日志开头的这些字节识别是不是同一个文件
+    PARALLEL_MIN_BYTES = 64 * 1024 * 1024  # 新内容超过这个大小时用多个进程并行解析
+    CHUNK_BYTES = 16 * 1024 * 1024  # 并行解析时每块的大小
+
+    def __init__(self, log_path='log.txt', state_path=STATE_FILE):
+        self.log_path = log_path
+        self.state_path = state_path
+        self.reset()
+        self.load_state()
+
+    def reset(self):
+        self.offset = 0
+        self.head = b''
+        self.parser = SnapshotParser()
+        self.buckets = {}  # {时间段起点: {'resources': {列: 值}, 'buildings': {列: 值}}}
+
+    def load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+            self.offset, self.head, self.buckets = state['offset'], state['head'], state['buckets']
+            self.parser.__dict__.update(state['parser'])
+        except Exception as e:
+            print(f"Error loading analyzer state: {e}")
+            self.reset()
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'offset': self.offset, 'head': self.head, 'parser': vars(self.parser), 'buckets': self.buckets}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.state_path)
+
+    def add_snapshot(self, snapshot):
+        bucket = self.buckets.setdefault(bucket_of(snapshot['timestamp']), {'resources': {}, 'buildings': {}})
+        bucket['resources'].update(snapshot['resources'])
+        for building, levels in snapshot['buildings'].items():
+            for level, stats in levels.items():
+                bucket['buildings'][f'{building}_L{level}_complete'] = stats['complete']
+                bucket['buildings'][f'{building}_L{level}_under_construction'] = stats['under_construction']
+
+    def update(self, workers=None):
+        """
+        解析上次之后新写入的完整行, 返回新解析出的快照数量。
+        新内容较多时用 workers 个进程并行解析 (None 为 CPU 数量, 1 为不并行)。
+        """
+        with open(self.log_path, 'rb') as f:
+            head = f.read(self.HEAD_SIZE)
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offset or head[:len(self.head)] != self.head:
+                self.reset()
+            self.head = head
+            if workers != 1 and size - self.offset >= self.PARALLEL_MIN_BYTES:
+                count = self._update_parallel(f, size, workers)
+            else:
+                count = self._update_sequential(f)
+        self.save_state()
+        return count
+
+    def _update_sequential(self, f):
+        f.seek(self.offset)
+        count = 0
+        for raw_line in f:
+            if not raw_line.endswith(b'\n'):
+                break  # 还没写完的行留到下次
+            self.offset += len(raw_line)
+            snapshot = self.parser.feed(raw_line.decode('utf-8', errors='replace').strip())
+            if snapshot:
+                self.add_snapshot(snapshot)
+                count += 1
+        return count
+
+    def _update_parallel(self, f, size, workers):
+        """
+        内存映射日志, 在快照边界处切块, 用进程池并行解析各块, 再按时间顺序合并快照。
+        """
+        count = 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.rfind(b'\n', self.offset, size) + 1  # 还没写完的行留到下次
+            # 先顺序解析完上次没有结束的快照, 之后的内容才能在快照边界处切开
+            while self.parser.in_snapshot and self.offset < end:
+                line_end = mm.find(b'\n', self.offset, end) + 1
+                snapshot = self.parser.feed(mm[self.offset:line_end].decode('utf-8', errors='replace').strip())
+                self.offset = line_end
+                if snapshot:
+                    self.add_snapshot(snapshot)
+                    count += 1
+            if self.offset >= end:
+                return count
+            chunks = find_chunks(mm, self.offset, end, self.CHUNK_BYTES)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(Locale.language, Locale.table)) as executor:
+            futures = [executor.submit(_parse_chunk, self.log_path, start, chunk_end, vars(self.parser) if index == 0 else None)
+                       for index, (start, chunk_end) in enumerate(chunks)]
+            results = [future.result() for future in futures]
+
+        snapshots = [snapshot for chunk_snapshots, _ in results for snapshot in chunk_snapshots]
+        snapshots.sort(key=lambda snapshot: snapshot['timestamp'])  # 稳定排序, 时间相同时保持日志中的顺序
+        for snapshot in snapshots:
+            self.add_snapshot(snapshot)
+        self.parser.__dict__.update(results[-1][1])  # 最后一块结束时可能还在快照之中
+        self.offset = end
+        return count + len(snapshots)
+
+
+def _bucket_frame(buckets, key):
+    """由预先聚合的时间段生成连续的 3 分钟切片, 没有快照的时间段沿用之前的值"""
+    times = sorted(buckets)
+    df = pd.DataFrame([buckets[t][key] for t in times], index=pd.DatetimeIndex(times, name='timestamp'))
+    full_range = pd.date_range(times[0], times[-1], freq=f'{BUCKET_MINUTES}min', name='timestamp')
+    return df.reindex(full_range).ffill()
+
+
+def generate_charts(buckets):
+    # 处理资源数据
+    df_res = _bucket_frame(buckets, 'resources')  # 3分钟切片，取最后一个值并填充
 
     # 生成资源图表
     fig_res = go.Figure()
@@ -98,18 +290,7 @@ def generate_charts(snapshots):
     )
 
     # 处理建筑数据
-    buildings_data = []
-    for snap in snapshots:
-        row = {'timestamp': snap['timestamp']}
-        for building, levels in snap['buildings'].items():
-            for level, stats in levels.items():
-                row[f'{building}_L{level}_complete'] = stats['complete']
-                row[f'{building}_L{level}_under_construction'] = stats['under_construction']
-        buildings_data.append(row)
-
-    df_bld = pd.DataFrame(buildings_data)
-    df_bld.set_index('timestamp', inplace=True)
-    df_bld = df_bld.resample('3T').last().ffill()  # 3分钟切片，取最后一个值并填充
+    df_bld = _bucket_frame(buckets, 'buildings')  # 3分钟切片，取最后一个值并填充
 
     # 生成建筑图表
     fig_bld = go.Figure()
@@ -136,8 +317,12 @@ def generate_charts(snapshots):
 
 
 if __name__ == "__main__":
-    snapshots = parse_log('log.txt')
-    fig_res, fig_bld = generate_charts(snapshots)
+    # 日志中的名称是本地化标记, 按这里设置的语言渲染
+    Locale.load_from_csv('resources/locale.csv')
+    Locale.set_language("cn")
+    analyzer = LogAnalyzer('log.txt')
+    print(f"新增快照 {analyzer.update()} 个, 已分析到第 {analyzer.offset} 字节")
+    fig_res, fig_bld = generate_charts(analyzer.buckets)
     fig_res.write_html('resources.html')
     fig_bld.write_html('buildings.html')
     
\ No newline at end of file
@@ -1,15 +1,89 @@
 from basic_types.enums import *
+from collections import Counter
+import contextvars
+import sys
+import weakref
 
-class BaseObject:
-    _object_id_counter = 0
-    _objects = {}
+class ObjectRegistry:
+    """
+    一局游戏的对象表: 分配对象 ID 并按 ID 查找对象。
+    每个 Game 持有自己的 ObjectRegistry, 同一进程中的多局游戏 ID 互不干扰。
+    对象表只持有弱引用, 对象的生命周期由管理它的管理器决定, 不再被引用的对象 (被摧毁的建筑、结束的事件等) 会自动从表中消失;
+    管理器移除对象时也可以调用 remove 立即注销。
+    """
+    def __init__(self, next_id: int = 0):
+        self.next_id = next_id
+        self.objects: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.created = 0  # 累计登记的对象数
+        self.removed = 0  # 累计显式注销的对象数
+
+    def register(self, obj) -> int:
+        object_id = self.next_id
+        self.next_id += 1
+        self.objects[object_id] = obj
+        self.created += 1
+        return object_id
+
+    def get(self, object_id):
+        return self.objects.get(object_id)
+
+    def add(self, obj):
+        """登记一个已有 ID 的对象 (例如从其他分片接收的玩家)"""
+        self.objects[obj.object_id] = obj
+
+    def remove(self, object_id):
+        obj = self.objects.pop(object_id, None)
+        if obj is not None:
+            self.removed += 1
+        return obj
+
+    def __len__(self):
+        return len(self.objects)
+
+    def count_by_type(self) -> Dict[str, int]:
+        """各类型存活对象的数量"""
+        return dict(Counter(type(obj).__name__ for obj in self.objects.values()))
+
+    def memory_by_type(self) -> Dict[str, int]:
+        """各类型存活对象占用的内存 (字节, 只统计对象本身和属性字典, 不含属性引用的其他对象)"""
+        sizes = Counter()
+        for obj in self.objects.values():
+            size = sys.getsizeof(obj)
+            if hasattr(obj, "__dict__"):
+                size += sys.getsizeof(obj.__dict__)
+            sizes[type(obj).__name__] += size
+        return dict(sizes)
 
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alive": len(self.objects),
+            "created": self.created,
+            "removed": self.removed,
+            "count_by_type": self.count_by_type(),
+            "memory_by_type": self.memory_by_type(),
+        }
+
+
+# 当前上下文使用的对象表, 由 Game 在创建和 tick 时设置; 没有 Game 时使用默认对象表
+_default_registry = ObjectRegistry()
+_current_registry = contextvars.ContextVar("object_registry", default=_default_registry)
+
+def current_registry() -> ObjectRegistry:
+    return _current_registry.get()
+
+def activate_registry(registry: ObjectRegistry) -> contextvars.Token:
+    """切换当前上下文的对象表, 返回用于恢复的 token"""
+    return _current_registry.set(registry)
+
+def restore_registry(token: contextvars.Token):
+    _current_registry.reset(token)
+
+
+class BaseObject:
     def __init__(self, *kwargs):
-        self.object_id = BaseObject._object_id_counter
+        self.object_id = _current_registry.get().register(self)
         self.type = ObjectType.SYSTEM
-        BaseObject._object_id_counter += 1
-        BaseObject._objects[self.object_id] = self
 
     @classmethod
     def get_object_by_id(cls, object_id):
-        return cls._objects.get(object_id)
\ No newline at end of file
+        return _current_registry.get().get(object_id)
@@ -20,6 +20,9 @@ class Vector3:
         return self.f_score < other.f_score
 
     def __eq__(self, other):
+        if isinstance(other, tuple):
+            # 与 (x, y, z) 元组哈希相同, 作为字典键时需要能与元组比较
+            return (self.x, self.y, self.z) == other
         if other is not None:
             return (self.x, self.y, self.z) == (other.x, other.y, other.z)
         else:
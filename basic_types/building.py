@@ -1,4 +1,5 @@
 from basic_types.enums import ObjectType
+from typing import Optional
 from .building_config import BuildingConfig
 from .base_object import BaseObject
 
@@ -7,13 +8,26 @@ class BuildingInstance(BaseObject):
         super().__init__()
         self.type = ObjectType.BUILDING
         self.building_config: BuildingConfig = building_config
-        self.remaining_secs: float = building_config.build_period 
+        # 建造/升级的完成时间由 TimerWheel 调度, remaining_secs 在读取时计算
+        self.timer_wheel = None
+        self.timer_id: Optional[int] = None
+        self.complete_tick: Optional[int] = None
+        self.completed: bool = False
         self.durability: int = building_config.durability
         self.is_under_attack: bool = False
         self.manpower : int = 0 #投入的人口数量，将影响产出
         self.modifiers = []
         self.build_on = world_id        
 
+    @property
+    def remaining_secs(self) -> float:
+        """剩余建造时间, 未开始调度的建筑视为还需要完整的建造周期"""
+        if self.completed:
+            return 0
+        if self.complete_tick is None:
+            return self.building_config.build_period
+        return max(self.complete_tick - self.timer_wheel.current_tick, 0)
+
     def take_damage(self, damage: int):
         """受到伤害"""
         self.durability -= damage
@@ -24,3 +38,28 @@ class BuildingInstance(BaseObject):
     def get_destroyed(self) -> bool:
         """获取是否被摧毁"""
         return self.durability <= 0
+
+class BuildTransaction:
+    """
+    一次建造/升级请求的事务记录。
+    请求发出的所有资源修改 (MODIFIER_APPLY_REQUEST) 都成功后, 才真正放置或升级建筑。
+    """
+    __slots__ = (
+        "txn_id", "action", "player_id", "building_config",
+        "world_id", "slot_type", "slot_index", "subtype",  # 建造
+        "building_id",  # 升级
+        "pending_requests", "deadline",
+    )
+
+    def __init__(self, txn_id: int, action, player_id, building_config, deadline):
+        self.txn_id = txn_id
+        self.action = action
+        self.player_id = player_id
+        self.building_config = building_config
+        self.world_id = None
+        self.slot_type = None
+        self.slot_index = None
+        self.subtype = None
+        self.building_id = None
+        self.pending_requests: set = set()  # 尚未收到回应的修改请求 ID
+        self.deadline = deadline
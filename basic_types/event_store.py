@@ -0,0 +1,89 @@
+from common import *
+from basic_types.enums import ObjectType
+
+class EventStore:
+    """
+    进行中的事件, 同一个目标上可以同时有多个事件。
+    按事件对象 ID 保存, 另外维护按目标、按事件配置和按阶段到期 tick 的索引,
+    添加、删除和修改到期 tick 都是 O(1)。各索引内部保持事件的开始顺序。
+    事件需要有 object_id, target_type, target_id, config.event_id 和 deadline (到期 tick, 没有期限时为 None) 属性。
+    """
+    def __init__(self):
+        self.events: Dict[int, Any] = {}  # {事件对象 ID: 事件}
+        self.by_target: Dict[Tuple[ObjectType, Any], Dict[int, Any]] = {}
+        self.by_config: Dict[str, Dict[int, Any]] = {}
+        self.by_deadline: Dict[int, Dict[int, Any]] = {}
+        self.counts: Dict[ObjectType, int] = {}  # 各目标类型的事件数量
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(list(self.events.values()))
+
+    def __contains__(self, event_id):
+        return event_id in self.events
+
+    def get(self, event_id):
+        return self.events.get(event_id)
+
+    @staticmethod
+    def _index(index: Dict, key, event):
+        index.setdefault(key, {})[event.object_id] = event
+
+    @staticmethod
+    def _unindex(index: Dict, key, event):
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(event.object_id, None)
+        if not bucket:
+            del index[key]
+
+    def add(self, event):
+        if event.object_id in self.events:
+            return
+        self.events[event.object_id] = event
+        self._index(self.by_target, (event.target_type, event.target_id), event)
+        self._index(self.by_config, event.config.event_id, event)
+        if event.deadline is not None:
+            self._index(self.by_deadline, event.deadline, event)
+        self.counts[event.target_type] = self.counts.get(event.target_type, 0) + 1
+
+    def remove(self, event):
+        if self.events.pop(event.object_id, None) is None:
+            return
+        self._unindex(self.by_target, (event.target_type, event.target_id), event)
+        self._unindex(self.by_config, event.config.event_id, event)
+        if event.deadline is not None:
+            self._unindex(self.by_deadline, event.deadline, event)
+        self.counts[event.target_type] -= 1
+
+    def set_deadline(self, event, deadline: Optional[int]):
+        """修改事件当前阶段的到期 tick"""
+        if event.object_id in self.events and event.deadline is not None:
+            self._unindex(self.by_deadline, event.deadline, event)
+        event.deadline = deadline
+        if event.object_id in self.events and deadline is not None:
+            self._index(self.by_deadline, deadline, event)
+
+    def for_target(self, target_type: ObjectType, target_id) -> List[Any]:
+        """目标上进行中的事件 (按开始顺序)"""
+        bucket = self.by_target.get((target_type, target_id))
+        return list(bucket.values()) if bucket else []
+
+    def has_target(self, target_type: ObjectType, target_id) -> bool:
+        return (target_type, target_id) in self.by_target
+
+    def for_config(self, event_id: str) -> List[Any]:
+        """某个事件配置的所有进行中的事件"""
+        bucket = self.by_config.get(event_id)
+        return list(bucket.values()) if bucket else []
+
+    def due_at(self, tick: int) -> List[Any]:
+        """当前阶段在 tick 到期的事件"""
+        bucket = self.by_deadline.get(tick)
+        return list(bucket.values()) if bucket else []
+
+    def count_by_type(self) -> Dict[str, int]:
+        return {target_type.name: count for target_type, count in self.counts.items() if count}
@@ -1,7 +1,7 @@
 from basic_types.basic_typs import *
 from basic_types.enums import ObjectType
 from common import *
-from .resource import Resource
+from .resource import Resource, ResourceVector
 from .base_object import BaseObject
 
 class Fleet:
@@ -33,37 +33,52 @@ class Player(BaseObject):
     def __init__(self, resources, building_configs, purchase_configs):  # 增加 purchase_configs
         super().__init__()
         self.type = ObjectType.PLAYER
-        self.resources: Dict[Resource, float] = {resource: 0.0 for resource in resources}
+        self.resources: ResourceVector = ResourceVector()  # 按资源下标存放, 包含所有已登记的资源
         self.manpower_allocation = {}
+        self.allocated_manpower = 0  # 已分配人力的累计值, 随 allocate_manpower 增量维护
         self.avaliable_manpower = 0
         self.fleet = Fleet()
         self.avaliable_building_config = building_configs
         self.available_purchases = purchase_configs  # 存储可购买项
         self.characters = [{"name": "角色 1", "location": None}]
-        self.explored_planets: List[str] = []
+        # 已探索的星球, 用 dict 作为按探索顺序排列的集合: 遍历顺序与哈希表的历史无关, 存档恢复后保持不变
+        self.explored_planets: Dict[str, None] = {}
         self.action_points = 5
         self.max_action_points = 20
         self.action_points_recovery_per_minute = 0.1
         self.gold = 1000  # 初始金币
+        self.pending_actions: List[Dict] = []  # 外部 (如客户端连接) 提交的操作, 下一个 tick 处理
 
     def add_resource(self, resource_id: str, amount: float):
-        """增加资源 (现在直接修改)"""
-        for resource in self.resources:
-            if resource == resource_id:
-                self.resources[resource] += amount
-                break
+        """增加资源 (现在直接修改), 未知资源忽略"""
+        index = Resource.index_of(resource_id)
+        if index is not None:
+            self.resources.values[index] += amount
+
+    def allocate_manpower(self, world_id: str, building_id: str, amount: int):
+        """调整某个建筑的人力分配 (amount 为正表示增加，为负表示减少)"""
+        world_allocations = self.manpower_allocation.setdefault(world_id, {})
+        world_allocations[building_id] = world_allocations.get(building_id, 0) + amount
+        self.allocated_manpower += amount
+
+    def reallocate_manpower(self, allocations: List[Tuple[str, str, int]]):
+        """批量调整人力分配 [(world_id, building_id, amount), ...]"""
+        for world_id, building_id, amount in allocations:
+            self.allocate_manpower(world_id, building_id, amount)
 
     def calculate_available_manpower(self):
         total_population = self.resources.get("resource.population", 0)
-        allocated_manpower = 0
-        for world_allocations in self.manpower_allocation.values():
-            for building_id, manpower in world_allocations.items():
-                allocated_manpower += manpower
-        self.available_manpower = int(total_population - allocated_manpower)
+        self.available_manpower = int(total_population - self.allocated_manpower)
+
+    def submit_actions(self, actions: List[Dict]):
+        """提交外部操作数据, 在下一个 tick 中统一处理"""
+        self.pending_actions.extend(actions)
 
     def tick(self, game):
         """
-        普通 Player 的 tick 方法，暂时返回 None。
-        未来可以通过用户输入或其他方式获取操作数据。
+        普通 Player 的 tick 方法，返回外部提交的操作数据, 没有时返回 None。
         """
-        return None
+        if not self.pending_actions:
+            return None
+        actions, self.pending_actions = self.pending_actions, []
+        return actions
@@ -1,28 +1,113 @@
 from .enums import *
 from common import *
+from array import array
 
 class Resource:
+    """
+    资源注册表。加载配置时为每种资源分配一个稠密的整数下标 (按加载顺序),
+    玩家的资源数量按下标存放在 ResourceVector 中, 资源 ID 字符串只在读写配置、消息和日志时使用。
+    """
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.resources : List[ResourceConfig] = [] # type: ignore
+            cls._instance.resources : List[ResourceConfig] = [] # type: ignore  # 按下标排列
+            cls._instance.indices : Dict[str, int] = {} # type: ignore  # {资源 ID: 下标}
             return cls._instance
 
     @classmethod
     def new_resource(cls, res):
+        """登记资源。同一 ID 再次登记 (重新加载配置) 时沿用原来的下标"""
         if not cls._instance:
             cls._instance = Resource()
-        if res not in cls._instance.resources:
+        index = cls._instance.indices.get(res.id)
+        if index is None:
+            index = len(cls._instance.resources)
+            cls._instance.indices[res.id] = index
             cls._instance.resources.append(res)
-    
+        else:
+            cls._instance.resources[index] = res
+        res.index = index
+
     @classmethod
     def get_resource_by_id(cls, id:str):
-        for res in cls._instance.resources:
-            if res.id == id:
-                return res
-        return None
+        index = cls.index_of(id)
+        return cls._instance.resources[index] if index is not None else None
+
+    @classmethod
+    def index_of(cls, id: str) -> Optional[int]:
+        """资源 ID 对应的下标, 未知资源返回 None"""
+        if not cls._instance:
+            return None
+        return cls._instance.indices.get(id)
+
+    @classmethod
+    def count(cls) -> int:
+        return len(cls._instance.resources) if cls._instance else 0
+
+
+class ResourceVector:
+    """
+    按资源下标存放的资源数量 (array('d'))。
+    values 可以直接按下标读写, 也可以整体参与批量计算;
+    同时提供按资源 ID 读写的字典接口, 供配置、消息、日志等边界处的代码使用, 遍历顺序与资源下标一致。
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        self.values = array("d", values) if values is not None else array("d", bytes(8 * Resource.count()))
+
+    def _index(self, resource_id) -> int:
+        index = Resource.index_of(resource_id)
+        if index is None:
+            raise KeyError(resource_id)
+        if index >= len(self.values):
+            # 创建之后才登记的资源
+            self.values.extend(bytes(8 * (index + 1 - len(self.values))))
+        return index
+
+    def __getitem__(self, resource_id) -> float:
+        return self.values[self._index(resource_id)]
+
+    def __setitem__(self, resource_id, amount: float):
+        self.values[self._index(resource_id)] = amount
+
+    def get(self, resource_id, default=None):
+        index = Resource.index_of(resource_id)
+        if index is None or index >= len(self.values):
+            return default
+        return self.values[index]
+
+    def __contains__(self, resource_id) -> bool:
+        index = Resource.index_of(resource_id)
+        return index is not None and index < len(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        resources = Resource._instance.resources
+        return (resources[index].id for index in range(len(self.values)))
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        resources = Resource._instance.resources
+        return [(resources[index].id, amount) for index, amount in enumerate(self.values)]
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, ResourceVector):
+            return self.values == other.values
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ResourceVector({self.to_dict()})"
+
 
 class ResourceConfig:
     def __init__(self):
@@ -31,6 +116,7 @@ class ResourceConfig:
         self.type: Optional[ResourceType] = None
         self.desc_id: Optional[str] = None
         self.acquire_id: Optional[str] = None
+        self.index: Optional[int] = None  # 在 Resource 中登记后分配的下标
 
     def __str__(self):
         return f"ResourceConfig(\n" \
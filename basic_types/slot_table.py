@@ -0,0 +1,70 @@
+from common import *
+from .enums import BuildingType
+
+class SlotTable:
+    """
+    单个星球的建筑槽位表。
+    每种槽位 (slot_type, subtype) 用一个整数位图记录空闲槽位 (第 i 位为 1 表示槽位 i 空闲),
+    同时维护 building_id -> 槽位 的反向索引, 以及星球上建筑列表的缓存。
+    general 和 defense 类型没有子类型, subtype 为 None。
+    """
+    def __init__(self, building_slots: Dict):
+        self.slots: Dict[Tuple, List[Optional[str]]] = {}  # {(slot_type, subtype): [building_id 或 None, ...]}
+        self.free_masks: Dict[Tuple, int] = {}  # {(slot_type, subtype): 空闲槽位位图}
+        self.slot_of: Dict[str, Tuple[Tuple, int]] = {}  # {building_id: ((slot_type, subtype), slot_index)}
+        self.buildings: Dict[str, Any] = {}  # {building_id: BuildingInstance}, 按放置顺序
+        self._building_list: Optional[List] = None  # get_buildings 的缓存, 建筑变化时失效
+
+        for slot_type, slots in building_slots.items():
+            if slot_type == BuildingType.RESOURCE:
+                for subtype, count in slots.items():
+                    self._add_slots((slot_type, subtype), count)
+            else:
+                self._add_slots((slot_type, None), slots)
+
+    def _add_slots(self, key: Tuple, count: int):
+        count = max(count, 0)  # 随机调整后槽位数可能为负
+        self.slots[key] = [None] * count
+        self.free_masks[key] = (1 << count) - 1
+
+    def find_free(self, key: Tuple, exclude: Optional[Set[int]] = None) -> Optional[int]:
+        """返回编号最小的空闲槽位, exclude 中的槽位视为已占用"""
+        mask = self.free_masks.get(key, 0)
+        if exclude:
+            for slot_index in exclude:
+                mask &= ~(1 << slot_index)
+        if not mask:
+            return None
+        return (mask & -mask).bit_length() - 1
+
+    def is_free(self, key: Tuple, slot_index: int) -> bool:
+        return bool(self.free_masks.get(key, 0) >> slot_index & 1)
+
+    def place(self, key: Tuple, slot_index: int, building) -> bool:
+        """把建筑放入指定槽位, 槽位不存在或已被占用时返回 False"""
+        if not self.is_free(key, slot_index):
+            return False
+        self.slots[key][slot_index] = building.object_id
+        self.free_masks[key] &= ~(1 << slot_index)
+        self.slot_of[building.object_id] = (key, slot_index)
+        self.buildings[building.object_id] = building
+        self._building_list = None
+        return True
+
+    def remove(self, building_id: str) -> Optional[Tuple[Tuple, int]]:
+        """移除建筑并释放槽位, 返回原来的槽位"""
+        slot = self.slot_of.pop(building_id, None)
+        if slot is None:
+            return None
+        key, slot_index = slot
+        self.slots[key][slot_index] = None
+        self.free_masks[key] |= 1 << slot_index
+        del self.buildings[building_id]
+        self._building_list = None
+        return slot
+
+    def get_buildings(self) -> List:
+        """星球上的所有建筑实例 (缓存的列表, 调用方不要修改)"""
+        if self._building_list is None:
+            self._building_list = list(self.buildings.values())
+        return self._building_list
@@ -0,0 +1,51 @@
+from common import *
+
+class TargetIndex:
+    """
+    可以随机抽取的对象 ID 集合, 用于事件等随机选取目标。
+    ID 存放在数组中, 另用一个位置表记录每个 ID 在数组中的下标:
+    添加、删除 (用最后一个元素填补空位) 和随机抽取都是 O(1), 抽取时不需要复制整个 ID 集合。
+    """
+    def __init__(self):
+        self.ids: List[int] = []
+        self.positions: Dict[int, int] = {}  # {object_id: 在 ids 中的下标}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, object_id):
+        return object_id in self.positions
+
+    def add(self, object_id):
+        if object_id in self.positions:
+            return
+        self.positions[object_id] = len(self.ids)
+        self.ids.append(object_id)
+
+    def remove(self, object_id):
+        position = self.positions.pop(object_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if position < len(self.ids):
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def pick(self, rng=random):
+        """随机抽取一个 ID, 集合为空时返回 None"""
+        if not self.ids:
+            return None
+        return rng.choice(self.ids)
+
+    def sample(self, eligible: Optional[Callable[[int], bool]] = None, rng=random, attempts: int = 8):
+        """
+        随机抽取一个满足 eligible 的 ID。
+        用拒绝采样实现, 最多尝试 attempts 次, 都不满足时返回 None (符合条件的目标很少时可能抽不到)。
+        """
+        if not self.ids:
+            return None
+        for _ in range(attempts):
+            object_id = rng.choice(self.ids)
+            if eligible is None or eligible(object_id):
+                return object_id
+        return None
@@ -17,6 +17,16 @@ class WorldInstance(BaseObject):
         self.docked_fleets: Dict[str, Vector3] = {}  # 停靠的舰队 {player_id: fleet_location}
         self.owner = player_id
 
+    def __getstate__(self):
+        # 不可穿透区域的坐标可以由位置和大小重新计算, 序列化时不保存
+        state = self.__dict__.copy()
+        del state["impenetrable_locations"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.impenetrable_locations = self._calculate_impenetrable_locations()
+
     def _parse_adjustment(self, adjustment_str):
         if '~' in adjustment_str:
             parts = adjustment_str.split('~')
@@ -62,27 +72,27 @@ class WorldInstance(BaseObject):
                     locations.add(Vector3(self.location.x + dx, self.location.y + dy, self.location.z + dz))
         return locations
 
-    def get_spawn_location(self) -> Vector3:
-        """获取星球上一个可用的出生点 (单元格坐标)"""
+    def get_spawn_location(self, rng=random) -> Vector3:
+        """获取星球上一个可用的出生点 (单元格坐标), rng 可传入独立的随机源"""
         while True:  # 使用循环，直到找到一个可用的出生点
             # 随机选择一个轴 (x, y, 或 z)
-            axis = random.choice(['x', 'y', 'z'])
+            axis = rng.choice(['x', 'y', 'z'])
 
             # 随机选择一个面 (+ 或 -)
-            sign = random.choice([-1, 1])
+            sign = rng.choice([-1, 1])
 
             # 固定该轴向的偏移量
             if axis == 'x':
                 offset_x = sign * (self.impenetrable_half_extent + 1)
-                offset_y = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
-                offset_z = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_y = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_z = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
             elif axis == 'y':
-                offset_x = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_x = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
                 offset_y = sign * (self.impenetrable_half_extent + 1)
-                offset_z = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_z = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
             else:  # axis == 'z'
-                offset_x = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
-                offset_y = random.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_x = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
+                offset_y = rng.randint(-self.reachable_half_extent, self.reachable_half_extent)
                 offset_z = sign * (self.impenetrable_half_extent + 1)
 
             # 计算出生点坐标
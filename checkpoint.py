@@ -0,0 +1,382 @@
+"""
+存档 (checkpoint): 把一局游戏的完整状态保存为带版本号的压缩二进制文件, 并能从文件恢复。
+
+文件格式: 文件头 (MAGIC, 格式版本, 类型, 序号, 基准序号) + zlib 压缩的 pickle 数据。
+存档分为全量存档和增量存档, 增量存档只记录相对上一个存档发生变化的记录,
+恢复时从最近的全量存档开始依次应用后续的增量存档。
+
+存档只保存游戏状态本身:
+- 配置 (建筑、星球、事件、购买项、资源) 按 ID 引用, 恢复时使用当前加载的配置
+- 管理器、消息总线、定时器等按名字引用, 恢复时指向新创建的管理器
+- 各种索引 (空间索引、槽位表、按目标的 Modifier 索引、超时堆等) 不保存, 恢复时重建
+"""
+import glob
+import heapq
+import io
+import os
+import pickle
+import random
+import struct
+import time
+import zlib
+from basic_types.base_object import BaseObject
+from basic_types.resource import Resource
+
+MAGIC = b"GCKP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHBQQ")  # MAGIC, 版本, 类型, 序号, 基准序号
+KIND_FULL = 0
+KIND_DELTA = 1
+
+# 按引用保存的 Game 属性
+GAME_REFERENCES = ("message_bus", "timer_wheel", "world_manager", "event_manager", "building_manager",
+                   "purchase_manager", "player_manager", "modifier_manager", "rule_manager", "path_finder", "log")
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def _config_table(game):
+    """配置对象和它们的引用键 {键: 配置对象}"""
+    table = {
+        ("building_configs",): game.building_manager.building_configs,
+        ("world_configs",): game.world_manager.world_configs,
+        ("purchase_configs",): game.purchase_manager.purchase_configs,
+        ("event_configs",): game.event_manager.event_configs,
+    }
+    for config_id, building_config in game.building_manager.building_configs.items():
+        table[("building", config_id)] = building_config
+        for index, modifier_config in enumerate(building_config.modifier_configs):
+            table[("building_modifier", config_id, index)] = modifier_config
+    for world_id, world_config in game.world_manager.world_configs.items():
+        table[("world", world_id)] = world_config
+    for package_name, purchase_config in game.purchase_manager.purchase_configs.items():
+        table[("purchase", package_name)] = purchase_config
+    for event_config in game.event_manager.event_configs:
+        table[("event", event_config.event_id)] = event_config
+        for phase_id, phase in event_config.phases.items():
+            table[("event_phase", event_config.event_id, phase_id)] = phase
+    if Resource._instance:
+        for resource in Resource._instance.resources:
+            table[("resource", resource.id)] = resource
+    return table
+
+
+class _RecordPickler(pickle.Pickler):
+    """序列化单条记录: 配置、管理器和其他记录中的游戏对象都只保存引用"""
+    def __init__(self, file, references, objects, owner=None):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.references = references  # {id(对象): 引用键}
+        self.objects = objects  # 存档中单独保存的游戏对象 {object_id: 对象}
+        self.owner = owner  # 本条记录保存的游戏对象, 需要完整序列化
+
+    def persistent_id(self, obj):
+        key = self.references.get(id(obj))
+        if key is not None:
+            return key
+        if isinstance(obj, BaseObject) and obj is not self.owner and self.objects.get(obj.object_id) is obj:
+            return ("object", obj.object_id)
+        return None
+
+
+class _RecordUnpickler(pickle.Unpickler):
+    def __init__(self, file, references, objects):
+        super().__init__(file)
+        self.references = references  # {引用键: 对象}
+        self.objects = objects
+
+    def persistent_load(self, key):
+        if key[0] == "object":
+            obj = self.objects.get(key[1])
+            if obj is None:
+                raise CheckpointError(f"存档引用了不存在的对象: {key[1]}")
+            return obj
+        if key not in self.references:
+            raise CheckpointError(f"存档引用了当前配置中不存在的项: {key}")
+        return self.references[key]
+
+
+def _references(game):
+    """恢复时使用的引用表 {引用键: 对象}"""
+    references = _config_table(game)
+    references[("game",)] = game
+    for name in GAME_REFERENCES:
+        references[("game", name)] = getattr(game, name)
+    return references
+
+
+def capture(game):
+    """
+    采集游戏状态, 返回 (整体记录 {名称: bytes}, 按 ID 的记录 {名称: {ID: bytes}})。
+    需要在两个 tick 之间调用。
+    """
+    references = {id(obj): key for key, obj in _references(game).items()}
+    world_manager = game.world_manager
+    building_manager = game.building_manager
+    player_manager = game.player_manager
+    event_manager = game.event_manager
+
+    keyed = {
+        "worlds": dict(world_manager.world_instances),
+        "buildings": {},
+        "players": {},
+        "events": {},
+    }
+    # 按建筑的创建顺序保存, 恢复后遍历建筑的顺序不变 (机器人的决策依赖这个顺序)
+    for building_id, building in building_manager.building_instances.items():
+        slot_key, slot_index = building_manager.world_buildings[building.build_on].slot_of[building_id]
+        keyed["buildings"][building_id] = (building.build_on, slot_key, slot_index, building)
+    for player_id, player in player_manager.players.items():
+        keyed["players"][player_id] = (player, player_manager.robots.get(player_id))
+    for event in event_manager.active_events:
+        keyed["events"][event.object_id] = event
+
+    # 单独保存的游戏对象, 其他记录引用它们时只保存 ID
+    objects = dict(world_manager.world_instances)
+    objects.update(building_manager.building_instances)
+    objects.update(player_manager.players)
+    objects.update(keyed["events"])
+
+    whole = {
+        "meta": {
+            "tick_counter": game.tick_counter,
+            "current_tick": game.timer_wheel.current_tick,
+            "next_timer_id": game.timer_wheel._next_timer_id,
+            "next_object_id": game.registry.next_id,
+            "next_msg_id": game.message_bus._next_msg_id,
+            "next_txn_id": building_manager._next_txn_id,
+            "random_state": random.getstate(),
+            "event_last_generate": event_manager.last_generate,
+            "modifier_last_tick": game.modifier_manager.last_tick,
+            "robot_id": game.robot.object_id if game.robot is not None else None,
+        },
+        "modifiers": game.modifier_manager.modifiers,
+        "transactions": (building_manager.build_transactions, building_manager.txn_by_request, building_manager._ready_txns),
+        "messages": (game.message_bus.messages, game.message_bus.pending_messages),
+        "timers": game.timer_wheel.timers,
+        "players_meta": (player_manager.remote_players, player_manager.remote_resource_deltas, game.rule_manager.fleet_spacetime),
+    }
+
+    def dump(value, owner=None):
+        buffer = io.BytesIO()
+        _RecordPickler(buffer, references, objects, owner).dump(value)
+        return buffer.getvalue()
+
+    whole_records = {name: dump(value) for name, value in whole.items()}
+    keyed_records = {name: {key: dump(value, objects[key]) for key, value in records.items()} for name, records in keyed.items()}
+    return whole_records, keyed_records
+
+
+def write_checkpoint(path, whole_records, keyed_records, seq, base=None):
+    """
+    写入存档文件。base 为上一个存档的 (整体记录, 按 ID 的记录, 序号) 时写入增量存档, 只包含变化的记录。
+    先写临时文件再改名, 写入过程中崩溃不会损坏已有的存档。
+    """
+    if base is None:
+        kind, base_seq = KIND_FULL, 0
+        body = {"whole": whole_records, "keyed": keyed_records, "removed": {}}
+    else:
+        base_whole, base_keyed, base_seq = base
+        kind = KIND_DELTA
+        body = {
+            "whole": {name: data for name, data in whole_records.items() if base_whole.get(name) != data},
+            "keyed": {},
+            "removed": {},
+        }
+        for name, records in keyed_records.items():
+            base_records = base_keyed.get(name, {})
+            body["keyed"][name] = {key: data for key, data in records.items() if base_records.get(key) != data}
+            body["removed"][name] = [key for key in base_records if key not in records]
+
+    payload = zlib.compress(pickle.dumps(body, protocol=pickle.HIGHEST_PROTOCOL), 6)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, kind, seq, base_seq))
+        f.write(payload)
+    os.replace(temp_path, path)
+    return len(payload) + HEADER.size
+
+
+def read_checkpoint(path):
+    """读取存档文件, 返回 (类型, 序号, 基准序号, 内容)"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise CheckpointError(f"存档文件不完整: {path}")
+        magic, version, kind, seq, base_seq = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise CheckpointError(f"不是存档文件: {path}")
+        if version != FORMAT_VERSION:
+            raise CheckpointError(f"不支持的存档版本 {version} (当前版本 {FORMAT_VERSION}): {path}")
+        body = pickle.loads(zlib.decompress(f.read()))
+    return kind, seq, base_seq, body
+
+
+def load_records(directory):
+    """从目录中最新的全量存档开始, 依次应用后续的增量存档, 返回 (整体记录, 按 ID 的记录, 序号)"""
+    paths = sorted(glob.glob(os.path.join(directory, "*.ckpt")))
+    fulls = [path for path in paths if path.endswith(".full.ckpt")]
+    if not fulls:
+        raise CheckpointError(f"目录中没有全量存档: {directory}")
+    start = paths.index(fulls[-1])
+
+    _, seq, _, body = read_checkpoint(paths[start])
+    whole_records = dict(body["whole"])
+    keyed_records = {name: dict(records) for name, records in body["keyed"].items()}
+    for path in paths[start + 1:]:
+        kind, delta_seq, base_seq, body = read_checkpoint(path)
+        if kind != KIND_DELTA or base_seq != seq:
+            break  # 增量存档链中断, 只恢复到这里
+        whole_records.update(body["whole"])
+        for name, records in body["keyed"].items():
+            keyed_records.setdefault(name, {}).update(records)
+        for name, keys in body["removed"].items():
+            for key in keys:
+                keyed_records.get(name, {}).pop(key, None)
+        seq = delta_seq
+    return whole_records, keyed_records, seq
+
+
+def restore(game, whole_records, keyed_records):
+    """
+    把存档记录恢复到一局新建的空游戏 (只有管理器, 没有星球和玩家) 中, 并重建所有索引。
+    """
+    references = _references(game)
+    objects = {}
+
+    def load(data):
+        return _RecordUnpickler(io.BytesIO(data), references, objects).load()
+
+    world_manager = game.world_manager
+    building_manager = game.building_manager
+    player_manager = game.player_manager
+    event_manager = game.event_manager
+
+    # 先恢复游戏对象, 其他记录对它们的引用才能解析
+    for world_id, data in keyed_records["worlds"].items():
+        world = load(data)
+        objects[world_id] = world
+        world_manager.add_world_instance(world)
+        building_manager.add_world_slots(world_id, world.building_slots)
+    for building_id, data in keyed_records["buildings"].items():
+        world_id, slot_key, slot_index, building = load(data)
+        objects[building_id] = building
+        building_manager.world_buildings[world_id].place(slot_key, slot_index, building)
+        building_manager.building_instances[building_id] = building
+        building_manager.targets.add(building_id)
+    for player_id, data in keyed_records["players"].items():
+        player, robot = load(data)
+        objects[player_id] = player
+        player_manager.add_player(player)
+        player_manager.fleet_locations.setdefault(player.fleet.location, []).append(player_id)
+        if robot is not None:
+            player_manager.robots[player_id] = robot
+    for event_id, data in keyed_records["events"].items():
+        event = load(data)
+        objects[event_id] = event
+        event_manager.active_events.add(event)
+    for obj in objects.values():
+        game.registry.add(obj)
+
+    meta = load(whole_records["meta"])
+    game.tick_counter = meta["tick_counter"]
+    game.timer_wheel.current_tick = meta["current_tick"]
+    game.timer_wheel._next_timer_id = meta["next_timer_id"]
+    game.registry.next_id = meta["next_object_id"]
+    game.message_bus._next_msg_id = meta["next_msg_id"]
+    building_manager._next_txn_id = meta["next_txn_id"]
+    event_manager.last_generate = meta["event_last_generate"]
+    game.modifier_manager.last_tick = meta["modifier_last_tick"]
+    random.setstate(meta["random_state"])
+
+    modifier_manager = game.modifier_manager
+    modifier_manager.modifiers = load(whole_records["modifiers"])
+    modifier_manager.modifiers_by_target = {}
+    for modifier in modifier_manager.modifiers:
+        modifier_manager.modifiers_by_target.setdefault(modifier.target_id, []).append(modifier)
+
+    build_transactions, txn_by_request, ready_txns = load(whole_records["transactions"])
+    building_manager.build_transactions = build_transactions
+    building_manager.txn_by_request = txn_by_request
+    building_manager._ready_txns = ready_txns
+    building_manager._txn_deadlines = [(txn.deadline, txn.txn_id) for txn in build_transactions.values()]
+    heapq.heapify(building_manager._txn_deadlines)
+    building_manager.txn_slots = {}
+    for txn in build_transactions.values():
+        if txn.slot_index is not None:
+            building_manager.txn_slots.setdefault((txn.world_id, txn.slot_type, txn.subtype), set()).add(txn.slot_index)
+
+    game.message_bus.messages, game.message_bus.pending_messages = load(whole_records["messages"])
+
+    timer_wheel = game.timer_wheel
+    timer_wheel.timers = load(whole_records["timers"])
+    timer_wheel.buckets = {}
+    for timer_id in sorted(timer_wheel.timers):
+        timer_wheel.buckets.setdefault(timer_wheel.timers[timer_id][0], []).append(timer_id)
+
+    player_manager.remote_players, player_manager.remote_resource_deltas, game.rule_manager.fleet_spacetime = load(whole_records["players_meta"])
+
+    game.robot = player_manager.get_player_by_id(meta["robot_id"])
+    game.path_finder.update_octree()
+    game.snapshots.invalidate()  # 以上直接修改了管理器中的数据, 没有登记到快照
+    return game
+
+
+def restore_game(directory, create_empty_game):
+    """从目录中的存档恢复一局游戏, create_empty_game 用于创建只有管理器的空游戏"""
+    whole_records, keyed_records, seq = load_records(directory)
+    game = create_empty_game()
+    with game.activated():
+        restore(game, whole_records, keyed_records)
+    game.log.info(f"已从存档 {seq} 恢复, tick {game.tick_counter}, 星球 {len(game.world_manager.world_instances)}, "
+                  f"建筑 {len(game.building_manager.building_instances)}, 玩家 {len(game.player_manager.players)}")
+    return game, seq
+
+
+class Checkpointer:
+    """
+    定期为游戏存档。每 interval 秒保存一次, 每 full_every 次保存一个全量存档, 其余为增量存档。
+    保存全量存档后删除更早的存档文件。
+    """
+    def __init__(self, game, directory: str, interval: float = 300, full_every: int = 10, seq: int = 0):
+        self.game = game
+        self.directory = directory
+        self.interval = interval
+        self.full_every = max(1, full_every)
+        self.seq = seq
+        self.saves_since_full = 0
+        self.last_save_time = time.time()
+        self._base = None  # 上一个存档的记录, 用于计算增量
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, seq, kind):
+        return os.path.join(self.directory, f"{seq:08d}.{'full' if kind == KIND_FULL else 'delta'}.ckpt")
+
+    def tick(self):
+        if time.time() - self.last_save_time >= self.interval:
+            self.save()
+
+    def save(self, full: bool = False) -> str:
+        start = time.time()
+        whole_records, keyed_records = capture(self.game)
+        full = full or self._base is None or self.saves_since_full + 1 >= self.full_every
+        self.seq += 1
+        kind = KIND_FULL if full else KIND_DELTA
+        path = self._path(self.seq, kind)
+        size = write_checkpoint(path, whole_records, keyed_records, self.seq, None if full else self._base)
+        if full:
+            self.saves_since_full = 0
+            self._remove_older_than(self.seq)
+        else:
+            self.saves_since_full += 1
+        self._base = (whole_records, keyed_records, self.seq)
+        self.last_save_time = time.time()
+        self.game.log.info(f"存档 {path}: {size} 字节, 耗时 {self.last_save_time - start:.3f} 秒")
+        return path
+
+    def _remove_older_than(self, seq):
+        for path in glob.glob(os.path.join(self.directory, "*.ckpt")):
+            name = os.path.basename(path)
+            if int(name.split(".")[0]) < seq:
+                os.remove(path)
@@ -2,12 +2,29 @@ from basic_types.basic_typs import Vector3
 from basic_types.resource import Resource
 from loader.locale import Locale
 from basic_types.enums import *
+from basic_types.base_object import ObjectRegistry, activate_registry, restore_registry
 from logger import Log
+from snapshot import GameSnapshot, SnapshotPublisher
 import logging
 from time import sleep
+import asyncio
+import contextlib
+import functools
+import threading
+
+def _in_registry(method):
+    """在本局游戏的对象表中执行 (会创建游戏对象的入口方法使用)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.activated():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class Game:
     def __init__(self):
+        # 本局游戏的对象表。同一进程中可能有多局游戏, 创建管理器和游戏对象、tick 时都要在 activated() 中进行
+        self.registry = ObjectRegistry()
         self.building_manager = None
         self.event_manager = None
         self.modifier_manager = None
@@ -16,17 +33,34 @@ class Game:
         self.rule_manager = None
         self.purchase_manager = None
         self.message_bus = None
+        self.timer_wheel = None
+        self.checkpointer = None  # 设置后定期存档
+        self.profiler = None  # 设置后记录各阶段耗时 (见 profiler.py)
+        self.snapshots = SnapshotPublisher(self)  # 每个 tick 结束时发布只读快照
+        self.resource_configs = None
         self.robot = None
         self.tick_counter = 0
         self.log = Log(level=logging.DEBUG, filename="log.txt")
         self.path_finder = None
-
+        self.last_dump_time = datetime.datetime.now()
+
+    @contextlib.contextmanager
+    def activated(self):
+        """with 块中以本局的对象表为当前对象表, 退出时恢复之前的对象表"""
+        token = activate_registry(self.registry)
+        try:
+            yield self
+        finally:
+            restore_registry(token)
+
+    @_in_registry
     def add_robot(self, resources, building_configs, purchase_configs):
         player = self.player_manager.create_player(resources, building_configs, purchase_configs)
         for resource in player.resources:
             player.resources[resource] = 10
         self.robot = self.player_manager.add_robot(player)
 
+    @_in_registry
     def generate_worlds(self, num_worlds: int):
         """生成指定数量的星球"""
 
@@ -91,52 +125,96 @@ class Game:
                 print(f"Warning: Could not generate world after {max_attempts} attempts.")
             
     def run(self):
-        last_time = datetime.datetime.now()
         while True:
-            self.tick_counter += 1  # 增加总tick计数
-            self.event_manager.tick() 
-            self.player_manager.tick() 
-            self.building_manager.tick() 
-            self.modifier_manager.tick() 
-            self.rule_manager.tick()
-            self.message_bus.tick()
-
-            now = datetime.datetime.now()
-            elapsed =(now - last_time).seconds
-            # 以下是为了管理员查看方便
-            if elapsed >= 15:
-                last_time = now
-                elapsed = 0
-                self.log.info("-------------------------------------------")
-                self.log.info("当前资源：")
-                for resource, amount in self.robot.resources.items():
-                    self.log.info(f"{Locale.get_text(Resource.get_resource_by_id(resource).name_id)}: {amount}")
-
-                self.log.info("已探索的星球及建筑：")
-                for planet_id in self.robot.explored_planets:
-                    planet = self.world_manager.get_world_by_id(planet_id)
-                    planet_name = Locale.get_text(planet.world_config.world_id)
-                    self.log.info(f"星球{planet_id}: {planet_name} ({planet.location})")
-                    for building_instance in self.building_manager.get_buildings_on_world(planet_id):
-                        building_name = Locale.get_text(building_instance.building_config.name_id)
-                        building_level = building_instance.building_config.level
-                        allocated_manpower = building_instance.manpower
-                        max_manpower = building_instance.building_config.manpower
-                        durability = building_instance.durability
-                        max_durability = building_instance.building_config.durability
-                        if building_instance.remaining_secs > 0:
-                            self.log.info(f"  - 建筑{building_instance.object_id}: {building_name}, 等级:{building_level}, 耐久度{durability}/{max_durability}, 人力{allocated_manpower}/{max_manpower} (建造/升级中)")
-                        else:
-                            self.log.info(f"  - 建筑{building_instance.object_id}: {building_name}, 等级:{building_level}, 耐久度{durability}/{max_durability}, 人力{allocated_manpower}/{max_manpower}")
-                self.log.info("-------------------------------------------")
-
-                # 打印管理器状态
-                self.log.info("############################################")
-                self.log.info(f"  WorldManager: 管理星球数量 = {len(self.world_manager.world_instances)}")
-                self.log.info(f"  BuildingManager: 管理建筑数量 = {len(self.building_manager.building_instances)}")
-                self.log.info(f"  PlayerManager: 管理玩家数量 = {len(self.player_manager.players)}, 管理机器人数量: {len(self.player_manager.robots)}")
-                self.log.info(f"  EventManager: 活跃事件数量 = {sum(len(events) for events in self.event_manager.active_events.values())}")
-                self.log.info(f"  ModifierManager: 活跃 Modifier 数量 = {len(self.modifier_manager.modifiers)}")
-                self.log.info(f"  MessageBus: 消息队列长度 = {len(self.message_bus.messages)}, 待处理消息数量 = {len(self.message_bus.pending_messages)}")
-                self.log.info(f"  Pathfinder: 缓存路径数量: {len(self.path_finder._path_cache)}")
-                self.log.info("############################################")    
+            self.tick()
+
+    async def run_async(self, tick_interval: float = 0):
+        """异步 tick 循环, 每个 tick 之后让出事件循环, 让网络连接等协程得以运行"""
+        while True:
+            self.tick()
+            await asyncio.sleep(tick_interval)
+
+    def tick(self):
+        # 同一进程中可能有多局游戏交替 tick, tick 期间使用本局的对象表
+        with self.activated():
+            self._tick()
+
+    def _tick(self):
+        self.tick_counter += 1  # 增加总tick计数
+        stages = (
+            ("event_manager", self.event_manager.tick),
+            ("player_manager", self.player_manager.tick),
+            ("building_manager", self.building_manager.tick),
+            ("modifier_manager", self.modifier_manager.tick),
+            ("rule_manager", self.rule_manager.tick),
+            ("timer_wheel", self.timer_wheel.advance),
+            ("message_bus", self.message_bus.tick),
+            ("snapshots", self.snapshots.tick),
+        )
+        profiler = self.profiler
+        if profiler is None:
+            for _, stage in stages:
+                stage()
+        else:
+            with profiler.measure("tick"):
+                for name, stage in stages:
+                    with profiler.measure(f"tick.{name}"):
+                        stage()
+
+        now = datetime.datetime.now()
+        elapsed =(now - self.last_dump_time).seconds
+        # 以下是为了管理员查看方便, 在后台线程中基于快照输出, 不阻塞 tick
+        if elapsed >= 15:
+            self.last_dump_time = now
+            threading.Thread(target=self.dump_status, args=(self.snapshots.latest, self.registry.stats()),
+                             name="dump-status", daemon=True).start()
+
+        if self.checkpointer is not None:
+            self.checkpointer.tick()
+
+        if profiler is not None:
+            profiler.tick()
+
+    def dump_status(self, snapshot: GameSnapshot = None, registry_stats=None):
+        """
+        输出管理员查看的状态, 只读取快照, 可以在 tick 线程之外调用。
+        名称只写入本地化标记, 由 analyzer.py 等查看日志的工具渲染为文本。
+        """
+        if snapshot is None:
+            snapshot = self.snapshots.publish()
+        robot = snapshot.get_player(snapshot.robot_id)
+        if robot is not None:
+            self.log.info("-------------------------------------------")
+            self.log.info("当前资源：")
+            for resource, amount in robot.resources.items():
+                self.log.info(f"{Locale.token(Resource.get_resource_by_id(resource).name_id)}: {amount}")
+
+            self.log.info("已探索的星球及建筑：")
+            for planet_id in robot.explored_planets:
+                planet = snapshot.get_world(planet_id)
+                if not planet:
+                    continue  # 分片模式下星球可能在其他分片
+                planet_name = Locale.token(planet.world_config_id)
+                self.log.info(f"星球{planet_id}: {planet_name} ({Vector3(*planet.location)})")
+                for building in snapshot.get_buildings_on_world(planet_id):
+                    building_name = Locale.token(building.name_id)
+                    if building.under_construction:
+                        self.log.info(f"  - 建筑{building.object_id}: {building_name}, 等级:{building.level}, 耐久度{building.durability}/{building.max_durability}, 人力{building.manpower}/{building.max_manpower} (建造/升级中)")
+                    else:
+                        self.log.info(f"  - 建筑{building.object_id}: {building_name}, 等级:{building.level}, 耐久度{building.durability}/{building.max_durability}, 人力{building.manpower}/{building.max_manpower}")
+            self.log.info("-------------------------------------------")
+
+        # 打印管理器状态
+        stats = snapshot.stats
+        self.log.info("############################################")
+        self.log.info(f"  快照: epoch {snapshot.epoch}, tick {snapshot.tick}")
+        self.log.info(f"  WorldManager: 管理星球数量 = {stats['worlds']}")
+        self.log.info(f"  BuildingManager: 管理建筑数量 = {stats['buildings']}")
+        self.log.info(f"  PlayerManager: 管理玩家数量 = {stats['players']}, 管理机器人数量: {stats['robots']}")
+        self.log.info(f"  EventManager: 活跃事件数量 = {stats['active_events']}, 各目标类型 = {stats['active_events_by_type']}")
+        self.log.info(f"  ModifierManager: 活跃 Modifier 数量 = {stats['modifiers']}")
+        self.log.info(f"  MessageBus: 消息队列长度 = {stats['delayed_messages']}, 待处理消息数量 = {stats['pending_messages']}")
+        self.log.info(f"  Pathfinder: 缓存路径数量: {stats['path_cache']}")
+        if registry_stats is not None:
+            self.log.info(f"  ObjectRegistry: 存活对象 = {registry_stats['alive']}, 累计创建 = {registry_stats['created']}, 各类型数量 = {registry_stats['count_by_type']}, 各类型内存(字节) = {registry_stats['memory_by_type']}")
+        self.log.info("############################################")
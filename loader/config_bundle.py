@@ -0,0 +1,198 @@
+"""
+配置包: 把所有 CSV 配置表加载、检查并互相关联之后, 保存为一个二进制文件。
+之后启动时只要源文件没有变化 (内容哈希相同), 直接读取配置包, 不再逐个解析 CSV;
+源文件有变化、配置包不存在或损坏时重新从 CSV 编译并覆盖配置包。
+
+文件格式: 文件头 (MAGIC, 格式版本, 源文件内容的 SHA-256) + pickle 数据。
+哈希同时包含配置类和加载代码的源文件, 修改这些代码后配置包也会重新编译, 不需要手动修改 FORMAT_VERSION。
+"""
+import hashlib
+import importlib
+import os
+import pickle
+import struct
+from common import *
+from basic_types.resource import Resource
+from loader.locale import Locale
+from loader.resource import load_resources_from_csv
+from loader.building_config import load_building_configs
+from loader.event_config import load_events_from_csv
+from loader.world_configs import load_world_configs
+from loader.purchase_config import load_purchase_configs
+
+MAGIC = b"GCFG"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sH32s")  # MAGIC, 版本, 源文件哈希
+
+DEFAULT_BUNDLE_PATH = "resources/config.bundle"
+
+# 配置源文件
+CONFIG_SOURCES = {
+    "locale": "resources/locale.csv",
+    "resources": "resources/resources.csv",
+    "buildings": "resources/buildings.csv",
+    "building_modifiers": "resources/building_modifiers.csv",
+    "event_info": "resources/event_info.csv",
+    "event_phases": "resources/event_phases.csv",
+    "event_options": "resources/event_options.csv",
+    "event_results": "resources/event_results.csv",
+    "world_info": "resources/world_info.csv",
+    "world_init_structures": "resources/world_init_structures.csv",
+    "world_explored_rewards": "resources/world_explored_rewards.csv",
+    "purchase": "resources/purchase.csv",
+}
+
+# 配置包中保存的对象的类, 以及生成这些对象的加载代码所在的模块
+SCHEMA_MODULES = (
+    "basic_types.enums",
+    "basic_types.modifier",
+    "basic_types.resource",
+    "basic_types.building_config",
+    "basic_types.world_config",
+    "loader.locale",
+    "loader.resource",
+    "loader.building_config",
+    "loader.event_config",
+    "loader.world_configs",
+    "loader.purchase_config",
+    "loader.config_bundle",
+)
+
+
+class ConfigBundle:
+    def __init__(self, locale_texts, resource_configs, building_configs, event_configs, world_configs, purchase_configs):
+        self.locale_texts: Dict[str, Dict[str, str]] = locale_texts
+        self.resource_configs = resource_configs
+        self.building_configs = building_configs
+        self.event_configs = event_configs
+        self.world_configs = world_configs
+        self.purchase_configs = purchase_configs
+        self.problems: List[str] = []  # 编译时 validate 发现的问题
+
+    def install(self):
+        """登记到全局的资源表和本地化文本 (从配置包读取时这些全局状态还是空的)"""
+        for resource in self.resource_configs.values():
+            Resource.new_resource(resource)
+        Locale.add_texts(self.locale_texts)
+
+
+def source_digest(sources: Dict[str, str], modules: Tuple[str, ...] = SCHEMA_MODULES) -> bytes:
+    """所有源文件和 modules 代码的哈希, 不存在的文件也计入 (之后出现时哈希会变化)"""
+    digest = hashlib.sha256()
+    files = [(name, sources[name]) for name in sorted(sources)]
+    files += [(f"module:{module}", importlib.import_module(module).__file__) for module in modules]
+    for name, path in files:
+        digest.update(name.encode("utf-8") + b"\0")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        except FileNotFoundError:
+            digest.update(b"\xff" * 8)
+    return digest.digest()
+
+
+def compile_configs(sources: Dict[str, str]) -> ConfigBundle:
+    """从 CSV 加载所有配置"""
+    Locale.load_from_csv(sources["locale"])
+    resource_configs = load_resources_from_csv(sources["resources"])
+    building_configs = load_building_configs(
+        buildings_file=sources["buildings"],
+        building_modifiers_file=sources["building_modifiers"],
+    )
+    event_configs = load_events_from_csv(
+        event_info=sources["event_info"],
+        event_phases=sources["event_phases"],
+        event_options=sources["event_options"],
+        event_results=sources["event_results"],
+    )
+    world_configs = load_world_configs(
+        world_info_file=sources["world_info"],
+        world_init_structures_file=sources["world_init_structures"],
+        world_explored_rewards_file=sources["world_explored_rewards"],
+    )
+    purchase_configs = load_purchase_configs(sources["purchase"])
+    return ConfigBundle(dict(Locale.texts), resource_configs, building_configs, event_configs, world_configs, purchase_configs)
+
+
+def validate(bundle: ConfigBundle) -> List[str]:
+    """检查配置表之间的引用, 返回发现的问题"""
+    problems = []
+    resources = bundle.resource_configs
+    for config_id, config in bundle.building_configs.items():
+        for modifier_config in config.modifier_configs:
+            if modifier_config.data_type not in resources:
+                problems.append(f"建筑 {config_id} 的修正引用了未知资源 {modifier_config.data_type}")
+    for event_config in bundle.event_configs:
+        phases = event_config.phases
+        if event_config.initial_phase not in phases:
+            problems.append(f"事件 {event_config.event_id} 的初始阶段 {event_config.initial_phase} 不存在")
+        for phase in phases.values():
+            for next_phase in (phase.next_phase_success, phase.next_phase_failure):
+                if next_phase and next_phase not in phases:
+                    problems.append(f"事件 {event_config.event_id} 阶段 {phase.phase_id} 的下一阶段 {next_phase} 不存在")
+            for option in phase.options.values():
+                for result_id in (option.success_result_id, option.fail_result_id):
+                    if result_id and result_id not in event_config.results:
+                        problems.append(f"事件 {event_config.event_id} 选项 {option.option_id} 的结果 {result_id} 不存在")
+    for world_id, world_config in bundle.world_configs.items():
+        for structure in world_config.init_structures:
+            if structure["init_structure"] not in bundle.building_configs:
+                problems.append(f"星球 {world_id} 的初始建筑 {structure['init_structure']} 不存在")
+        for reward in world_config.explored_rewards:
+            if reward["resource"] not in resources:
+                problems.append(f"星球 {world_id} 的探索奖励引用了未知资源 {reward['resource']}")
+    for package_name, purchase_config in bundle.purchase_configs.items():
+        for item_id in purchase_config.content:
+            if item_id not in resources:
+                problems.append(f"购买项 {package_name} 引用了未知资源 {item_id}")
+    return problems
+
+
+def write_bundle(path: str, bundle: ConfigBundle, digest: bytes):
+    """先写临时文件再改名, 多个进程同时编译时也不会读到写了一半的配置包"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, digest))
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def read_bundle(path: str, digest: bytes) -> Optional[ConfigBundle]:
+    """读取配置包, 文件不存在、格式不对或源文件已经变化时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, version, bundle_digest = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION or bundle_digest != digest:
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading config bundle: {e}")
+        return None
+
+
+def load_configs(sources: Dict[str, str] = CONFIG_SOURCES, bundle_path: Optional[str] = DEFAULT_BUNDLE_PATH) -> ConfigBundle:
+    """
+    加载所有配置: 优先读取配置包, 源文件变化时从 CSV 重新编译并写入配置包。
+    bundle_path 为 None 时总是从 CSV 加载。
+    """
+    digest = source_digest(sources)
+    bundle = read_bundle(bundle_path, digest) if bundle_path else None
+    if bundle is None:
+        bundle = compile_configs(sources)
+        bundle.problems = validate(bundle)
+        if bundle.problems:
+            print(f"Warning: 配置检查发现 {len(bundle.problems)} 个问题, 例如: {bundle.problems[0]}")
+        if bundle_path:
+            try:
+                write_bundle(bundle_path, bundle, digest)
+            except OSError as e:
+                print(f"Error writing config bundle: {e}")
+    bundle.install()
+    return bundle
@@ -1,5 +1,11 @@
 from common import *
 from basic_types.enums import *
+import operator
+
+# 挑战可以检查的目标属性: {(目标类型, resource_type): 取值函数}, 没有登记的属性挑战总是失败
+CHALLENGE_ACCESSORS: Dict[Tuple[ObjectType, str], Callable[[Any], Any]] = {
+    (ObjectType.PLAYER, "morale"): lambda player: player.fleet.morale,
+}
 
 class EventPhase:
     def __init__(self, phase_id, previous_phase, next_phase_success, next_phase_failure, text_id, duration):
@@ -17,6 +23,48 @@ class EventOption:
         self.success_result_id = success_result_id
         self.fail_result_id = fail_result_id
         self.challenges = []  # 存储多个EventChallenge实例
+        # 以下由 compile 生成, 不参与序列化
+        self.target_type: Optional[ObjectType] = None
+        self.predicates: List[Tuple[Optional[Callable], Tuple[Callable, ...], float]] = []  # [(取值函数, 比较函数, 比较值)]
+        self.checks: List[Callable[[Any], bool]] = []  # 每个挑战的判定函数
+        self.check: Callable[[Any], bool] = lambda target: True
+
+    def compile(self, target_type: ObjectType):
+        """把挑战条件编译成判定函数, 取值函数和比较运算在这里确定, 评估时不再解析配置"""
+        self.target_type = target_type
+        self.predicates = [challenge.compile(target_type) for challenge in self.challenges]
+        self.checks = checks = [_predicate_check(*predicate) for predicate in self.predicates]
+        if not checks:
+            self.check = lambda target: True
+        elif len(checks) == 1:
+            self.check = checks[0]
+        else:
+            self.check = lambda target: all(check(target) for check in checks)
+
+    def check_many(self, targets: List[Any]) -> List[bool]:
+        """
+        批量判定多个目标 (None 视为失败)。
+        按挑战逐个处理, 每个挑战只判定前面的挑战都通过了的目标。
+        """
+        results = [target is not None for target in targets]
+        for check in self.checks:
+            for index, target in enumerate(targets):
+                if results[index]:
+                    results[index] = check(target)
+        return results
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["predicates"], state["checks"], state["check"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.predicates = []
+        self.checks = []
+        self.check = lambda target: True
+        if self.target_type is not None:
+            self.compile(self.target_type)
 
 class EventChallenge:
     def __init__(self, challenge_id, resource_type, value, below, equal, greater):
@@ -27,6 +75,33 @@ class EventChallenge:
         self.equal = equal.lower() == 'true'
         self.greater = greater.lower() == 'true'
 
+    def compile(self, target_type: ObjectType) -> Tuple[Optional[Callable], Tuple[Callable, ...], float]:
+        """返回 (取值函数, 需要同时满足的比较函数, 比较值), 目标类型没有该属性时取值函数为 None"""
+        comparisons = []
+        if self.below:
+            comparisons.append(operator.lt)
+        if self.equal:
+            comparisons.append(operator.eq)
+        if self.greater:
+            comparisons.append(operator.gt)
+        return CHALLENGE_ACCESSORS.get((target_type, self.resource_type)), tuple(comparisons), self.value
+
+
+def _predicate_check(accessor, comparisons, value) -> Callable[[Any], bool]:
+    """由编译后的挑战生成判定单个目标的闭包"""
+    if accessor is None:
+        return lambda target: False
+    if len(comparisons) == 1:
+        compare = comparisons[0]
+        def check(target):
+            attribute = accessor(target)
+            return attribute is not None and compare(attribute, value)
+        return check
+    def check(target):
+        attribute = accessor(target)
+        return attribute is not None and all(compare(attribute, value) for compare in comparisons)
+    return check
+
 class EventResult:
     def __init__(self, result_id, resource_type_id, modifier, quantity, duration):
         self.result_id = result_id
@@ -58,6 +133,12 @@ class EventConfig:
             self.results[result.result_id] = []
         self.results[result.result_id].append(result)
 
+    def compile(self):
+        """编译所有选项的挑战条件, 在配置加载完成后调用"""
+        for phase in self.phases.values():
+            for option in phase.options.values():
+                option.compile(self.target)
+
 def load_events_from_csv(**kwargs):
     event_info_file = kwargs.get('event_info')
     event_phases_file = kwargs.get('event_phases')
@@ -99,6 +180,13 @@ def load_events_from_csv(**kwargs):
                 if event_id in events:
                     events[event_id].add_phase(phase)
 
+    # 阶段 ID 到所属事件的索引, 选项和挑战按 ID 直接找到所属的事件和选项
+    events_by_phase: Dict[str, List[EventConfig]] = {}
+    for event in events.values():
+        for phase_id in event.phases:
+            events_by_phase.setdefault(phase_id, []).append(event)
+    options_by_id: Dict[str, List[EventOption]] = {}
+
     # 加载选项信息
     if event_options_file:
         with open(event_options_file, 'r', encoding='utf-8') as file:
@@ -110,9 +198,9 @@ def load_events_from_csv(**kwargs):
                     row['success_result_id'],
                     row['fail_result_id']
                 )
-                for event in events.values():
-                    if phase_id in event.phases:
-                        event.add_option(phase_id, option)
+                options_by_id.setdefault(option.option_id, []).append(option)
+                for event in events_by_phase.get(phase_id, ()):
+                    event.add_option(phase_id, option)
     # 加载挑战条件 (修正部分)
     if event_challenges_file:
         with open(event_challenges_file, 'r', encoding='utf-8') as file:
@@ -128,10 +216,8 @@ def load_events_from_csv(**kwargs):
                     row['greater']
                 )
                 # 找到对应的 EventOption 并添加挑战
-                for event in events.values():
-                    for phase in event.phases.values():
-                        if option_id in phase.options:
-                            phase.options[option_id].challenges.append(challenge)
+                for option in options_by_id.get(option_id, ()):
+                    option.challenges.append(challenge)
 
 
     # 加载结果信息
@@ -148,4 +234,6 @@ def load_events_from_csv(**kwargs):
                 for event in events.values():
                     event.add_result(result)
 
+    for event in events.values():
+        event.compile()
     return list(events.values())
\ No newline at end of file
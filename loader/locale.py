@@ -1,18 +1,63 @@
 from common import *
+import re
 
 class Locale:
+    """
+    本地化文本。texts 保存所有语言的原始文本, set_language 时把当前语言展开为一张平铺的表,
+    get_text 只需一次字典查找。
+    日志等 tick 中的输出可以只写入文本标记 (token), 在 render 时 (例如 analyzer.py 分析日志时) 再替换为当前语言的文本。
+    """
     language: str = "en"
     texts: Dict[str, Dict[str, str]] = {}
+    table: Dict[str, str] = {}  # 当前语言的 {text_id: 文本}
+
+    TOKEN_PATTERN = re.compile(r"@\{([^{}|]+)((?:\|[^{}|]*)*)\}")
+    PLACEHOLDER_PATTERN = re.compile(r"\{[^{}]*\}")
 
     @classmethod
     def set_language(cls, language: str) -> None:
         cls.language = language
+        cls._build_table()
+
+    @classmethod
+    def _build_table(cls) -> None:
+        language = cls.language
+        cls.table = {text_id: translations[language] for text_id, translations in cls.texts.items() if language in translations}
+
+    @classmethod
+    def add_texts(cls, texts: Dict[str, Dict[str, str]]) -> None:
+        """添加 (或覆盖) 文本, 并重新展开当前语言的表"""
+        cls.texts.update(texts)
+        cls._build_table()
 
     @classmethod
     def get_text(cls, text_id: str) -> str:
-        if text_id in cls.texts and cls.language in cls.texts[text_id]:
-            return cls.texts[text_id][cls.language]
-        return text_id
+        return cls.table.get(text_id, text_id)
+
+    @classmethod
+    def token(cls, text_id: str, *args) -> str:
+        """
+        延迟本地化的文本标记 "@{text_id}" 或 "@{text_id|参数1|参数2}", 写入日志时不做任何查找。
+        参数依次填入文本中的 {...} 占位符, 参数中不能包含 "|"、"{" 和 "}"。
+        """
+        if not args:
+            return f"@{{{text_id}}}"
+        return f"@{{{text_id}|{'|'.join(str(arg) for arg in args)}}}"
+
+    @classmethod
+    def render(cls, text: str) -> str:
+        """把文本中的所有标记替换为当前语言的文本"""
+        if "@{" not in text:
+            return text
+        return cls.TOKEN_PATTERN.sub(cls._render_token, text)
+
+    @classmethod
+    def _render_token(cls, match) -> str:
+        text = cls.get_text(match.group(1))
+        if not match.group(2):
+            return text
+        args = iter(match.group(2)[1:].split("|"))
+        return cls.PLACEHOLDER_PATTERN.sub(lambda placeholder: next(args, placeholder.group(0)), text)
 
     @classmethod
     def load_from_csv(cls, file_path: str) -> None:
@@ -20,10 +65,12 @@ class Locale:
             with open(file_path, "r", encoding="utf-8") as f:
                 reader = csv.reader(f)
                 header = next(reader)
+                texts = {}
                 for row in reader:
                     text_id, *translations = row
-                    cls.texts[text_id] = dict(zip(header[1:], translations))
+                    texts[text_id] = dict(zip(header[1:], translations))
+            cls.add_texts(texts)
         except FileNotFoundError:
             print(f"Error: File not found: {file_path}")
         except Exception as e:
-            print(f"Error loading CSV file: {e}")
\ No newline at end of file
+            print(f"Error loading CSV file: {e}")
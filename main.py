@@ -1,8 +1,4 @@
-from loader.world_configs import load_world_configs
-from loader.resource import load_resources_from_csv
-from loader.building_config import load_building_configs
-from loader.event_config import load_events_from_csv
-from loader.purchase_config import load_purchase_configs
+from loader.config_bundle import load_configs
 from loader.locale import Locale
 from managers.building_manager import BuildingManager
 from managers.event_manager import EventManager
@@ -12,48 +8,41 @@ from managers.world_manager import WorldManager
 from managers.player_manager import PlayerManager
 from managers.rule_manager import RulesManager
 from managers.message_bus import MessageBus
+from managers.timer_wheel import TimerWheel
 from path_finder import Pathfinder
 from game import Game
+import argparse
+import asyncio
+import random
 
 
-def main():
-    Locale.load_from_csv('resources/locale.csv')
+def create_empty_game() -> Game:
+    """加载配置并创建管理器, 不生成星球和玩家 (从存档恢复时使用)"""
+    configs = load_configs()
     Locale.set_language("cn")
-
-    resource_configs = load_resources_from_csv('resources/resources.csv')
-
-    building_configs = load_building_configs(
-        buildings_file='resources/buildings.csv', 
-        building_modifiers_file='resources/building_modifiers.csv'
-        )
-    
-    event_configs = load_events_from_csv(
-        event_info='resources/event_info.csv',
-        event_phases='resources/event_phases.csv',
-        event_options='resources/event_options.csv',
-        event_results='resources/event_results.csv'
-    )
-    world_configs = load_world_configs(
-        world_info_file='resources/world_info.csv',
-        world_init_structures_file='resources/world_init_structures.csv',
-        world_explored_rewards_file='resources/world_explored_rewards.csv'
-    )
-    purchase_configs = load_purchase_configs('resources/purchase.csv')
+    resource_configs = configs.resource_configs
+    building_configs = configs.building_configs
+    event_configs = configs.event_configs
+    world_configs = configs.world_configs
+    purchase_configs = configs.purchase_configs
 
     game = Game()
 
-    # message_bus优先初始化
-    message_bus = MessageBus(game)
-    game.message_bus = message_bus
+    # 管理器也是游戏对象, 登记在本局的对象表中
+    with game.activated():
+        # message_bus优先初始化
+        message_bus = MessageBus(game)
+        game.message_bus = message_bus
+        game.timer_wheel = TimerWheel(game)
 
-    world_manager = WorldManager(world_configs, game)
-    event_manager = EventManager(event_configs, game)
-    building_manager = BuildingManager(building_configs, game)
-    purchase_manager = PurchaseManager(purchase_configs, game)
-    player_manager = PlayerManager(game)
-    modifier_manager = ModifierManager(game)
-    rule_manager = RulesManager(game)
-    path_finder = Pathfinder(game)
+        world_manager = WorldManager(world_configs, game)
+        event_manager = EventManager(event_configs, game)
+        building_manager = BuildingManager(building_configs, game)
+        purchase_manager = PurchaseManager(purchase_configs, game)
+        player_manager = PlayerManager(game)
+        modifier_manager = ModifierManager(game)
+        rule_manager = RulesManager(game)
+        path_finder = Pathfinder(game)
 
     game.building_manager = building_manager
     game.event_manager = event_manager
@@ -63,11 +52,67 @@ def main():
     game.rule_manager = rule_manager
     game.purchase_manager = purchase_manager
     game.path_finder = path_finder
-    
+    game.resource_configs = resource_configs
+    return game
+
+
+def create_game(robots: int = 1) -> Game:
+    """加载配置并创建一局游戏"""
+    game = create_empty_game()
     game.generate_worlds(100)
     game.path_finder.update_octree()  # 生成星球后更新八叉树
-    game.add_robot(resource_configs, building_configs, purchase_configs)
+    for _ in range(robots):
+        game.add_robot(game.resource_configs, game.building_manager.building_configs, game.purchase_manager.purchase_configs)
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true", help="以异步模式运行, 并启动本地 TCP 服务供客户端连接")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick-interval", type=float, default=0, help="异步模式下每个 tick 之间的间隔 (秒)")
+    parser.add_argument("--robots", type=int, default=1, help="机器人数量")
+    parser.add_argument("--shards", type=int, default=0, help="按星域分片, 用多个进程运行模拟")
+    parser.add_argument("--robot-workers", type=int, default=1,
+                        help="机器人思考使用的线程数 (受 GIL 限制不能利用多核, 多核请用 --shards; 分片模式下不使用)")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子 (分片模式下所有分片共用)")
+    parser.add_argument("--checkpoint-dir", default=None, help="存档目录, 设置后定期存档")
+    parser.add_argument("--checkpoint-interval", type=float, default=300, help="存档间隔 (秒)")
+    parser.add_argument("--restore", action="store_true", help="从存档目录中最新的存档恢复")
+    parser.add_argument("--profile", action="store_true", help="记录各管理器、消息回调和寻路的耗时, 定期输出到日志")
+    parser.add_argument("--profile-interval", type=int, default=600, help="性能报告间隔 (tick)")
+    parser.add_argument("--profile-export", default=None, help="每次性能报告追加一行 JSON 到该文件")
+    args = parser.parse_args()
+
+    if args.shards > 0:
+        from shard import ShardCoordinator
+        ShardCoordinator(args.shards, create_game, robots=args.robots, seed=args.seed).run()
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    seq = 0
+    if args.restore:
+        if not args.checkpoint_dir:
+            parser.error("--restore 需要指定 --checkpoint-dir")
+        from checkpoint import restore_game
+        game, seq = restore_game(args.checkpoint_dir, create_empty_game)
+    else:
+        game = create_game(args.robots)
+    game.player_manager.set_robot_workers(args.robot_workers)
+    if args.checkpoint_dir:
+        from checkpoint import Checkpointer
+        game.checkpointer = Checkpointer(game, args.checkpoint_dir, interval=args.checkpoint_interval, seq=seq)
+    if args.profile:
+        from profiler import TickProfiler
+        game.profiler = TickProfiler(game, report_interval=args.profile_interval, export_path=args.profile_export)
 
-    game.run()
+    if args.serve:
+        from server import GameServer
+        asyncio.run(GameServer(game, args.host, args.port).serve(args.tick_interval))
+    else:
+        game.run()
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import asyncio
+from common import *
+from basic_types.enums import ObjectType
+from .message_bus import Message, MessageBus, MessageType
+
+class AsyncConsumer:
+    """
+    一个异步消费者 (例如一个客户端连接) 的有界消息队列。
+    队列满时丢弃最旧的消息, 保证慢消费者不会阻塞游戏循环。
+    """
+    def __init__(self, topics: Set[MessageType], player_id: Optional[str] = None, maxsize: int = 256):
+        self.topics = topics
+        self.player_id = player_id  # 不为 None 时只接收与该玩家相关的消息
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0  # 因队列已满被丢弃的消息数
+
+    def accepts(self, msg: Message) -> bool:
+        if self.player_id is None:
+            return True
+        data = msg.data
+        player_id = getattr(data, "player_id", None)
+        if player_id is None and getattr(data, "target_type", None) == ObjectType.PLAYER:
+            player_id = data.target_id
+        return player_id == self.player_id
+
+    def offer(self, item):
+        """非阻塞入队, 满了就丢弃最旧的一条"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        return await self.queue.get()
+
+class AsyncBridge:
+    """
+    把 MessageBus 上的消息分发给异步消费者。
+    游戏循环中同步地把消息放进各消费者的有界队列, 消费者在自己的协程里慢慢处理。
+    """
+    # 默认对外发送的消息类型
+    OUTBOUND_TOPICS = (
+        MessageType.EVENT_BEGIN,
+        MessageType.EVENT_NEED_OPTION,
+        MessageType.EVENT_PHASE_CHANGE,
+        MessageType.EVENT_END,
+        MessageType.PLAYER_FLEET_ARRIVE,
+        MessageType.BUILDING_COMPLETED,
+        MessageType.BUILDING_INSUFFICIENT_RESOURCES,
+        MessageType.BUILDING_FAILED,
+        MessageType.PURCHASE_SUCCESS,
+    )
+
+    def __init__(self, message_bus: MessageBus, topics=OUTBOUND_TOPICS):
+        self.message_bus = message_bus
+        self.consumers: Dict[MessageType, List[AsyncConsumer]] = {topic: [] for topic in topics}
+        self.tasks: Set[asyncio.Task] = set()
+        for topic in topics:
+            message_bus.subscribe(topic, self._fan_out)
+
+    def _fan_out(self, msg: Message):
+        consumers = self.consumers.get(msg.type)
+        if not consumers:
+            return
+        item = None
+        for consumer in consumers:
+            if consumer.accepts(msg):
+                if item is None:
+                    # 消息信封会被复用, 入队的是转换后的字典
+                    item = {"type": msg.type.name, "data": msg.data.to_dict()}
+                consumer.offer(item)
+
+    def add_consumer(self, topics=None, player_id: Optional[str] = None, maxsize: int = 256) -> AsyncConsumer:
+        """添加消费者, topics 为 None 时接收所有对外发送的消息类型"""
+        topics = set(topics) if topics is not None else set(self.consumers)
+        unknown = topics - set(self.consumers)
+        if unknown:
+            raise ValueError(f"未对外发送的消息类型: {[topic.name for topic in unknown]}")
+        consumer = AsyncConsumer(topics, player_id, maxsize)
+        for topic in topics:
+            self.consumers[topic].append(consumer)
+        return consumer
+
+    def remove_consumer(self, consumer: AsyncConsumer):
+        for topic in consumer.topics:
+            if consumer in self.consumers[topic]:
+                self.consumers[topic].remove(consumer)
+
+    def subscribe_async(self, topic: MessageType, coroutine: Callable[[Dict], Any], maxsize: int = 256) -> AsyncConsumer:
+        """订阅协程回调: 在一个后台任务中依次 await coroutine(item), 需要在事件循环中调用"""
+        consumer = self.add_consumer([topic], maxsize=maxsize)
+
+        async def consume():
+            while True:
+                item = await consumer.get()
+                await coroutine(item)
+
+        task = asyncio.get_running_loop().create_task(consume())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return consumer
@@ -1,40 +1,51 @@
 from basic_types.base_object import BaseObject
-from basic_types.modifier import ModifierConfig
 from common import *
 from loader.building_config import BuildingConfig
 from basic_types.enums import *
-from basic_types.building import BuildingInstance
+from basic_types.building import BuildingInstance, BuildTransaction
+from basic_types.modifier import ModifierConfig
+from basic_types.slot_table import SlotTable
+from basic_types.target_index import TargetIndex
 from .message_bus import Message, MessageType
+from .messages import (
+    BuildingAttributeChanged, BuildingCompleted, BuildingDestroyed, BuildingFailed, BuildingInsufficientResources, BuildingStart,
+    ModifierApplyRequest, ModifierRemoveRequest, sum_quantity,
+)
+import heapq
 
 class BuildingManager(BaseObject):
-    _instance = None
-
-    def __new__(cls, building_configs: Dict[str, BuildingConfig], game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.building_configs = building_configs
-            cls._instance.building_instances: Dict[str, BuildingInstance] = {} # type: ignore
-            cls._instance.game = game
-            cls._instance.game.building_manager = cls._instance
-            cls._instance.world_buildings = {}
-            cls._instance.PENDING_TIMEOUT = 60  # 超时时间 (秒)
-
-            # 管理玩家尝试进行的建筑（发送了扣资源消息等待回应）
-            cls._instance.pending_modifier_msg = {}  # {msg_id: key}
-            cls._instance.pending_buildings = {}  # {key: [(msg_id, timestamp), ...]}
-
-            # 订阅消息
-            cls._instance.game.message_bus.subscribe(MessageType.BUILDING_REQUEST, cls._instance.handle_building_request)
-            cls._instance.game.message_bus.subscribe(MessageType.BUILDING_UPGRADE_REQUEST, cls._instance.handle_upgrade_request)
-            cls._instance.game.message_bus.subscribe(MessageType.BUILDING_ATTRIBUTE_CHANGED, cls._instance.handle_building_attribute_changed)
-            cls._instance.game.message_bus.subscribe(MessageType.MODIFIER_RESPONSE, cls._instance.handle_modifier_response)
-
-        return cls._instance
+
+    def __init__(self, building_configs: Dict[str, BuildingConfig], game):
+        super().__init__()
+        self.building_configs = building_configs
+        self.building_instances: Dict[str, BuildingInstance] = {} # type: ignore
+        self.game = game
+        self.game.building_manager = self
+        self.world_buildings: Dict[str, SlotTable] = {} # type: ignore
+        self.targets = TargetIndex()  # 所有建筑的 ID, 用于随机选取事件目标
+        self.PENDING_TIMEOUT = 60  # 超时时间 (秒)
+
+        # 管理玩家尝试进行的建筑（发送了扣资源消息等待回应）
+        self._next_txn_id = 0
+        self.build_transactions: Dict[int, BuildTransaction] = {}  # {txn_id: 事务} # type: ignore
+        self.txn_by_request: Dict[int, int] = {}  # {modifier 请求的 msg_id: txn_id} # type: ignore
+        self._txn_deadlines = []  # 超时堆 [(deadline, txn_id), ...], 已结束的事务惰性删除
+        self._ready_txns: List[int] = []  # 所有请求都已成功, 等待在 tick 中执行的事务 # type: ignore
+        self.txn_slots: Dict[Tuple, Set[int]] = {}  # 未结束的建造事务占用的槽位 {(world_id, slot_type, subtype): {slot_index, ...}} # type: ignore
+
+        # 订阅消息
+        self.game.message_bus.subscribe(MessageType.BUILDING_REQUEST, self.handle_building_request)
+        self.game.message_bus.subscribe(MessageType.BUILDING_UPGRADE_REQUEST, self.handle_upgrade_request)
+        self.game.message_bus.subscribe_coalesced(MessageType.BUILDING_ATTRIBUTE_CHANGED, self.handle_building_attribute_changed,
+                                                           key=lambda data: (data.building_id, data.attribute), merge=sum_quantity)
+        self.game.message_bus.subscribe(MessageType.MODIFIER_RESPONSE, self.handle_modifier_response)
+        self.game.message_bus.subscribe(MessageType.BUILDING_BATCH_REQUEST, self.handle_building_batch_request)
+        self.game.message_bus.subscribe(MessageType.BUILDING_ATTRIBUTE_BATCH_CHANGED, self.handle_building_attribute_batch_changed)
+        self.game.message_bus.subscribe(MessageType.BUILDING_COMPLETED, self.handle_building_completed)
+
 
     def pick(self):
-        if self.building_instances:
-            return random.choice(list(self.building_instances.keys()))
-        return None
+        return self.targets.pick()
 
     def get_building_by_id(self, building_id: str) -> Optional[BuildingInstance]:
         """根据 ID 获取建筑实例"""
@@ -42,15 +53,8 @@ class BuildingManager(BaseObject):
 
     def add_world_slots(self, world_id: str, building_slots: Dict):
         """添加星球的初始建筑槽位信息"""
-        self.world_buildings[world_id] = {}
-        for slot_type, slots in building_slots.items():
-            if slot_type == BuildingType.RESOURCE:
-                self.world_buildings[world_id][slot_type] = {}
-                for subtype, count in slots.items():
-                    self.world_buildings[world_id][slot_type][subtype] = [None] * count
-            else:
-                # GENERAL, DEFENSE 类型没有二级分类
-                self.world_buildings[world_id][slot_type] = [None] * slots
+        self.world_buildings[world_id] = SlotTable(building_slots)
+        self.game.snapshots.mark_world(world_id)
 
     def add_world_buildings(self, world_id: str, building_configs: List[str]):
         """添加星球的初始建筑"""
@@ -87,25 +91,11 @@ class BuildingManager(BaseObject):
 
 
     def get_buildings_on_world(self, world_id: str) -> List[BuildingInstance]:
-        """获取星球上的所有建筑实例"""
-        buildings = []
-        if world_id in self.world_buildings:
-            for slot_type, slots in self.world_buildings[world_id].items():
-                if slot_type == BuildingType.RESOURCE:
-                    # 对于 resource 类型，需要遍历二级字典
-                    for subtype, sub_slots in slots.items():
-                        for building_id in sub_slots:
-                            if building_id:
-                                building = self.get_building_by_id(building_id)
-                                if building:
-                                    buildings.append(building)
-                else:
-                    # 对于 general 和 defense 类型，直接遍历
-                    for building_id in slots:
-                        building = self.get_building_by_id(building_id)
-                        if building:
-                            buildings.append(building)
-        return buildings
+        """获取星球上的所有建筑实例 (返回缓存的列表, 不要修改)"""
+        slot_table = self.world_buildings.get(world_id)
+        if slot_table is None:
+            return []
+        return slot_table.get_buildings()
 
     def get_next_level_configs(self, building_config):
         next_level_building_configs = []
@@ -129,54 +119,63 @@ class BuildingManager(BaseObject):
             if config.config_id == config_id:
                 return config
 
-    def _add_building_instance(self, building_instance: BuildingInstance, world_id: str, slot_type: str, slot_index: int, subtype: Optional[str] = None):
-        """添加建筑实例（内部方法）"""
-        self.building_instances[building_instance.object_id] = building_instance
-
-        # 更新 world_buildings
-        if slot_type == BuildingType.RESOURCE:
-            self.world_buildings[world_id][slot_type][subtype][slot_index] = building_instance.object_id
-        else:
-            self.world_buildings[world_id][slot_type][slot_index] = building_instance.object_id
+    def _add_building_instance(self, building_instance: BuildingInstance, world_id: str, slot_type: str, slot_index: int, subtype: Optional[str] = None) -> bool:
+        """添加建筑实例（内部方法）, 指定槽位已被占用时改用同类型的其他空闲槽位"""
+        slot_table = self.world_buildings.get(world_id)
+        if slot_table is None:
+            self.game.log.warn(f"星球 {world_id} 没有建筑槽位 (可能已被移除)，无法放置建筑 {building_instance.building_config.config_id}。")
+            return False
+        key = (slot_type, subtype if slot_type == BuildingType.RESOURCE else None)
+        if not slot_table.place(key, slot_index, building_instance):
+            slot_index = slot_table.find_free(key)
+            if slot_index is None or not slot_table.place(key, slot_index, building_instance):
+                self.game.log.warn(f"星球 {world_id} 上没有 {slot_type} (subtype: {subtype}) 的可用槽位，无法放置建筑 {building_instance.building_config.config_id}。")
+                return False
 
+        self.building_instances[building_instance.object_id] = building_instance
+        self.targets.add(building_instance.object_id)
+        self.game.snapshots.mark_building(building_instance.object_id, world_id)
+        return True
+
+    def remove_world_buildings(self, world_id: str):
+        """移除星球上的所有建筑和槽位"""
+        slot_table = self.world_buildings.get(world_id)
+        if slot_table is None:
+            return
+        for building_instance in list(slot_table.get_buildings()):
+            self._remove_building_instance(building_instance, world_id)
+        del self.world_buildings[world_id]
+        self.game.snapshots.mark_world(world_id)
 
     def _remove_building_instance(self, building_instance, world_id):
         """移除建筑实例及关联"""
         if building_instance.object_id in self.building_instances:
             del self.building_instances[building_instance.object_id]
+        self.targets.remove(building_instance.object_id)
+        self.game.snapshots.mark_building(building_instance.object_id, world_id)
+
+        self.game.timer_wheel.cancel(building_instance.timer_id)
+        building_instance.timer_id = None
+        self.game.registry.remove(building_instance.object_id)
 
         # 从 world_buildings 中移除
         if world_id in self.world_buildings:
-            for slot_type, slots in self.world_buildings[world_id].items():
-                if slot_type == BuildingType.RESOURCE:
-                    for subtype, sub_slots in slots.items():
-                        try:
-                            sub_slots[sub_slots.index(building_instance.object_id)] = None
-                        except ValueError:  # 使用 ValueError 捕获
-                            pass  # 如果不在列表中，忽略
-                else:
-                    try:
-                        index = self.world_buildings[world_id][slot_type].index(building_instance.object_id)
-                        if index is not None: # 这里index可能是0
-                            self.world_buildings[world_id][slot_type][index] = None
-                    except ValueError: # 使用 ValueError 捕获
-                        pass
-
+            self.world_buildings[world_id].remove(building_instance.object_id)
 
         # 发送移除 Modifier 的请求
-        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, {
-            "target_id": building_instance.object_id,
-            "owner_type": ObjectType.BUILDING,
-            "owner_id": building_instance.object_id,
-            "modifier_type": ModifierType.PRODUCTION  # 只移除 PRODUCTION 和 CONSUME
-        }, self)
+        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, ModifierRemoveRequest(
+            target_id=building_instance.object_id,
+            owner_type=ObjectType.BUILDING,
+            owner_id=building_instance.object_id,
+            modifier_type=ModifierType.PRODUCTION  # 只移除 PRODUCTION 和 CONSUME
+        ), self)
 
-        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, {
-            "target_id": building_instance.object_id,
-            "owner_type": ObjectType.BUILDING,
-            "owner_id": building_instance.object_id,
-            "modifier_type": ModifierType.CONSUME  # 只移除 PRODUCTION 和 CONSUME
-        }, self)
+        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, ModifierRemoveRequest(
+            target_id=building_instance.object_id,
+            owner_type=ObjectType.BUILDING,
+            owner_id=building_instance.object_id,
+            modifier_type=ModifierType.CONSUME  # 只移除 PRODUCTION 和 CONSUME
+        ), self)
 
 
     def _has_prerequisite_building(self, building_config, world_id) -> bool:
@@ -197,51 +196,76 @@ class BuildingManager(BaseObject):
 
         return False
 
-    def handle_building_attribute_changed(self, message:Message):
-        building = self.get_building_by_id(message.data["building_id"])
-        attribute = message.data["attribute"]
-        quantity = message.data["quantity"]
+    def handle_building_attribute_changed(self, changes: List[BuildingAttributeChanged]):
+        """处理建筑属性变化, 每 tick 合并投递一次, 每个 (建筑, 属性) 只有一条净变化"""
+        for data in changes:
+            building = self.get_building_by_id(data.building_id)
+            if building:
+                self._apply_attribute_change(building, data.attribute, data.quantity)
+
+    def handle_building_attribute_batch_changed(self, message: Message):
+        """处理批量的建筑属性变化 {building_id: quantity}"""
+        attribute = message.data.attribute
+        for building_id, quantity in message.data.changes.items():
+            building = self.get_building_by_id(building_id)
+            if building:
+                self._apply_attribute_change(building, attribute, quantity)
+
+    def _apply_attribute_change(self, building: BuildingInstance, attribute: str, quantity):
+        if attribute == "manpower":
+            building.manpower += quantity
+            self.game.snapshots.mark_building(building.object_id, building.build_on)
+
+    def _schedule_completion(self, building: BuildingInstance):
+        """登记建造/升级的完成时间, 到期时由 TimerWheel 回调 complete_building"""
+        timer_wheel = self.game.timer_wheel
+        timer_wheel.cancel(building.timer_id)  # 升级时覆盖尚未完成的建造
+        building.timer_wheel = timer_wheel
+        building.completed = False
+        building.timer_id = timer_wheel.schedule(building.building_config.build_period, self.complete_building, building.object_id)
+        building.complete_tick = timer_wheel.get_due_tick(building.timer_id)
+        self.game.snapshots.mark_building(building.object_id, building.build_on)
+
+    def complete_building(self, building_id: str):
+        """建造/升级完成 (TimerWheel 回调)"""
+        building = self.get_building_by_id(building_id)
+        if not building:
+            return
+        building.completed = True
+        building.timer_id = None
+        self.game.snapshots.mark_building(building_id, building.build_on)
+        self.game.message_bus.post_message(MessageType.BUILDING_COMPLETED, BuildingCompleted(
+            building_id=building_id,
+            world_id=building.build_on,
+        ), self)
+
+    def handle_building_completed(self, message: Message):
+        """建筑完成后开始 PRODUCTION/CONSUME"""
+        building = self.get_building_by_id(message.data.building_id)
         if not building:
             return
         player_id = self.game.world_manager.get_world_by_id(building.build_on).owner
-        if attribute == "remaining_secs":
-            if building.remaining_secs <=0 and building.remaining_secs - quantity >0:
-                # 开始PRODUCTION
-                for modifier_config in building.building_config.modifier_configs:
-                    if modifier_config.modifier_type in(ModifierType.PRODUCTION , ModifierType.CONSUME):
-                        msg_id = self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                        "target_id": player_id,
-                        "modifier_config" : modifier_config
-                        },building)
-
-        elif attribute == "manpower":
-            building.manpower += quantity
-
-    def get_available_slot(self, world_id: str, slot_type: str, subtype: Optional[str] = None) -> Optional[int]:
-        """获取指定星球、类型和子类型 (可选) 的可用槽位索引"""
-        if world_id not in self.world_buildings:
+        for modifier_config in building.building_config.modifier_configs:
+            if modifier_config.modifier_type in(ModifierType.PRODUCTION , ModifierType.CONSUME):
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                target_id=player_id,
+                modifier_config=modifier_config
+                ),building)
+
+    def get_available_slot(self, world_id: str, slot_type: str, subtype: Optional[str] = None, exclude: Optional[Set[int]] = None) -> Optional[int]:
+        """获取指定星球、类型和子类型 (可选) 的可用槽位索引, exclude 为已被预留的槽位"""
+        slot_table = self.world_buildings.get(world_id)
+        if slot_table is None:
             return None  # 该星球没有任何建筑槽位信息
 
-        if slot_type not in self.world_buildings[world_id]:
-            return None  # 该星球没有这种类型的槽位
-
         if slot_type == BuildingType.RESOURCE:
             # 对于 resource 类型，需要检查 subtype
             if subtype is None:
                 return None  # 如果是 resource 类型，必须提供 subtype
-            if subtype not in self.world_buildings[world_id][slot_type]:
-                return None  # 该星球没有这种 subtype 的 resource 槽位
-            try:
-                return self.world_buildings[world_id][slot_type][subtype].index(None)
-            except ValueError:
-                return None
+            return slot_table.find_free((slot_type, subtype), exclude)
 
-        else:
-            # 对于 general 和 defense 类型，直接在列表中查找空闲槽位
-            try:
-                return self.world_buildings[world_id][slot_type].index(None)
-            except ValueError:
-                return None
+        # general 和 defense 类型没有子类型
+        return slot_table.find_free((slot_type, None), exclude)
 
     def tick(self):
         # 移除被摧毁的建筑
@@ -250,50 +274,109 @@ class BuildingManager(BaseObject):
                 world_id = building_instance.build_on
                 self._remove_building_instance(building_instance, world_id)
                 # 发送建筑被摧毁的消息
-                self.game.message_bus.post_message(MessageType.BUILDING_DESTROYED, {
-                    "building_id": building_id,
-                }, self)
-
-        # 处理 pending_buildings 超时 和 确认建造/升级
-        keys_to_delete = []
-        for key, data_list in self.pending_buildings.items():  # 遍历 key 和 列表
-            new_data_list = []  # 用于存储未超时的请求
-            all_succeeded = True  # 标记是否所有 MODIFIER_APPLY_REQUEST 都成功了
-            for data in data_list: # 遍历列表
-                msg_id, timestamp = data  # 正确解包元组
-
-                # 检查是否超时
-                time_elapsed = datetime.datetime.now() - timestamp
-                if time_elapsed.total_seconds() > self.PENDING_TIMEOUT:
-                    self.game.log.warn(f"建造/升级请求的子消息超时，已取消。 key: {key}, msg_id: {msg_id}")
-                    # 从 pending_modifier_msg 中移除超时的 msg_id
-                    if msg_id in self.pending_modifier_msg:
-                        del self.pending_modifier_msg[msg_id]
-                    all_succeeded = False  # 超时也视为失败
-                else:
-                    # 未超时，保留
-                    new_data_list.append(data)
-
-            # 更新 pending_buildings[key] 或删除 key
-            if new_data_list:
-                self.pending_buildings[key] = new_data_list
-            else:
-                # 列表为空（所有请求都超时或完成）
-                if all_succeeded:
-                    # 所有请求都成功了，可以开始建造/升级
-                    params = deserialize_object(key)
-                    if params['action'] == PlayerAction.BUILD:
-                        self.place_new_building(**params)
-                    elif params['action'] == PlayerAction.UPGRADE:
-                        self.upgrade_building(**params)
-                # 无论成功与否，只要列表为空，都添加到待删除列表
-                keys_to_delete.append(key)
-
-        for key in keys_to_delete:
-            del self.pending_buildings[key]
-
-
-    def place_new_building(self, **kwargs):
+                self.game.message_bus.post_message(MessageType.BUILDING_DESTROYED, BuildingDestroyed(
+                    building_id=building_id,
+                    world_id=world_id,
+                ), self)
+
+        # 执行已确认的建造/升级
+        ready_txns, self._ready_txns = self._ready_txns, []
+        for txn_id in ready_txns:
+            txn = self.build_transactions.pop(txn_id, None)
+            if txn:
+                self._commit_transaction(txn)
+
+        # 处理超时的事务
+        now = datetime.datetime.now()
+        while self._txn_deadlines and self._txn_deadlines[0][0] <= now:
+            _, txn_id = heapq.heappop(self._txn_deadlines)
+            txn = self.build_transactions.get(txn_id)
+            if txn is None:
+                continue  # 已经完成或失败
+            self.game.log.warn(f"建造/升级请求的子消息超时，已取消。 txn: {txn_id}, msg_ids: {sorted(txn.pending_requests)}")
+            self._close_transaction(txn)
+
+    def _open_transaction(self, action, player_id, building_config) -> BuildTransaction:
+        """创建建造/升级事务"""
+        self._next_txn_id += 1
+        deadline = datetime.datetime.now() + datetime.timedelta(seconds=self.PENDING_TIMEOUT)
+        return BuildTransaction(self._next_txn_id, action, player_id, building_config, deadline)
+
+    def _submit_transaction(self, txn: BuildTransaction):
+        """
+        发送事务需要的资源修改请求, 等待全部成功后再执行。
+        没有一次性资源修改的事务直接执行。
+        """
+        for modifier_config in txn.building_config.modifier_configs:
+            if modifier_config.modifier_type in (ModifierType.GAIN, ModifierType.LOSS):
+                msg_id = self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=txn.player_id,
+                    modifier_config=modifier_config
+                ), self)
+                txn.pending_requests.add(msg_id)
+                self.txn_by_request[msg_id] = txn.txn_id
+
+        if not txn.pending_requests:
+            self._commit_transaction(txn)
+            return
+
+        self.build_transactions[txn.txn_id] = txn
+        if txn.action == PlayerAction.BUILD:
+            self.txn_slots.setdefault((txn.world_id, txn.slot_type, txn.subtype), set()).add(txn.slot_index)
+        heapq.heappush(self._txn_deadlines, (txn.deadline, txn.txn_id))
+
+    def _release_transaction_slot(self, txn: BuildTransaction):
+        slot_key = (txn.world_id, txn.slot_type, txn.subtype)
+        held = self.txn_slots.get(slot_key)
+        if held is not None:
+            held.discard(txn.slot_index)
+            if not held:
+                del self.txn_slots[slot_key]
+
+    def _commit_transaction(self, txn: BuildTransaction):
+        if txn.action == PlayerAction.BUILD:
+            self._release_transaction_slot(txn)
+            done = self.place_new_building(
+                world_id=txn.world_id,
+                slot_type=txn.slot_type,
+                slot_index=txn.slot_index,
+                subtype=txn.subtype,
+                building_config=txn.building_config,
+            )
+        elif txn.action == PlayerAction.UPGRADE:
+            done = self.upgrade_building(building_id=txn.building_id, building_config=txn.building_config.config_id)
+        else:
+            return
+        if not done:
+            self._refund_transaction(txn)
+
+    def _refund_transaction(self, txn: BuildTransaction):
+        """资源已经扣除, 但提交时无法放置/升级建筑 (槽位被占用、星球或建筑已不存在): 退回一次性的资源修改并通知玩家"""
+        for modifier_config in txn.building_config.modifier_configs:
+            if modifier_config.modifier_type in (ModifierType.GAIN, ModifierType.LOSS):
+                refund_type = ModifierType.GAIN if modifier_config.modifier_type == ModifierType.LOSS else ModifierType.LOSS
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=txn.player_id,
+                    modifier_config=ModifierConfig(modifier_config.target_type, modifier_config.data_type, refund_type,
+                                                   modifier_config.quantity, 0, 0),
+                ), self)
+        self.game.message_bus.post_message(MessageType.BUILDING_FAILED, BuildingFailed(
+            player_id=txn.player_id,
+            building_config_id=txn.building_config.config_id,
+            world_id=txn.world_id,
+            building_id=txn.building_id,
+        ), self)
+
+    def _close_transaction(self, txn: BuildTransaction):
+        """放弃事务, 之后到达的回应会被忽略"""
+        self.build_transactions.pop(txn.txn_id, None)
+        if txn.action == PlayerAction.BUILD:
+            self._release_transaction_slot(txn)
+        for msg_id in txn.pending_requests:
+            self.txn_by_request.pop(msg_id, None)
+        txn.pending_requests.clear()
+
+    def place_new_building(self, **kwargs) -> bool:
         world_id = kwargs['world_id']
         slot_type = kwargs['slot_type']
         slot_index = kwargs['slot_index']
@@ -301,111 +384,107 @@ class BuildingManager(BaseObject):
         building_config = kwargs['building_config']
         # 创建建筑实例
         building_instance = BuildingInstance(building_config, world_id)
-        self._add_building_instance(building_instance, world_id, slot_type, slot_index, subtype)
+        if not self._add_building_instance(building_instance, world_id, slot_type, slot_index, subtype):
+            self.game.registry.remove(building_instance.object_id)
+            return False
 
         # 发送建筑开始建造消息, 并请求modifier
-        self.game.message_bus.post_message(MessageType.BUILDING_START, {
-            "building_id": building_instance.object_id,
-            "world_id": world_id
-        }, self)
-
-        modifier_config =  ModifierConfig(
-            data_type = "remaining_secs",
-            modifier_type = ModifierType.LOSS,
-            quantity = 1,
-            target_type = ObjectType.BUILDING,
-            duration = building_instance.building_config.build_period,
-            delay = 0,
-        )
-        self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-            "target_id": building_instance.object_id,
-            "modifier_config": modifier_config
-        }, self)
-
-
-    def upgrade_building(self, **kwargs):
+        self.game.message_bus.post_message(MessageType.BUILDING_START, BuildingStart(
+            building_id=building_instance.object_id,
+            world_id=world_id
+        ), self)
+
+        self._schedule_completion(building_instance)
+        return True
+
+    def upgrade_building(self, **kwargs) -> bool:
         building_id = kwargs['building_id']
         next_level_building_config_id = kwargs['building_config']
         building_instance = self.get_building_by_id(building_id)
+        if building_instance is None:
+            self.game.log.warn(f"建筑 {building_id} 已不存在，无法升级。")
+            return False
         world_id = building_instance.build_on
         next_level_building_config = self.get_building_config_by_id(next_level_building_config_id)
 
         # 发送移除 Modifier 的请求 (更优雅的方式)
-        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, {
-            "target_id": building_instance.object_id,
-            "owner_type": ObjectType.BUILDING,
-            "owner_id": building_instance.object_id,
-            "modifier_type": ModifierType.PRODUCTION  # 只移除 PRODUCTION 和 CONSUME
-        }, self)
-
-        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, {
-            "target_id": building_instance.object_id,
-            "owner_type": ObjectType.BUILDING,
-            "owner_id": building_instance.object_id,
-            "modifier_type": ModifierType.CONSUME
-        }, self)
+        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, ModifierRemoveRequest(
+            target_id=building_instance.object_id,
+            owner_type=ObjectType.BUILDING,
+            owner_id=building_instance.object_id,
+            modifier_type=ModifierType.PRODUCTION  # 只移除 PRODUCTION 和 CONSUME
+        ), self)
+
+        self.game.message_bus.post_message(MessageType.MODIFIER_REMOVE_REQUEST, ModifierRemoveRequest(
+            target_id=building_instance.object_id,
+            owner_type=ObjectType.BUILDING,
+            owner_id=building_instance.object_id,
+            modifier_type=ModifierType.CONSUME
+        ), self)
 
         # 替换实例的config，升级了
         building_instance.building_config = next_level_building_config
-        building_instance.remaining_secs = next_level_building_config.build_period
         building_instance.durability = next_level_building_config.durability
 
         # 发送建筑开始升级消息(其实就是start消息)
-        self.game.message_bus.post_message(MessageType.BUILDING_START, {
-            "building_id": building_id,
-            "world_id": world_id
-        }, self)
-
-        modifier_config =  ModifierConfig(
-            data_type = "remaining_secs",
-            modifier_type = ModifierType.LOSS,
-            quantity = 1,
-            target_type = ObjectType.BUILDING,
-            duration = next_level_building_config.build_period,
-            delay = 0
-        )
-
-        self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-            "target_id": building_id,
-            "modifier_config": modifier_config
-        }, self)
+        self.game.message_bus.post_message(MessageType.BUILDING_START, BuildingStart(
+            building_id=building_id,
+            world_id=world_id
+        ), self)
+
+        self._schedule_completion(building_instance)
+        return True
 
     def handle_building_request(self, message: Message):
         """处理建造请求"""
         data = message.data
-        player_id = data["player_id"]
-        world_id = data["world_id"]
-        building_config_id = data["building_config_id"]
-
+        self._request_building(data.player_id, data.world_id, data.building_config_id)
+
+    def handle_building_batch_request(self, message: Message):
+        """
+        处理批量建造请求。
+        同一批请求一起校验: 已通过的请求会预留槽位并累计资源消耗, 后面的请求不会抢占同一个槽位或重复花费资源。
+        """
+        player_id = message.data.player_id
+        reserved_slots: Dict[Tuple, Set[int]] = {}  # {(world_id, slot_type, subtype): {slot_index, ...}}
+        committed_costs: Dict[str, float] = {}  # {resource_id: quantity}
+        for world_id, building_config_id in message.data.requests:
+            self._request_building(player_id, world_id, building_config_id, reserved_slots, committed_costs)
+
+    def _request_building(self, player_id, world_id, building_config_id, reserved_slots=None, committed_costs=None) -> bool:
+        """校验并发起一次建造, reserved_slots/committed_costs 用于批量请求间共享校验状态"""
         player = self.game.player_manager.get_player_by_id(player_id)
         world = self.game.world_manager.get_world_by_id(world_id)
         building_config = self.get_building_config_by_id(building_config_id)
 
         if not player or not world or not building_config:
-            return
+            return False
 
         # 检查是否有前置建筑
         if not self._has_prerequisite_building(building_config, world_id):
             self.game.log.info(f"没有前置建筑，无法建造 {building_config}。")
-            return
+            return False
 
         # 检查资源是否足够
         can_afford = True
+        costs = {}
         for modifier_config in building_config.modifier_configs:
             if modifier_config.modifier_type == ModifierType.LOSS:
                 resource = modifier_config.data_type
                 quantity = modifier_config.quantity
-                if player.resources.get(resource, 0) < quantity:
+                costs[resource] = costs.get(resource, 0) + quantity
+                committed = committed_costs.get(resource, 0) if committed_costs is not None else 0
+                if player.resources.get(resource, 0) - committed < quantity:
                     can_afford = False
                     break
 
         if not can_afford:
             # 发送资源不足消息
-            self.game.message_bus.post_message(MessageType.BUILDING_INSUFFICIENT_RESOURCES, {
-                "player_id": player_id,
-                "building_config_id": building_config_id,
-            }, self)
-            return
+            self.game.message_bus.post_message(MessageType.BUILDING_INSUFFICIENT_RESOURCES, BuildingInsufficientResources(
+                player_id=player_id,
+                building_config_id=building_config_id,
+            ), self)
+            return False
 
         # 检查是否有空闲的对应类型槽位, 并获取槽位索引
         if building_config.type == BuildingType.RESOURCE:
@@ -418,49 +497,38 @@ class BuildingManager(BaseObject):
             slot_type = building_config.type
             subtype = None
         else:
-            return  # 未知建筑类型，无法建造
-
-        slot_index = self.get_available_slot(world_id, slot_type, subtype)
+            return False  # 未知建筑类型，无法建造
+
+        slot_key = (world_id, slot_type, subtype)
+        reserved = reserved_slots.get(slot_key) if reserved_slots is not None else None
+        held = self.txn_slots.get(slot_key)
+        if held:
+            reserved = held | reserved if reserved else held
+        slot_index = self.get_available_slot(world_id, slot_type, subtype, reserved)
         if slot_index is None:
             self.game.log.info("没有空闲的槽位")
-            return  # 没有可用的槽位
-
-
-        one_shot_modifiers = 0
-        building_params = {
-            "action" : PlayerAction.BUILD,
-            "building_config" : building_config,
-            "world_id" : world_id,
-            "slot_type" : slot_type,
-            "slot_index" : slot_index,
-            "subtype" :subtype
-        }
-
-        # 发送修改资源的请求
-        for modifier_config in building_config.modifier_configs:
-            if modifier_config.modifier_type in(ModifierType.GAIN , ModifierType.LOSS):
-                msg_id = self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                "target_id": player_id,
-                "modifier_config" : modifier_config
-                },self)
-
-                key = serialize_object(building_params)
-                self.pending_modifier_msg[msg_id] = key
-                if key not in self.pending_buildings:
-                    self.pending_buildings[key] = []
-
-                self.pending_buildings[key].append((msg_id, datetime.datetime.now()))
-                one_shot_modifiers += 1
-
-        if one_shot_modifiers == 0:
-            self.place_new_building(**building_params)
+            return False  # 没有可用的槽位
+
+        if reserved_slots is not None:
+            reserved_slots.setdefault(slot_key, set()).add(slot_index)
+        if committed_costs is not None:
+            for resource, quantity in costs.items():
+                committed_costs[resource] = committed_costs.get(resource, 0) + quantity
+
+        txn = self._open_transaction(PlayerAction.BUILD, player_id, building_config)
+        txn.world_id = world_id
+        txn.slot_type = slot_type
+        txn.slot_index = slot_index
+        txn.subtype = subtype
+        self._submit_transaction(txn)
+        return True
 
     def handle_upgrade_request(self, message: Message):
         """处理升级请求"""
         data = message.data
-        player_id = data["player_id"]
-        building_id = data["building_id"]
-        building_config_id = data["building_config_id"]
+        player_id = data.player_id
+        building_id = data.building_id
+        building_config_id = data.building_config_id
 
         player = self.game.player_manager.get_player_by_id(player_id)
         building_instance = self.get_building_by_id(building_id)
@@ -485,55 +553,32 @@ class BuildingManager(BaseObject):
 
         if not can_afford:
             # 发送资源不足消息
-            self.game.message_bus.post_message(MessageType.BUILDING_INSUFFICIENT_RESOURCES, {
-                "player_id": player_id,
-                "building_config_id": building_config_id,
-            }, self)
+            self.game.message_bus.post_message(MessageType.BUILDING_INSUFFICIENT_RESOURCES, BuildingInsufficientResources(
+                player_id=player_id,
+                building_config_id=building_config_id,
+            ), self)
             return
 
-        one_shot_modifiers = 0
-        upgrade_params ={
-            "action" : PlayerAction.UPGRADE,
-            "building_id" : building_instance.object_id,
-            "building_config" : building_config_id
-        }
-
-        # 发送修改资源的请求
-        for modifier_config in next_level_config.modifier_configs:
-            if modifier_config.modifier_type in(ModifierType.GAIN , ModifierType.LOSS):
-                msg_id = self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                "target_id": player_id,
-                "modifier_config" : modifier_config
-                },self)
-
-                key = serialize_object(upgrade_params)
-                self.pending_modifier_msg[msg_id] = key
-                if key not in self.pending_buildings:
-                    self.pending_buildings[key] = []
+        txn = self._open_transaction(PlayerAction.UPGRADE, player_id, next_level_config)
+        txn.building_id = building_instance.object_id
+        self._submit_transaction(txn)
 
-                self.pending_buildings[key].append((msg_id, datetime.datetime.now()))
-                one_shot_modifiers += 1
+    def handle_modifier_response(self, msg):
+        request_id = msg.data.request_id
+        succ = msg.data.status
+        txn_id = self.txn_by_request.pop(request_id, None)
+        if txn_id is None:
+            return
+        txn = self.build_transactions.get(txn_id)
+        if txn is None:
+            return
 
-        if one_shot_modifiers == 0:
-            self.upgrade_building(**upgrade_params)
+        if not succ:
+            # 失败了，直接去掉后续流程
+            self._close_transaction(txn)
+            return
 
-    def handle_modifier_response(self, msg):
-        index = msg.data["request_id"]
-        succ = msg.data["status"]
-        if index in self.pending_modifier_msg:
-            key = self.pending_modifier_msg[index]
-            del self.pending_modifier_msg[index]
-            if not succ:
-                # 失败了，直接去掉后续流程, 从 pending_buildings 中移除 key
-                if key in self.pending_buildings:
-                    del self.pending_buildings[key]
-            else:
-                # 成功了，从 pending_buildings[key] 中移除对应的 (msg_id, timestamp)
-                if key in self.pending_buildings:
-                    new_data_list = []
-                    for data in self.pending_buildings[key]:
-                        msg_id, timestamp = data
-                        if msg_id != index:  # 保留不是 index 的
-                            new_data_list.append(data)
-                    # 不要在这里删除 key！
-                    self.pending_buildings[key] = new_data_list
\ No newline at end of file
+        txn.pending_requests.discard(request_id)
+        if not txn.pending_requests:
+            # 全部成功, 在 tick 中执行
+            self._ready_txns.append(txn_id)
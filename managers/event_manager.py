@@ -1,75 +1,193 @@
 from basic_types.enums import *
 from basic_types.base_object import BaseObject
+from basic_types.event_store import EventStore
 from basic_types.modifier import ModifierConfig
-from basic_types.player import Player
 from .message_bus import Message, MessageType
+from .messages import EventBegin, EventEnd, EventNeedOption, EventPhaseChange, ModifierApplyRequest
 from loader.event_config import EventConfig, EventPhase, EventOption, EventChallenge, EventResult
 import random
+import bisect
+import itertools
 
 class Event(BaseObject):
     def __init__(self, config: EventConfig):
         super().__init__()
         self.config: EventConfig = config
         self.current_phase: Optional[EventPhase] = None
-        self.phase_start: datetime = datetime.datetime.now()
+        self.phase_start_tick: int = 0  # 进入当前阶段时的 tick
+        self.timer_id: Optional[int] = None  # 当前阶段的超时定时器
+        self.deadline: Optional[int] = None  # 当前阶段的到期 tick, 由 EventStore 索引
         self.choices: Dict[str, str] = {}  # phase_id -> option_id
         self.target_type: Optional[ObjectType] = None
         self.target_id: Optional[str] = None
         self.ended: bool = False
 
+class TriggerGroup:
+    """
+    触发概率相同、目标类型相同的一组事件配置。
+    每个配置各自以概率 p 触发, 所以一轮中触发的数量服从二项分布 B(n, p):
+    预先计算好累积概率, 每轮只需一个随机数就能得到触发数量, 再从组内无放回地选出这么多个配置。
+    """
+    def __init__(self, target_type: ObjectType, probability: float):
+        self.target_type = target_type
+        self.probability = probability
+        self.configs: List[EventConfig] = []
+        self.cumulative: List[float] = []
+
+    def add(self, event_config: EventConfig):
+        self.configs.append(event_config)
+        n, p = len(self.configs), self.probability
+        # P(K <= k) for k = 0..n-1, P(K <= n) = 1 不需要保存
+        self.cumulative = list(itertools.accumulate(math.comb(n, k) * p ** k * (1 - p) ** (n - k) for k in range(n)))
+
+    def draw(self, rng=random) -> List[EventConfig]:
+        """抽取本轮触发的配置"""
+        count = bisect.bisect_right(self.cumulative, rng.random())
+        if count == 0:
+            return []
+        if count == len(self.configs):
+            return list(self.configs)
+        return rng.sample(self.configs, count)
+
+
 class EventManager():
-    _instance = None
-
-    def __new__(cls, event_configs: List[EventConfig], game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.last_generate = datetime.datetime.now()
-            cls._instance.event_configs: List[EventConfig] = event_configs # type: ignore
-            cls._instance.active_events: Dict[ObjectType, Dict[str, Event]] = { # type: ignore
-                ObjectType.PLAYER: {},
-                ObjectType.WORLD: {},
-                ObjectType.BUILDING: {},
-            }
-            cls._instance.game = game
-            cls._instance.game.event_manager = cls._instance
 
-            # 订阅消息
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_SELECT_EVENT_OPTION, cls._instance.process_player_choice_callback)
-        return cls._instance
+    def __init__(self, event_configs: List[EventConfig], game):
+        self.last_generate = datetime.datetime.now()
+        self.event_configs: List[EventConfig] = event_configs # type: ignore
+        self.active_events: EventStore = EventStore()  # 进行中的事件, 同一目标可以有多个
+        self.game = game
+        self.game.event_manager = self
+        self._target_getters: Optional[Dict[ObjectType, Callable]] = None  # 第一次使用时绑定各管理器的查找方法
+        self._choice_batch: Optional[Tuple[int, List[Tuple[Any, str]]]] = None  # (到期 tick, [(事件对象 ID, 阶段 ID)])
+
+        # 按 (目标类型, 触发概率) 分组的事件配置
+        self.trigger_groups: List[TriggerGroup] = [] # type: ignore
+        groups: Dict[Tuple[ObjectType, float], TriggerGroup] = {}
+        for event_config in event_configs:
+            key = (event_config.target, event_config.trigger_probability)
+            if key not in groups:
+                groups[key] = TriggerGroup(*key)
+                self.trigger_groups.append(groups[key])
+            groups[key].add(event_config)
+
+        # 各目标类型的筛选条件, 目标需要满足所有条件才能触发事件
+        self.target_filters: Dict[ObjectType, List[Callable[[str], bool]]] = { # type: ignore
+            ObjectType.PLAYER: [],
+            ObjectType.WORLD: [],
+            ObjectType.BUILDING: [],
+        }
+
+        # 订阅消息
+        self.game.message_bus.subscribe(MessageType.PLAYER_SELECT_EVENT_OPTION, self.process_player_choice_callback)
+
+    def add_target_filter(self, target_type: ObjectType, predicate: Callable[[str], bool]):
+        """添加事件目标的筛选条件"""
+        self.target_filters[target_type].append(predicate)
+
+    def _target_index(self, target_type: ObjectType):
+        if target_type == ObjectType.PLAYER:
+            return self.game.player_manager.targets
+        elif target_type == ObjectType.WORLD:
+            return self.game.world_manager.targets
+        elif target_type == ObjectType.BUILDING:
+            return self.game.building_manager.targets
+        return None
+
+    def _is_eligible(self, target_type: ObjectType, target_id) -> bool:
+        return all(predicate(target_id) for predicate in self.target_filters[target_type])
 
     def generate_events(self):
-        """根据概率生成新的事件"""
-        for event_config in self.event_configs:
-            if random.random() < event_config.trigger_probability:
-                event = Event(event_config)
-                event.current_phase = event_config.phases.get(event_config.initial_phase)
-                event.target_type = event_config.target
-
-                # 根据目标类型选择目标
-                if event.target_type == ObjectType.PLAYER:
-                    event.target_id = self.game.player_manager.pick()
-                elif event.target_type == ObjectType.WORLD:
-                    event.target_id = self.game.world_manager.pick()
-                elif event.target_type == ObjectType.BUILDING:
-                    event.target_id = self.game.building_manager.pick()
-
-                if event.target_id:
-                    self.active_events[event.target_type][event.target_id] = event
-
-                    # 发送事件开始消息
-                    self.game.message_bus.post_message(MessageType.EVENT_BEGIN, {
-                        "target_type": event.target_type,
-                        "target_id": event.target_id,
-                        "event_id": event.config.event_id,
-                        "text_id": event.config.trigger_text_id,  # 事件触发文本
-                    }, self)
+        """
+        根据概率生成新的事件。
+        每组配置用一次二项分布抽样决定触发哪些配置, 目标从对应类型的目标索引中随机抽取,
+        开销只和配置数量有关, 与玩家、星球、建筑的数量无关。
+        """
+        for group in self.trigger_groups:
+            triggered = group.draw()
+            if not triggered:
+                continue
+            targets = self._target_index(group.target_type)
+            if targets is None:
+                continue
+            for event_config in triggered:
+                target_id = targets.sample(lambda target_id: self._is_eligible(group.target_type, target_id))
+                if target_id is None:
+                    continue  # 没有符合条件的目标
+                self.start_event(event_config, target_id)
+
+    def start_event(self, event_config: EventConfig, target_id) -> Event:
+        """在指定目标上开始事件"""
+        event = Event(event_config)
+        event.target_type = event_config.target
+        event.target_id = target_id
+        self.active_events.add(event)
+
+        # 发送事件开始消息
+        self.game.message_bus.post_message(MessageType.EVENT_BEGIN, EventBegin(
+            target_type=event.target_type,
+            target_id=event.target_id,
+            event_id=event.config.event_id,
+            text_id=event.config.trigger_text_id,  # 事件触发文本
+        ), self)
+        self.enter_phase(event, event_config.phases.get(event_config.initial_phase))
+        return event
+
+    def enter_phase(self, event: Event, phase: Optional[EventPhase]):
+        """
+        进入新的阶段: 取消上一阶段的超时定时器, 有持续时间的阶段在时间轮上登记到期 tick,
+        需要玩家选择的阶段只发送一次选择请求。阶段不存在时结束事件。
+        """
+        timer_wheel = self.game.timer_wheel
+        timer_wheel.cancel(event.timer_id)
+        event.timer_id = None
+        self.active_events.set_deadline(event, None)
+        if phase is None:
+            self.end_event(event)
+            return
+
+        event.current_phase = phase
+        event.phase_start_tick = timer_wheel.current_tick
+        if phase.duration != -1:
+            event.timer_id = timer_wheel.schedule(phase.duration, self.expire_phase, event.object_id)
+            self.active_events.set_deadline(event, timer_wheel.get_due_tick(event.timer_id))
+
+        # 如果当前阶段有选项，发送消息请求玩家选择
+        if phase.options and phase.phase_id not in event.choices and event.target_type == ObjectType.PLAYER:
+            self.game.message_bus.post_message(MessageType.EVENT_NEED_OPTION, EventNeedOption(
+                player_id=event.target_id,
+                event_object_id=event.object_id,
+                event_id=event.config.event_id,
+                phase_id=phase.phase_id,
+                text_id=phase.text_id,
+                options={option_id: option.option_id for option_id, option in phase.options.items()},  # 选项的文本ID
+            ), self)
+
+    def expire_phase(self, event_id):
+        """阶段超时 (时间轮回调)"""
+        event = self.active_events.get(event_id)
+        if event is None or event.ended:
+            return
+        event.timer_id = None
+        # 阶段超时，根据情况进入下一个阶段或结束事件
+        # 这里简化处理，直接结束事件
+        self.end_event(event)
 
     def process_player_choice_callback(self, message: Message): #修改
-        """处理玩家的选择"""
-        # event = self.active_events[ObjectType.PLAYER].get(player_id) #移除
-        player_id = message.data["player_id"]
-        choice = message.data["choice"]
-        event = self.active_events[ObjectType.PLAYER].get(player_id)
+        """
+        处理玩家的选择: 记录选择后在时间轮下一次推进时结算, 同时到期的选择放在同一个定时器中一起结算。
+        Game._tick 中时间轮在 player_manager 之后推进, 所以玩家操作提交的选择在同一个 tick 内结算;
+        在时间轮推进之后才到达的选择 (例如延迟消息) 在下一个 tick 结算。
+        选择中带有事件对象 ID 时直接找到该事件, 否则使用玩家身上最早开始的、正在等待选择的事件。
+        """
+        player_id = message.data.player_id
+        choice = message.data.choice
+        if message.data.event_object_id is not None:
+            event = self.active_events.get(message.data.event_object_id)
+            if not event or event.target_type != ObjectType.PLAYER or event.target_id != player_id:
+                return
+        else:
+            event = self.get_pending_choice_event(player_id)
         if not event:
             return
 
@@ -83,39 +201,38 @@ class EventManager():
         if choice not in current_phase.options:
             return
 
-        event.choices[current_phase.phase_id] = choice
-
-
-    def evaluate_challenges(self, event: Event, option: EventOption) -> bool:
-        """评估挑战是否成功"""
-        target = None
-        if event.target_type == ObjectType.PLAYER:
-            target = self.game.player_manager.get_player_by_id(event.target_id)
-        elif event.target_type == ObjectType.WORLD:
-            target = self.game.world_manager.get_world_by_id(event.target_id)
-        elif event.target_type == ObjectType.BUILDING:
-            target = self.game.building_manager.get_building_by_id(event.target_id)
-        if not target:
-            return False
-
-        for challenge in option.challenges:
-            value = None
-            if challenge.resource_type == "morale":  # 假设有士气属性
-                if isinstance(target, Player):
-                    value = target.fleet.morale
-            # 可以添加其他资源类型的判断
-
-            if value is None:
-                return False  # 如果没有找到对应的值，挑战失败
-
-            if challenge.below and not value < challenge.value:
-                return False
-            if challenge.equal and not value == challenge.value:
-                return False
-            if challenge.greater and not value > challenge.value:
-                return False
+        if current_phase.phase_id in event.choices:
+            return  # 本阶段已经选择过, 等待结算
 
-        return True
+        event.choices[current_phase.phase_id] = choice
+        # 在时间轮下一次推进时结算, 不在消息回调中直接改变事件阶段
+        # 待结算的列表是定时器的参数, 存档时随定时器一起保存
+        timer_wheel = self.game.timer_wheel
+        due_tick = timer_wheel.current_tick + 1
+        if self._choice_batch is None or self._choice_batch[0] != due_tick:
+            self._choice_batch = (due_tick, [])
+            timer_wheel.schedule_at(due_tick, self.resolve_choices, self._choice_batch[1])
+        self._choice_batch[1].append((event.object_id, current_phase.phase_id))
+
+    def get_pending_choice_event(self, player_id) -> Optional[Event]:
+        """玩家身上最早开始的、当前阶段需要选择且还没有选择的事件"""
+        for event in self.active_events.for_target(ObjectType.PLAYER, player_id):
+            phase = event.current_phase
+            if phase and phase.options and phase.phase_id not in event.choices:
+                return event
+        return None
+
+    def get_target(self, event: Event):
+        """事件目标对象, 已经不存在时返回 None"""
+        getters = self._target_getters
+        if getters is None:
+            getters = self._target_getters = {
+                ObjectType.PLAYER: self.game.player_manager.get_player_by_id,
+                ObjectType.WORLD: self.game.world_manager.get_world_by_id,
+                ObjectType.BUILDING: self.game.building_manager.get_building_by_id,
+            }
+        getter = getters.get(event.target_type)
+        return getter(event.target_id) if getter else None
 
     def apply_event_result(self, event: Event, result_id: str):
         """应用事件结果"""
@@ -123,14 +240,7 @@ class EventManager():
         if not results:
             return
 
-        target = None
-        if event.target_type == ObjectType.PLAYER:
-            target = self.game.player_manager.get_player_by_id(event.target_id)
-        elif event.target_type == ObjectType.WORLD:
-            target = self.game.world_manager.get_world_by_id(event.target_id)
-        elif event.target_type == ObjectType.BUILDING:
-            target = self.game.building_manager.get_building_by_id(event.target_id)
-
+        target = self.get_target(event)
         if not target:
             return
 
@@ -144,119 +254,107 @@ class EventManager():
                     delay = 0,
                 )
             if event.target_type == ObjectType.PLAYER:
-                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                    "target_id" : target.object_id,  # 使用玩家 ID 作为 target_id
-                    "modifier_config" : modifier_config,
-                }, event)
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=target.object_id,  # 使用玩家 ID 作为 target_id
+                    modifier_config=modifier_config,
+                ), event)
             # 其他目标类型的处理 (例如，如果是 World 或 Building，可能需要发送其他类型的消息)
             elif event.target_type == ObjectType.WORLD:
-                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                    "target_id": target.object_id,
-                    "modifier_config": modifier_config,
-                }, event)
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=target.object_id,
+                    modifier_config=modifier_config,
+                ), event)
             elif event.target_type == ObjectType.BUILDING:
-                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, {
-                    "target_id": target.object_id,
-                    "modifier_config" :modifier_config,
-                }, event)
-
-    def update_event_state(self):
-        """更新事件状态"""
-        for target_type, events in list(self.active_events.items()):
-            for target_id, event in list(events.items()):
-
-                if not event.current_phase:
-                    continue
-
-                # 检查阶段持续时间
-                lasted_secs = (datetime.datetime.now() - event.phase_start).total_seconds()
-                if event.current_phase.duration != -1 and  lasted_secs >= event.current_phase.duration:
-                    # 阶段超时，根据情况进入下一个阶段或结束事件
-                    # 这里简化处理，直接结束事件
-                    event.ended = True
-                    self.game.message_bus.post_message(MessageType.EVENT_END, {
-                        "target_type": event.target_type,
-                        "target_id": event.target_id,
-                        "event_id": event.config.event_id,
-                    }, self)
-                    del self.active_events[target_type][target_id]
-                    continue
-
-                # 如果当前阶段有选项，并且玩家还没有做出选择，发送消息请求选择
-                if event.current_phase.options and event.current_phase.phase_id not in event.choices:
-                    if event.target_type == ObjectType.PLAYER:
-                        self.game.message_bus.post_message(MessageType.EVENT_NEED_OPTION, {
-                            "player_id": event.target_id,
-                            "event_id": event.config.event_id,
-                            "phase_id": event.current_phase.phase_id,
-                            "text_id": event.current_phase.text_id,
-                            "options": {option_id: option.option_id for option_id, option in event.current_phase.options.items()},  # 选项的文本ID
-                        }, self)
-
-                # 如果玩家已经做出了选择，处理选择
-                if event.current_phase.phase_id in event.choices:
-                    choice = event.choices[event.current_phase.phase_id]
-                    option = event.current_phase.options.get(choice)
-
-                    if not option:
-                        continue
-
-                    # 评估挑战
-                    success = self.evaluate_challenges(event, option)
-
-                    # 根据挑战结果进入下一个阶段或应用结果
-                    if success:
-                        if option.success_result_id:
-                            self.apply_event_result(event, option.success_result_id)
-                        if event.current_phase.next_phase_success:
-                            event.current_phase = event.config.phases.get(event.current_phase.next_phase_success)
-                            event.phase_start = datetime.datetime.now()
-                            # 发送事件阶段变更消息
-                            self.game.message_bus.post_message(MessageType.EVENT_PHASE_CHANGE, {
-                                "target_type": event.target_type,
-                                "target_id": event.target_id,
-                                "event_id": event.config.event_id,
-                                "phase_id": event.current_phase.phase_id,
-                                "text_id": event.current_phase.text_id,
-                            }, self)
-
-                        else:
-                            # 没有下一个阶段，事件结束
-                            event.ended = True
-                            self.game.message_bus.post_message(MessageType.EVENT_END, {
-                                "target_type": event.target_type,
-                                "target_id": event.target_id,
-                                "event_id": event.config.event_id,
-                            }, self)
-                            del self.active_events[target_type][target_id]
-                    else:
-                        if option.fail_result_id:
-                            self.apply_event_result(event, option.fail_result_id)
-                        if event.current_phase.next_phase_failure:
-                            event.current_phase = event.config.phases.get(event.current_phase.next_phase_failure)
-                            event.phase_start = datetime.datetime.now()
-                            # 发送事件阶段变更消息
-                            self.game.message_bus.post_message(MessageType.EVENT_PHASE_CHANGE, {
-                                "target_type": event.target_type,
-                                "target_id": event.target_id,
-                                "event_id": event.config.event_id,
-                                "phase_id": event.current_phase.phase_id,
-                                "text_id": event.current_phase.text_id,
-                            }, self)
-                        else:
-                            # 没有下一个阶段，事件结束
-                            event.ended = True
-                            self.game.message_bus.post_message(MessageType.EVENT_END, {
-                                "target_type": event.target_type,
-                                "target_id": event.target_id,
-                                "event_id": event.config.event_id,
-                            }, self)
-                            del self.active_events[target_type][target_id]
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=target.object_id,
+                    modifier_config=modifier_config,
+                ), event)
+
+    def end_event(self, event: Event, notify: bool = True):
+        """结束事件: 取消阶段定时器, 从活跃事件中移除并注销, notify 为 True 时发送事件结束消息"""
+        event.ended = True
+        self.game.timer_wheel.cancel(event.timer_id)
+        event.timer_id = None
+        if notify:
+            self.game.message_bus.post_message(MessageType.EVENT_END, EventEnd(
+                target_type=event.target_type,
+                target_id=event.target_id,
+                event_id=event.config.event_id,
+            ), self)
+        self.active_events.remove(event)
+        self.active_events.set_deadline(event, None)
+        self.game.registry.remove(event.object_id)
+
+    def _chosen_option(self, event_id, phase_id: str) -> Optional[Tuple[Event, EventOption]]:
+        """事件仍然停留在 phase_id 阶段时返回事件和玩家选择的选项"""
+        event = self.active_events.get(event_id)
+        if event is None or event.ended or event.current_phase is None or event.current_phase.phase_id != phase_id:
+            return None
+        option = event.current_phase.options.get(event.choices.get(phase_id))
+        if not option:
+            return None
+        return event, option
+
+    def resolve_choice(self, event_id, phase_id: str):
+        """结算单个选择 (时间轮回调), 保留给旧存档中已经登记的定时器"""
+        self.resolve_choices([(event_id, phase_id)])
+
+    def resolve_choices(self, choices: List[Tuple[Any, str]]):
+        """
+        结算同时到期的选择 (时间轮回调), 事件已经结束或离开该阶段时忽略。
+        先按选项分组批量判定挑战 (都以结算开始时的目标状态为准), 再按提交顺序应用结果。
+        """
+        pending = []
+        for event_id, phase_id in choices:
+            chosen = self._chosen_option(event_id, phase_id)
+            if chosen is not None:
+                pending.append((phase_id, *chosen))
+        if not pending:
+            return
+
+        # 评估挑战
+        by_option: Dict[EventOption, List[int]] = {}
+        for index, (_, _, option) in enumerate(pending):
+            by_option.setdefault(option, []).append(index)
+        success = [False] * len(pending)
+        for option, indices in by_option.items():
+            targets = [self.get_target(pending[index][1]) for index in indices]
+            for index, passed in zip(indices, option.check_many(targets)):
+                success[index] = passed
+
+        for (phase_id, event, option), passed in zip(pending, success):
+            # 前面的结算可能已经结束了这个事件
+            if self._chosen_option(event.object_id, phase_id) is not None:
+                self.apply_choice(event, option, passed)
+
+    def apply_choice(self, event: Event, option: EventOption, success: bool):
+        """根据挑战结果应用结果, 进入下一个阶段或结束事件"""
+        if success:
+            result_id, next_phase_id = option.success_result_id, event.current_phase.next_phase_success
+        else:
+            result_id, next_phase_id = option.fail_result_id, event.current_phase.next_phase_failure
+        if result_id:
+            self.apply_event_result(event, result_id)
+        if not next_phase_id:
+            # 没有下一个阶段，事件结束
+            self.end_event(event)
+            return
+
+        next_phase = event.config.phases.get(next_phase_id)
+        if next_phase is not None:
+            # 发送事件阶段变更消息
+            self.game.message_bus.post_message(MessageType.EVENT_PHASE_CHANGE, EventPhaseChange(
+                target_type=event.target_type,
+                target_id=event.target_id,
+                event_id=event.config.event_id,
+                phase_id=next_phase.phase_id,
+                text_id=next_phase.text_id,
+            ), self)
+        self.enter_phase(event, next_phase)
 
     def tick(self):
+        """生成新事件. 阶段超时和玩家选择的结算都由时间轮回调, 没有状态变化的事件不产生每 tick 开销"""
         now = datetime.datetime.now()
         if (now- self.last_generate).seconds >= 60:
             self.generate_events()
             self.last_generate = now
-            
-        self.update_event_state()
\ No newline at end of file
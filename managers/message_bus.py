@@ -1,5 +1,7 @@
 from enum import Enum
 from common import *
+import copy
+from .messages import MessagePayload
 
 class MessageType(Enum):
     NONE = 0
@@ -36,25 +38,73 @@ class MessageType(Enum):
     PLAYER_PURCHASE_REQUEST = 31
     PURCHASE_SUCCESS = 32
     MODIFIER_REMOVE_REQUEST = 33
+    BUILDING_BATCH_REQUEST = 34
+    BUILDING_ATTRIBUTE_BATCH_CHANGED = 35
+    BUILDING_FAILED = 36
 
 class Message:
-    _msg_id_counter = 0
-    def __init__(self, type: MessageType, data: Dict[str, Any], sender: Any, delay: int = 0):
-        Message._msg_id_counter += 1
-        self.id = Message._msg_id_counter
+    """消息信封。由 MessageBus 从对象池中取出并复用, 订阅者不要在回调之外持有它 (需要时保存 id 或 data)"""
+    __slots__ = ("id", "type", "data", "sender", "delay", "retries")
+
+    def __init__(self, msg_id: int, type: MessageType, data: MessagePayload, sender: Any, delay: int = 0):
+        self.reset(msg_id, type, data, sender, delay)
+
+    def reset(self, msg_id: int, type: MessageType, data: MessagePayload, sender: Any, delay: int = 0):
+        self.id = msg_id
         self.type: MessageType = type
-        self.data: Dict[str, Any] = data
+        self.data: MessagePayload = data
         self.sender: Any = sender
         self.delay: int = delay
         self.retries: int = 0
 
+class CoalescedSubscription:
+    """
+    合并投递的订阅: 一个 tick 内 key 相同的消息用 merge 合并成一条,
+    在 MessageBus.tick 结束时把合并后的消息列表一次性交给 callback。
+    同一个 key 第二次出现时把先到的消息复制一份 (每个 tick 每个 key 只复制一次), 之后 merge 直接累加到这份副本上。
+    """
+    __slots__ = ("callback", "key", "merge", "pending", "copied")
+
+    def __init__(self, callback: Callable[[List[MessagePayload]], None], key: Callable[[MessagePayload], Any], merge: Callable[[MessagePayload, MessagePayload], None]):
+        self.callback = callback
+        self.key = key
+        self.merge = merge
+        self.pending: Dict[Any, MessagePayload] = {}  # {key: 合并后的消息}, 保持首次出现的顺序
+        self.copied: Set[Any] = set()  # pending 中已经是副本 (可以原地修改) 的 key
+
+    def add(self, data: MessagePayload):
+        key = self.key(data)
+        merged = self.pending.get(key)
+        if merged is None:
+            self.pending[key] = data  # 只有一条时不复制, 原样投递
+            return
+        if key not in self.copied:
+            # 先到的消息可能还被其他订阅者或重试队列引用, 复制后再修改
+            merged = self.pending[key] = copy.copy(merged)
+            self.copied.add(key)
+        self.merge(merged, data)
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch = list(self.pending.values())
+        self.pending.clear()
+        self.copied.clear()
+        self.callback(batch)
+
 class MessageBus:
+    MAX_POOL_SIZE = 256  # 对象池中最多保留的空闲消息数
 
     def __init__(self, game):
         self.game = game
         self.messages: List[Message] = []  # 延迟消息队列
         self.pending_messages: List[Message] = []  # 未成功处理的消息队列
         self.subscribers: Dict[MessageType, List[Callable[[Message], None]]] = {}  # 订阅者字典
+        # 按 MessageType.value 索引的回调元组, 订阅变化时重建
+        self._dispatch: List[Tuple[Callable[[Message], None], ...]] = [()] * (max(t.value for t in MessageType) + 1)
+        self._coalesced: List[Tuple[CoalescedSubscription, ...]] = [()] * len(self._dispatch)  # 合并投递的订阅, 同样按类型索引
+        self._pool: List[Message] = []  # 空闲的消息对象
+        self._next_msg_id = 0  # 消息 ID 按总线分配, 多局游戏互不影响
         self.MAX_RETRIES = 3  # 最大重试次数
         self.MAX_DELAY = 600 #最大延迟
 
@@ -63,92 +113,70 @@ class MessageBus:
         if message_type not in self.subscribers:
             self.subscribers[message_type] = []
         self.subscribers[message_type].append(callback)
+        self._dispatch[message_type.value] = tuple(self.subscribers[message_type])
 
     def unsubscribe(self, message_type: MessageType, callback: Callable[[Message], None]):
         """取消订阅"""
         if message_type in self.subscribers:
             self.subscribers[message_type].remove(callback)
+            self._dispatch[message_type.value] = tuple(self.subscribers[message_type])
 
-    def post_message(self, type: MessageType, data: Dict[str, Any], sender: Any, delay: int = 0):
+    def subscribe_coalesced(self, message_type: MessageType, callback: Callable[[List[MessagePayload]], None],
+                            key: Callable[[MessagePayload], Any], merge: Callable[[MessagePayload, MessagePayload], None]) -> CoalescedSubscription:
+        """
+        订阅合并投递的消息: 同一 tick 内 key(data) 相同的消息用 merge(合并结果, 新) 合并 (merge 原地修改合并结果, 不能修改新消息),
+        tick 结束时以 callback([data, ...]) 的形式投递一次。适合只关心每 tick 净变化的订阅者。
+        """
+        subscription = CoalescedSubscription(callback, key, merge)
+        self._coalesced[message_type.value] += (subscription,)
+        return subscription
+
+    def unsubscribe_coalesced(self, message_type: MessageType, subscription: CoalescedSubscription):
+        """取消合并投递的订阅, 尚未投递的消息被丢弃"""
+        self._coalesced[message_type.value] = tuple(sub for sub in self._coalesced[message_type.value] if sub is not subscription)
+
+    def post_message(self, type: MessageType, data: MessagePayload, sender: Any, delay: int = 0):
         if delay > self.MAX_DELAY:
             self.game.log.warn(f"消息延迟时间过长 ({delay} > {self.MAX_DELAY})，可能被丢弃: {type.name}")
-        msg = Message(type, data, sender, delay)
+        self._next_msg_id += 1
+        msg_id = self._next_msg_id
+        if self._pool:
+            msg = self._pool.pop()
+            msg.reset(msg_id, type, data, sender, delay)
+        else:
+            msg = Message(msg_id, type, data, sender, delay)
         if delay > 0:
             self.messages.append(msg)  # 延迟消息添加到 messages 列表
         else:
             self.publish_message(msg)  # 立即发布消息
-        return msg.id
+            self._release(msg)
+        return msg_id
+
+    def _release(self, msg: Message):
+        """消息处理完毕, 放回对象池"""
+        msg.data = None
+        msg.sender = None
+        if len(self._pool) < self.MAX_POOL_SIZE:
+            self._pool.append(msg)
 
     def publish_message(self, msg: Message):
         """发布消息 (立即触发回调函数)"""
-        if msg.type in self.subscribers:
-            for callback in self.subscribers[msg.type]:
+        profiler = self.game.profiler
+        if profiler is None:
+            for callback in self._dispatch[msg.type.value]:
                 callback(msg)  # 调用回调函数
-
-        # 按类型处理日志输出
-        log_msg = f"[MSG-{msg.type.name}]"
-        if msg.type == MessageType.WORLD_ADDED:
-            world = msg.data.get("world")
-            log_msg += f" 星球ID:{world.object_id}, 类型:{world.world_config.world_id}, 位置:{world.location}"
-        elif msg.type == MessageType.WORLD_REMOVED:
-            world = msg.data.get("world")
-            log_msg += f" 移除星球ID:{world.object_id}, 类型:{world.world_config.world_id}"
-        elif msg.type == MessageType.EVENT_BEGIN:
-            log_msg += f" 目标类型:{msg.data['target_type'].name}, 目标ID:{msg.data['target_id']}, 事件ID:{msg.data['event_id']}, 文本ID:{msg.data['text_id']}"
-        elif msg.type == MessageType.EVENT_PHASE_CHANGE:
-            log_msg += f" 目标类型:{msg.data['target_type'].name}, 目标ID:{msg.data['target_id']}, 事件ID:{msg.data['event_id']}, 阶段ID:{msg.data['phase_id']}"
-        elif msg.type == MessageType.EVENT_NEED_OPTION:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 事件ID:{msg.data['event_id']}, 阶段ID:{msg.data['phase_id']}, 选项数:{len(msg.data['options'])}"
-        elif msg.type == MessageType.EVENT_END:
-            log_msg += f" 目标类型:{msg.data['target_type'].name}, 目标ID:{msg.data['target_id']}, 事件ID:{msg.data['event_id']}"
-        elif msg.type == MessageType.PLAYER_SELECT_EVENT_OPTION:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 选择选项:{msg.data['choice']}"
-        elif msg.type == MessageType.PLAYER_RESOURCE_CHANGED:
-            # log_msg += f" 玩家ID:{msg.data['player_id']}, 资源:{msg.data['resource']}, 变化量:{msg.data['quantity']}"
-            # 减少日志量
-            return
-        elif msg.type == MessageType.PLAYER_FLEET_MOVE_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 路径长度:{len(msg.data['path'])}, 方式:{msg.data['travel_method'].name}"
-        elif msg.type == MessageType.PLAYER_FLEET_LAND_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 星球ID:{msg.data['world_id']}"
-        elif msg.type == MessageType.PLAYER_FLEET_TAKEOFF_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}"
-        elif msg.type == MessageType.PLAYER_FLEET_MOVEMENT_INTERRUPT:
-            log_msg += f" 玩家ID:{msg.data['player_id']}"
-        elif msg.type == MessageType.PLAYER_FLEET_ARRIVE:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 位置:{msg.data['location']}, 类型:{msg.data['arrival_type']}"
-        elif msg.type == MessageType.PLAYER_EXPLORE_WORLD_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 星球ID:{msg.data['world_id']}"
-        elif msg.type == MessageType.BUILDING_START:
-            log_msg += f" 建筑ID:{msg.data['building_id']}, 星球ID:{msg.data['world_id']}"
-        elif msg.type == MessageType.BUILDING_DESTROYED:
-            log_msg += f" 建筑ID:{msg.data['building_id']}, 所在星球:{self.game.building_manager.get_building_by_id(msg.data['building_id']).build_on if msg.data['building_id'] in self.game.building_manager.building_instances else '未知'}"
-        elif msg.type == MessageType.BUILDING_INSUFFICIENT_RESOURCES:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 建筑ID:{msg.data['building_config_id']}"
-        elif msg.type == MessageType.BUILDING_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 星球ID:{msg.data['world_id']}, 建筑类型:{msg.data['building_config_id']}"
-        elif msg.type == MessageType.BUILDING_UPGRADE_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 原建筑ID:{msg.data['building_id']}, 建筑类型:{msg.data['building_config_id']}"
-        elif msg.type == MessageType.BUILDING_ATTRIBUTE_CHANGED:
-            # log_msg += f" 建筑ID:{msg.data['building_id']}, 属性:{msg.data['attribute']}, 变化量:{msg.data['quantity']}"
-            # 减少日志量
-            return
-        elif msg.type == MessageType.MODIFIER_APPLY_REQUEST:
-            log_msg += f" 目标ID:{msg.data['target_id']}, 类型:{msg.data['modifier_config'].modifier_type.name}, 数值:{msg.data['modifier_config'].quantity}"
-        elif msg.type == MessageType.MODIFIER_RESPONSE:
-            log_msg += f" 请求ID:{msg.data['request_id']}, 状态:{msg.data['status']}"
-        elif msg.type == MessageType.INTERSECTION_EVENT:
-            log_msg += f" 位置:{msg.data['location']}, 对象:{msg.data['objects']}, 坠毁:{msg.data['crash']}"
-        elif msg.type == MessageType.PLAYER_PURCHASE_REQUEST:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 购买项:{msg.data['package_name']}, 数量:{msg.data['quantity']}"
-        elif msg.type == MessageType.PURCHASE_SUCCESS:
-            log_msg += f" 玩家ID:{msg.data['player_id']}, 购买成功: {msg.data['package_name']} x {msg.data['quantity']}"
-        elif msg.type == MessageType.MODIFIER_REMOVE_REQUEST:
-            log_msg += f" Type: {msg.data['modifier_type']} ,目标:{msg.data['target_id']}, 施加者类型: {msg.data['owner_type']} , 施加者ID {msg.data['owner_id']}"
         else:
-            log_msg += f" 数据:{json.dumps(msg.data, indent=None, ensure_ascii=False)[:100]}"  # 截断过长数据
+            # 按消息类型和回调分别计时, 回调中同步发布的消息也计入该回调
+            for callback in self._dispatch[msg.type.value]:
+                with profiler.measure(f"message.{msg.type.name}.{callback.__qualname__}"):
+                    callback(msg)
+        for subscription in self._coalesced[msg.type.value]:
+            subscription.add(msg.data)  # 等到 tick 结束再投递
 
-        self.game.log.info(log_msg)
+        # 日志文本由各消息类型自己给出
+        text = msg.data.describe()
+        if text is not None:
+            self.game.log.info(f"[MSG-{msg.type.name}]{text}")
 
     def tick(self):
         # 处理延迟消息
@@ -161,6 +189,7 @@ class MessageBus:
                 self.game.log.info(f"延迟后处理消息: id:{msg.id} ,类型={msg.type.name}")
                 # 立即发布消息
                 self.publish_message(msg)
+                self._release(msg)
         self.messages = new_messages
 
         temp_pending_messages = []
@@ -174,4 +203,14 @@ class MessageBus:
                 self.game.log.error(f"消息 {msg.id} ({msg.type.name}) 超过最大重试次数，已丢弃")
                 #从队列中删除
                 continue
-        self.pending_messages = temp_pending_messages
\ No newline at end of file
+        self.pending_messages = temp_pending_messages
+
+        # 投递本 tick 合并的消息, 投递过程中产生的消息留到下一个 tick
+        profiler = self.game.profiler
+        for type_value, subscriptions in enumerate(self._coalesced):
+            for subscription in subscriptions:
+                if profiler is None or not subscription.pending:
+                    subscription.flush()
+                    continue
+                with profiler.measure(f"message.{MessageType(type_value).name}.{subscription.callback.__qualname__}"):
+                    subscription.flush()
@@ -0,0 +1,319 @@
+from dataclasses import dataclass, fields
+from common import *
+
+class MessagePayload:
+    """
+    消息内容的基类。每种 MessageType 对应一个带 __slots__ 的 dataclass,
+    订阅者通过属性访问字段, describe() 给出该消息的日志文本 (返回 None 表示不输出日志)。
+    """
+    __slots__ = ()
+
+    def describe(self) -> Optional[str]:
+        text = ", ".join(f"{field.name}:{getattr(self, field.name)}" for field in fields(self))
+        return f" 数据:{text[:100]}"  # 截断过长数据
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可以 JSON 序列化的字典, 用于发送给外部客户端"""
+        return {field.name: _to_jsonable(getattr(self, field.name)) for field in fields(self)}
+
+
+def _to_jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, dict):
+        return {str(_to_jsonable(k)): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_to_jsonable(v) for v in value]
+    if hasattr(value, "object_id"):
+        return value.object_id  # 游戏对象只发送 ID
+    if hasattr(value, "__iter__"):
+        return list(value)  # Vector3
+    return str(value)
+
+
+def sum_quantity(merged, data):
+    """合并投递用: 把 data 的 quantity 累加到合并结果上, 其余字段取先到的消息"""
+    merged.quantity += data.quantity
+
+
+# ---------- 星球 ----------
+
+@dataclass(slots=True)
+class WorldAdded(MessagePayload):
+    world: Any
+
+    def describe(self):
+        return f" 星球ID:{self.world.object_id}, 类型:{self.world.world_config.world_id}, 位置:{self.world.location}"
+
+@dataclass(slots=True)
+class WorldRemoved(MessagePayload):
+    world: Any
+
+    def describe(self):
+        return f" 移除星球ID:{self.world.object_id}, 类型:{self.world.world_config.world_id}"
+
+
+# ---------- 事件 ----------
+
+@dataclass(slots=True)
+class EventBegin(MessagePayload):
+    target_type: Any
+    target_id: str
+    event_id: str
+    text_id: str
+
+    def describe(self):
+        return f" 目标类型:{self.target_type.name}, 目标ID:{self.target_id}, 事件ID:{self.event_id}, 文本ID:{self.text_id}"
+
+@dataclass(slots=True)
+class EventPhaseChange(MessagePayload):
+    target_type: Any
+    target_id: str
+    event_id: str
+    phase_id: str
+    text_id: str
+
+    def describe(self):
+        return f" 目标类型:{self.target_type.name}, 目标ID:{self.target_id}, 事件ID:{self.event_id}, 阶段ID:{self.phase_id}"
+
+@dataclass(slots=True)
+class EventNeedOption(MessagePayload):
+    player_id: str
+    event_object_id: int  # 事件对象 ID, 玩家选择时带上以指明是哪个事件
+    event_id: str
+    phase_id: str
+    text_id: str
+    options: Dict  # {option_id: 选项文本ID}
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 事件ID:{self.event_id}, 阶段ID:{self.phase_id}, 选项数:{len(self.options)}"
+
+@dataclass(slots=True)
+class EventEnd(MessagePayload):
+    target_type: Any
+    target_id: str
+    event_id: str
+
+    def describe(self):
+        return f" 目标类型:{self.target_type.name}, 目标ID:{self.target_id}, 事件ID:{self.event_id}"
+
+
+# ---------- 玩家 ----------
+
+@dataclass(slots=True)
+class PlayerSelectEventOption(MessagePayload):
+    player_id: str
+    choice: Any
+    event_object_id: Optional[int] = None  # 选择针对的事件对象 ID, 为 None 时使用玩家身上最早等待选择的事件
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 选择选项:{self.choice}"
+
+@dataclass(slots=True)
+class PlayerResourceChanged(MessagePayload):
+    player_id: str
+    resource: str
+    quantity: float
+
+    def describe(self):
+        # 减少日志量
+        return None
+
+@dataclass(slots=True)
+class PlayerFleetMoveRequest(MessagePayload):
+    player_id: str
+    path: List
+    travel_method: Any
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 路径长度:{len(self.path)}, 方式:{self.travel_method.name}"
+
+@dataclass(slots=True)
+class PlayerFleetLandRequest(MessagePayload):
+    player_id: str
+    world_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 星球ID:{self.world_id}"
+
+@dataclass(slots=True)
+class PlayerFleetTakeoffRequest(MessagePayload):
+    player_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}"
+
+@dataclass(slots=True)
+class PlayerFleetMovementInterrupt(MessagePayload):
+    player_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}"
+
+@dataclass(slots=True)
+class PlayerFleetArrive(MessagePayload):
+    player_id: str
+    location: Any
+    arrival_type: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 位置:{self.location}, 类型:{self.arrival_type}"
+
+@dataclass(slots=True)
+class PlayerExploreWorldRequest(MessagePayload):
+    player_id: str
+    world_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 星球ID:{self.world_id}"
+
+@dataclass(slots=True)
+class PlayerPurchaseRequest(MessagePayload):
+    player_id: str
+    package_name: str
+    quantity: int
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 购买项:{self.package_name}, 数量:{self.quantity}"
+
+@dataclass(slots=True)
+class PurchaseSuccess(MessagePayload):
+    player_id: str
+    package_name: str
+    quantity: int
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 购买成功: {self.package_name} x {self.quantity}"
+
+
+# ---------- 建筑 ----------
+
+@dataclass(slots=True)
+class BuildingStart(MessagePayload):
+    building_id: str
+    world_id: str
+
+    def describe(self):
+        return f" 建筑ID:{self.building_id}, 星球ID:{self.world_id}"
+
+@dataclass(slots=True)
+class BuildingCompleted(MessagePayload):
+    building_id: str
+    world_id: str
+
+    def describe(self):
+        return f" 建筑ID:{self.building_id}, 星球ID:{self.world_id}"
+
+@dataclass(slots=True)
+class BuildingDestroyed(MessagePayload):
+    building_id: str
+    world_id: str
+
+    def describe(self):
+        return f" 建筑ID:{self.building_id}, 所在星球:{self.world_id}"
+
+@dataclass(slots=True)
+class BuildingInsufficientResources(MessagePayload):
+    player_id: str
+    building_config_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 建筑ID:{self.building_config_id}"
+
+@dataclass(slots=True)
+class BuildingFailed(MessagePayload):
+    """资源已经扣除但无法放置/升级建筑, 资源会被退回"""
+    player_id: str
+    building_config_id: str
+    world_id: Optional[str] = None
+    building_id: Optional[str] = None  # 升级时的建筑 ID
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 建筑ID:{self.building_config_id}, 星球ID:{self.world_id}"
+
+@dataclass(slots=True)
+class BuildingRequest(MessagePayload):
+    player_id: str
+    world_id: str
+    building_config_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 星球ID:{self.world_id}, 建筑类型:{self.building_config_id}"
+
+@dataclass(slots=True)
+class BuildingUpgradeRequest(MessagePayload):
+    player_id: str
+    building_id: str
+    building_config_id: str
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 原建筑ID:{self.building_id}, 建筑类型:{self.building_config_id}"
+
+@dataclass(slots=True)
+class BuildingBatchRequest(MessagePayload):
+    player_id: str
+    requests: List[Tuple[str, str]]  # [(world_id, building_config_id), ...]
+
+    def describe(self):
+        return f" 玩家ID:{self.player_id}, 请求数:{len(self.requests)}"
+
+@dataclass(slots=True)
+class BuildingAttributeChanged(MessagePayload):
+    building_id: str
+    attribute: str
+    quantity: float
+
+    def describe(self):
+        # 减少日志量
+        return None
+
+@dataclass(slots=True)
+class BuildingAttributeBatchChanged(MessagePayload):
+    attribute: str
+    changes: Dict[str, float]  # {building_id: quantity}
+
+    def describe(self):
+        return f" 属性:{self.attribute}, 建筑数:{len(self.changes)}"
+
+
+# ---------- Modifier ----------
+
+@dataclass(slots=True)
+class ModifierApplyRequest(MessagePayload):
+    target_id: str
+    modifier_config: Any
+
+    def describe(self):
+        return f" 目标ID:{self.target_id}, 类型:{self.modifier_config.modifier_type.name}, 数值:{self.modifier_config.quantity}"
+
+@dataclass(slots=True)
+class ModifierRemoveRequest(MessagePayload):
+    target_id: str
+    owner_type: Any = None
+    owner_id: Optional[str] = None
+    modifier_type: Any = None
+
+    def describe(self):
+        return f" Type: {self.modifier_type} ,目标:{self.target_id}, 施加者类型: {self.owner_type} , 施加者ID {self.owner_id}"
+
+@dataclass(slots=True)
+class ModifierResponse(MessagePayload):
+    request_id: int
+    status: bool
+
+    def describe(self):
+        return f" 请求ID:{self.request_id}, 状态:{self.status}"
+
+
+# ---------- 规则 ----------
+
+@dataclass(slots=True)
+class IntersectionEvent(MessagePayload):
+    location: Any
+    objects: List[str]
+    crash: bool
+
+    def describe(self):
+        return f" 位置:{self.location}, 对象:{self.objects}, 坠毁:{self.crash}"
@@ -1,24 +1,23 @@
 from basic_types.base_object import BaseObject
 from basic_types.enums import *
 from basic_types.modifier import ModifierConfig, ModifierInstance
+from basic_types.resource import Resource
 from .message_bus import Message, MessageType
+from .messages import BuildingAttributeChanged, ModifierResponse, PlayerResourceChanged
 
 class ModifierManager(BaseObject):
-    _instance = None
-
-    def __new__(cls, game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.game = game
-            cls._instance.game.modifier_manager = cls._instance
-            cls._instance.last_tick = datetime.datetime.now()
-            cls._instance.modifiers= []# type: ignore
-            cls._instance.modifiers_by_target: Dict[str, List[ModifierInstance]] = {} # 优化查找, key: target_id, value: list of ModifierInstance
-            # 订阅消息
-            cls._instance.game.message_bus.subscribe(MessageType.MODIFIER_APPLY_REQUEST, cls._instance.handle_apply_request)
-            # 新增：订阅移除 Modifier 请求
-            cls._instance.game.message_bus.subscribe(MessageType.MODIFIER_REMOVE_REQUEST, cls._instance.handle_remove_request)
-        return cls._instance
+
+    def __init__(self, game):
+        super().__init__()
+        self.game = game
+        self.game.modifier_manager = self
+        self.last_tick = datetime.datetime.now()
+        self.modifiers= []# type: ignore
+        self.modifiers_by_target: Dict[str, List[ModifierInstance]] = {} # 优化查找, key: target_id, value: list of ModifierInstance
+        # 订阅消息
+        self.game.message_bus.subscribe(MessageType.MODIFIER_APPLY_REQUEST, self.handle_apply_request)
+        # 新增：订阅移除 Modifier 请求
+        self.game.message_bus.subscribe(MessageType.MODIFIER_REMOVE_REQUEST, self.handle_remove_request)
 
     def tick(self):
         now = datetime.datetime.now()
@@ -47,17 +46,19 @@ class ModifierManager(BaseObject):
                         if not player:
                             succ = False
                         else:
-                            resource = config.data_type
+                            index = Resource.index_of(config.data_type)
+                            values = player.resources.values
                             # 后续可以展开处理一些可以允许负值的情况
-                            if  player.resources[resource] + quantity >=0:
+                            if index is not None and values[index] + quantity >= 0:
                                 succ = True
-                                player.resources[resource] += quantity
-
-                                self.game.message_bus.post_message(MessageType.PLAYER_RESOURCE_CHANGED, {
-                                "player_id": modifier.target_id,
-                                "resource": config.data_type,
-                                "quantity": quantity
-                            }, self)
+                                values[index] += quantity
+                                self.game.snapshots.mark_player(modifier.target_id)
+
+                                self.game.message_bus.post_message(MessageType.PLAYER_RESOURCE_CHANGED, PlayerResourceChanged(
+                                player_id=modifier.target_id,
+                                resource=config.data_type,
+                                quantity=quantity
+                            ), self)
                             else:
                                 succ = False
 
@@ -72,22 +73,23 @@ class ModifierManager(BaseObject):
                             new_value = old_value + quantity
 
                             setattr(building, attribute, new_value )
+                            self.game.snapshots.mark_building(building.object_id, building.build_on)
 
-                            self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, {
-                                "building_id": modifier.target_id,
-                                "attribute": config.data_type,
-                                "quantity": quantity
-                            }, self)
+                            self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, BuildingAttributeChanged(
+                                building_id=modifier.target_id,
+                                attribute=config.data_type,
+                                quantity=quantity
+                            ), self)
 
                             succ = True
 
                     if modifier.life < config.duration:
                         modifiers_next_round.append(modifier)
                     else:
-                        self.game.message_bus.post_message(MessageType.MODIFIER_RESPONSE, {
-                            "request_id": modifier.request_id,
-                            "status" : succ
-                        }, self)
+                        self.game.message_bus.post_message(MessageType.MODIFIER_RESPONSE, ModifierResponse(
+                            request_id=modifier.request_id,
+                            status=succ
+                        ), self)
                     # 如果是GAIN和LOSS，且已经执行完毕，就不需要添加到下一轮了
 
                 else:
@@ -102,16 +104,24 @@ class ModifierManager(BaseObject):
                             if building_instance.building_config.manpower != 0:
                                 # Habitation 类型建筑不需要manpower, 反而产出population
                                 quantity = quantity * building_instance.manpower / building_instance.building_config.manpower
-                        
-                        expected_value = player.resources[resource] + quantity
-                        if  expected_value >= 0:
-                            player.resources[resource] = expected_value
+
+                        if player is None:
+                            # 分片模式下玩家可能在其他分片, 变化量转交给玩家所在的分片
+                            if not self.game.player_manager.forward_remote_resource(modifier.target_id, resource, quantity):
+                                self.game.log.warn(f"Modifier 目标玩家不存在. player_id{modifier.target_id}")
+                            continue
+
+                        index = Resource.index_of(resource)
+                        values = player.resources.values
+                        if index is not None and values[index] + quantity >= 0:
+                            values[index] += quantity
+                            self.game.snapshots.mark_player(modifier.target_id)
                             self.game.message_bus.post_message(
-                                MessageType.PLAYER_RESOURCE_CHANGED, {
-                                "player_id": modifier.target_id,
-                                "resource": config.data_type,
-                                "quantity": quantity
-                            }, self)
+                                MessageType.PLAYER_RESOURCE_CHANGED, PlayerResourceChanged(
+                                player_id=modifier.target_id,
+                                resource=config.data_type,
+                                quantity=quantity
+                            ), self)
                         else:
                             # TODO 大概率是不够CONSUME了，需要进行处理
                             self.game.log.warn(f"Modifier 作用失败. player_id{modifier.target_id}，resource {config.data_type}, quantity:{quantity}")
@@ -128,21 +138,22 @@ class ModifierManager(BaseObject):
                         old_value = getattr(building, attribute, 0)
                         new_value = old_value + quantity
                         setattr(building, attribute, new_value )
+                        self.game.snapshots.mark_building(building.object_id, building.build_on)
 
-                        self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, {
-                            "building_id": modifier.target_id,
-                            "attribute": config.data_type,
-                            "quantity": quantity
-                        }, self)
+                        self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, BuildingAttributeChanged(
+                            building_id=modifier.target_id,
+                            attribute=config.data_type,
+                            quantity=quantity
+                        ), self)
         finally:
             self.modifiers = modifiers_next_round
 
 
     def handle_apply_request(self, message: Message):
-        modifier_config : ModifierConfig = message.data["modifier_config"]
+        modifier_config : ModifierConfig = message.data.modifier_config
         assert(isinstance(modifier_config, ModifierConfig))
         instance = ModifierInstance(
-            target_id = message.data["target_id"],
+            target_id = message.data.target_id,
             config = modifier_config,
             request_id = message.id,  # 记录消息 ID
             owner_type = message.sender.type, # 记录创建者类型
@@ -158,10 +169,10 @@ class ModifierManager(BaseObject):
 
     def handle_remove_request(self, message: Message):
         """处理移除 Modifier 的请求"""
-        target_id = message.data["target_id"]
-        owner_type = message.data.get("owner_type")
-        owner_id = message.data.get("owner_id")
-        modifier_type = message.data.get("modifier_type")
+        target_id = message.data.target_id
+        owner_type = message.data.owner_type
+        owner_id = message.data.owner_id
+        modifier_type = message.data.modifier_type
 
         modifiers_to_remove = []
 
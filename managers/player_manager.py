@@ -1,32 +1,60 @@
 from basic_types.base_object import BaseObject
 from basic_types.modifier import ModifierConfig
 from basic_types.player import Player
+from basic_types.target_index import TargetIndex
 from basic_types.basic_typs import Vector3
 from basic_types.enums import *
 from common import *
 from loader.resource import Resource
 from .message_bus import MessageType, Message
+from .messages import (
+    BuildingAttributeBatchChanged, BuildingAttributeChanged, BuildingBatchRequest, BuildingRequest, BuildingUpgradeRequest,
+    PlayerExploreWorldRequest, PlayerFleetLandRequest, PlayerFleetMoveRequest, PlayerFleetTakeoffRequest,
+    PlayerPurchaseRequest, PlayerResourceChanged, PlayerSelectEventOption, sum_quantity,
+)
 from .robot import Robot
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 
 class PlayerManager(BaseObject):
-    _instance = None
-
-    def __new__(cls, game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.game = game
-            cls._instance.players: Dict[str, Player] = {} # type: ignore
-            cls._instance.robots: Dict[str, Robot] = {} # type: ignore
-            cls._instance.game.player_manager = cls._instance
-            cls._instance.tick_interval = 1
-            # 新增：存储每个玩家舰队的位置
-            cls._instance.fleet_locations: Dict[Vector3, List[str]] = {} # type: ignore
-            # 订阅消息
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_RESOURCE_CHANGED, cls._instance.handle_player_resource_changed)
-        return cls._instance
+    # 这些操作在一次提交中按类型归并, 一次性交给对应的管理器
+    BATCHED_ACTIONS = (PlayerAction.BUILD, PlayerAction.ALLOCATE_MANPOWER)
+    # 各操作必需的字段及其类型, 用于校验外部提交的操作 (对象 ID 可以是整数或字符串)
+    ACTION_FIELDS = {
+        PlayerAction.MOVE: {"path": list, "travel_method": TravelMethod},
+        PlayerAction.LAND: {"world_id": (int, str)},
+        PlayerAction.TAKEOFF: {},
+        PlayerAction.BUILD: {"planet_id": (int, str), "building_config_id": str},
+        PlayerAction.UPGRADE: {"building_id": (int, str), "building_config_id": str},
+        PlayerAction.CHOICE: {"choice": (int, str)},
+        PlayerAction.EXPLORE: {"world_id": (int, str)},
+        PlayerAction.PURCHASE: {"name": str, "quantity": int},
+        PlayerAction.ALLOCATE_MANPOWER: {"building_id": (int, str), "amount": (int, float)},
+    }
+
+    def __init__(self, game):
+        super().__init__()
+        self.game = game
+        self.players: Dict[str, Player] = {} # type: ignore
+        self.robots: Dict[str, Robot] = {} # type: ignore
+        self.targets = TargetIndex()  # 所有玩家的 ID, 用于随机选取事件目标
+        self.game.player_manager = self
+        self.tick_interval = 1
+        # 机器人并行思考的线程数, 1 表示在主线程依次思考
+        self.robot_workers = 1
+        self._robot_executor = None
+        # 新增：存储每个玩家舰队的位置
+        self.fleet_locations: Dict[Vector3, List[str]] = {} # type: ignore
+        # 分片模式: 在其他分片上的玩家, 以及本 tick 需要转交给他们的资源变化 {player_id: {resource: quantity}}
+        self.remote_players: Set[str] = set() # type: ignore
+        self.remote_resource_deltas: Dict[str, Dict[str, float]] = {} # type: ignore
+        # 订阅消息
+        self.game.message_bus.subscribe_coalesced(MessageType.PLAYER_RESOURCE_CHANGED, self.handle_player_resource_changed,
+                                                           key=lambda data: (data.player_id, data.resource), merge=sum_quantity)
 
     def create_player(self, resources, building_configs, purchase_configs): 
-        player = Player(resources, building_configs, purchase_configs)
+        with self.game.activated():
+            player = Player(resources, building_configs, purchase_configs)
         initial_world_id = self.game.world_manager.pick()
         initial_world = self.game.world_manager.get_world_by_id(initial_world_id)
         if initial_world:
@@ -52,6 +80,8 @@ class PlayerManager(BaseObject):
     
     def add_player(self, player: Player):
         self.players[player.object_id] = player
+        self.targets.add(player.object_id)
+        self.game.snapshots.mark_player(player.object_id)
 
     def remove_player(self, player_id: str):
         if player_id in self.players:
@@ -62,9 +92,49 @@ class PlayerManager(BaseObject):
                 if not self.fleet_locations[player.fleet.location]:
                     del self.fleet_locations[player.fleet.location]
             del self.players[player_id]
+            self.targets.remove(player_id)
+            self.game.snapshots.mark_player(player_id)
 
     def get_player_by_id(self, player_id: str) -> Optional[Player]:
         return self.players.get(player_id)
+
+    def detach_player(self, player_id: str) -> Tuple[Player, Optional[Robot]]:
+        """把玩家 (以及他的机器人) 从本管理器中移出, 之后该玩家视为在其他分片上"""
+        player = self.players[player_id]
+        robot = self.robots.pop(player_id, None)
+        self.remove_player(player_id)
+        self.remote_players.add(player_id)
+        return player, robot
+
+    def attach_player(self, player: Player, robot: Optional[Robot] = None):
+        """接收从其他分片移交过来的玩家"""
+        self.remote_players.discard(player.object_id)
+        self.add_player(player)
+        self.fleet_locations.setdefault(player.fleet.location, []).append(player.object_id)
+        if robot is not None:
+            self.robots[player.object_id] = robot
+
+    def forward_remote_resource(self, player_id: str, resource: str, quantity: float) -> bool:
+        """记录需要转交给其他分片上玩家的资源变化, 玩家不在其他分片时返回 False"""
+        if player_id not in self.remote_players:
+            return False
+        deltas = self.remote_resource_deltas.setdefault(player_id, {})
+        deltas[resource] = deltas.get(resource, 0) + quantity
+        return True
+
+    def take_remote_resource_deltas(self) -> Dict[str, Dict[str, float]]:
+        deltas, self.remote_resource_deltas = self.remote_resource_deltas, {}
+        return deltas
+
+    def apply_remote_resource_deltas(self, deltas: Dict[str, Dict[str, float]]):
+        """应用其他分片转交过来的资源变化, 资源不会因此变为负数"""
+        for player_id, changes in deltas.items():
+            player = self.players.get(player_id)
+            if not player:
+                continue
+            for resource, quantity in changes.items():
+                player.resources[resource] = max(player.resources.get(resource, 0) + quantity, 0)
+            self.game.snapshots.mark_player(player_id)
     
     def update_fleet_location(self, player_id: str, old_location: Vector3, new_location: Vector3):
         """更新玩家舰队的位置"""
@@ -79,101 +149,228 @@ class PlayerManager(BaseObject):
             self.fleet_locations[new_location] = []
         self.fleet_locations[new_location].append(player_id)
 
+    @classmethod
+    def validate_action(cls, action_data) -> Optional[str]:
+        """检查操作数据是否完整, 返回问题描述, 没有问题时返回 None"""
+        if not isinstance(action_data, dict):
+            return "操作数据不是字典"
+        action = action_data.get("action")
+        fields = cls.ACTION_FIELDS.get(action) if isinstance(action, PlayerAction) else None
+        if fields is None:
+            return f"未知的操作类型: {action}"
+        if "player_id" not in action_data:
+            return "缺少字段 player_id"
+        for field, field_type in fields.items():
+            if field not in action_data:
+                return f"{action.name} 缺少字段 {field}"
+            value = action_data[field]
+            if isinstance(value, bool) or not isinstance(value, field_type):
+                return f"{action.name} 的字段 {field} 类型错误: {value!r}"
+        if action == PlayerAction.MOVE and not all(isinstance(location, Vector3) for location in action_data["path"]):
+            return "MOVE 的路径必须是坐标列表"
+        if action == PlayerAction.PURCHASE and action_data["quantity"] <= 0:
+            return f"PURCHASE 的数量必须为正数: {action_data['quantity']}"
+        if action == PlayerAction.ALLOCATE_MANPOWER and not math.isfinite(action_data["amount"]):
+            return f"ALLOCATE_MANPOWER 的人力数量无效: {action_data['amount']}"
+        return None
+
     def process_action_data(self, action_data):
         """处理操作数据，发送消息"""
         action = action_data['action']
 
         if action == PlayerAction.MOVE:
             # 发送 PLAYER_FLEET_MOVE_REQUEST 消息
-            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_MOVE_REQUEST, {
-                "player_id": action_data["player_id"],
-                "path": action_data["path"],
-                "travel_method": action_data["travel_method"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_MOVE_REQUEST, PlayerFleetMoveRequest(
+                player_id=action_data["player_id"],
+                path=action_data["path"],
+                travel_method=action_data["travel_method"],
+            ), self)
 
         # 处理降落请求
         elif action == PlayerAction.LAND:
-            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_LAND_REQUEST, {
-                "player_id": action_data["player_id"],
-                "world_id": action_data["world_id"]
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_LAND_REQUEST, PlayerFleetLandRequest(
+                player_id=action_data["player_id"],
+                world_id=action_data["world_id"]
+            ), self)
         # 新增起飞
         elif action == PlayerAction.TAKEOFF:
-            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_TAKEOFF_REQUEST, {
-                "player_id": action_data["player_id"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_FLEET_TAKEOFF_REQUEST, PlayerFleetTakeoffRequest(
+                player_id=action_data["player_id"],
+            ), self)
 
         elif action == PlayerAction.BUILD:
-            self.game.message_bus.post_message(MessageType.BUILDING_REQUEST, {
-                "player_id": action_data["player_id"],
-                "world_id": action_data["planet_id"],
-                "building_config_id": action_data["building_config_id"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.BUILDING_REQUEST, BuildingRequest(
+                player_id=action_data["player_id"],
+                world_id=action_data["planet_id"],
+                building_config_id=action_data["building_config_id"],
+            ), self)
 
         elif action == PlayerAction.UPGRADE:
-            self.game.message_bus.post_message(MessageType.BUILDING_UPGRADE_REQUEST, {
-                "player_id": action_data["player_id"],
-                "building_id": action_data["building_id"],
-                "building_config_id": action_data["building_config_id"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.BUILDING_UPGRADE_REQUEST, BuildingUpgradeRequest(
+                player_id=action_data["player_id"],
+                building_id=action_data["building_id"],
+                building_config_id=action_data["building_config_id"],
+            ), self)
 
         elif action == PlayerAction.CHOICE:
-            self.game.message_bus.post_message(MessageType.PLAYER_SELECT_EVENT_OPTION, {
-                "player_id": action_data["player_id"],
-                "choice": action_data["choice"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_SELECT_EVENT_OPTION, PlayerSelectEventOption(
+                player_id=action_data["player_id"],
+                choice=action_data["choice"],
+                event_object_id=action_data.get("event_object_id"),
+            ), self)
 
         elif action == PlayerAction.EXPLORE:
-            self.game.message_bus.post_message(MessageType.PLAYER_EXPLORE_WORLD_REQUEST, {
-                "player_id": action_data["player_id"],
-                "world_id": action_data["world_id"],
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_EXPLORE_WORLD_REQUEST, PlayerExploreWorldRequest(
+                player_id=action_data["player_id"],
+                world_id=action_data["world_id"],
+            ), self)
             
         elif action == PlayerAction.PURCHASE: #修改这里
-            self.game.message_bus.post_message(MessageType.PLAYER_PURCHASE_REQUEST, { #修改这里
-                "player_id": action_data["player_id"],
-                "package_name": action_data["name"],
-                "quantity" : action_data["quantity"]
-            }, self)
+            self.game.message_bus.post_message(MessageType.PLAYER_PURCHASE_REQUEST, PlayerPurchaseRequest( #修改这里
+                player_id=action_data["player_id"],
+                package_name=action_data["name"],
+                quantity=action_data["quantity"]
+            ), self)
 
         elif action == PlayerAction.ALLOCATE_MANPOWER:
             self.allocate_manpower(action_data["player_id"], action_data["building_id"], action_data["amount"])
 
-    def handle_player_resource_changed(self, message: Message):
+    def handle_player_resource_changed(self, changes: List[PlayerResourceChanged]):
         """
         处理玩家资源变化的消息 (由 ModifierManager 发送)
+        每 tick 合并投递一次, 每个 (玩家, 资源) 只有一条净变化
         """
         pass
 
 
+    def process_actions(self, actions: List[Dict]):
+        """
+        处理一次提交的操作列表, 按提交顺序执行。
+        连续的同类可批量操作 (同一玩家的建造、人力分配) 归并为一批一次性提交, 其余操作逐条处理;
+        遇到其他操作时先提交已归并的一批, 不会改变操作之间的先后顺序。
+        字段不完整或类型不对的操作记录日志后跳过。
+        """
+        batch_key: Optional[Tuple[PlayerAction, str]] = None
+        batch: List[Dict] = []
+        for action_data in actions:
+            problem = self.validate_action(action_data)
+            if problem is not None:
+                self.game.log.warn(f"忽略无效的操作: {problem}")
+                continue
+            action = action_data['action']
+            key = (action, action_data["player_id"]) if action in self.BATCHED_ACTIONS else None
+            if batch and key != batch_key:
+                self._submit_batch(batch_key, batch)
+                batch = []
+            if key is None:
+                self.process_action_data(action_data)
+            else:
+                batch_key = key
+                batch.append(action_data)
+        if batch:
+            self._submit_batch(batch_key, batch)
+
+    def _submit_batch(self, batch_key: Tuple[PlayerAction, str], batch: List[Dict]):
+        action, player_id = batch_key
+        if action == PlayerAction.BUILD:
+            self.game.message_bus.post_message(MessageType.BUILDING_BATCH_REQUEST, BuildingBatchRequest(
+                player_id=player_id,
+                requests=[(action_data["planet_id"], action_data["building_config_id"]) for action_data in batch],
+            ), self)
+        elif action == PlayerAction.ALLOCATE_MANPOWER:
+            self.allocate_manpower_batch(player_id, [(action_data["building_id"], action_data["amount"]) for action_data in batch])
+
     def allocate_manpower(self,player_id, building_id: str, amount: int):
         """
         向指定建筑分配人力。
         """
         building = self.game.building_manager.get_building_by_id(building_id)
-        if not building:
+        if not building or not self._can_allocate_manpower(player_id, building, amount):
             return
 
-        world_id = building.build_on
-        if world_id not in self.players[player_id].manpower_allocation:
-            self.players[player_id].manpower_allocation[world_id] = {}
-
         # 更新 Player 的 manpower_allocation
-        self.players[player_id].manpower_allocation[world_id][building_id] = \
-            self.players[player_id].manpower_allocation.get(world_id, {}).get(building_id, 0) + amount
+        self.players[player_id].allocate_manpower(building.build_on, building_id, amount)
 
         # 发送 BUILDING_ATTRIBUTE_CHANGED 消息
-        self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, {
-            "building_id": building_id,
-            "attribute": "manpower",
-            "quantity": amount,  # 正数表示增加，负数表示减少
-        }, self)
+        self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_CHANGED, BuildingAttributeChanged(
+            building_id=building_id,
+            attribute="manpower",
+            quantity=amount,  # 正数表示增加，负数表示减少
+        ), self)
+
+    def _can_allocate_manpower(self, player_id, building, amount, pending: int = 0) -> bool:
+        """
+        只能调整自己星球上的建筑, 调整后的人力不能为负数。
+        pending: 同一批次中已经累计的对该建筑的调整
+        """
+        if not math.isfinite(amount):
+            return False
+        world = self.game.world_manager.get_world_by_id(building.build_on)
+        if not world or world.owner != player_id:
+            self.game.log.warn(f"玩家 {player_id} 尝试向不属于自己的建筑 {building.object_id} 分配人力")
+            return False
+        if building.manpower + pending + amount < 0:
+            return False
+        return True
+
+    def allocate_manpower_batch(self, player_id, allocations: List[Tuple[str, int]]):
+        """
+        批量分配人力 [(building_id, amount), ...], 只发送一条 BUILDING_ATTRIBUTE_BATCH_CHANGED 消息。
+        """
+        player = self.players.get(player_id)
+        if not player:
+            return
+
+        changes: Dict[str, int] = {}
+        player_allocations = []
+        for building_id, amount in allocations:
+            building = self.game.building_manager.get_building_by_id(building_id)
+            if not building or not self._can_allocate_manpower(player_id, building, amount, changes.get(building_id, 0)):
+                continue
+            player_allocations.append((building.build_on, building_id, amount))
+            changes[building_id] = changes.get(building_id, 0) + amount
+
+        if not changes:
+            return
+
+        player.reallocate_manpower(player_allocations)
+        self.game.message_bus.post_message(MessageType.BUILDING_ATTRIBUTE_BATCH_CHANGED, BuildingAttributeBatchChanged(
+            attribute="manpower",
+            changes=changes,  # {building_id: quantity}
+        ), self)
 
     def pick(self):
-        if self.players:
-            return random.choice(list(self.players.keys()))
-        return None
+        return self.targets.pick()
     
+    def set_robot_workers(self, workers: int):
+        """
+        设置机器人并行思考的线程数。
+        思考是纯 Python 的计算, 受 GIL 限制, 寻路 (Pathfinder.find_path) 也是串行的,
+        多线程只能让各机器人的思考相互穿插, 不能利用多个核心; 需要利用多核时使用分片模式 (--shards)。
+        """
+        self.robot_workers = max(1, workers)
+        if self._robot_executor:
+            self._robot_executor.shutdown(wait=True)
+            self._robot_executor = None
+
+    def think_robots(self) -> List[Tuple[str, Optional[List[Dict]]]]:
+        """
+        让所有机器人基于本tick的同一份世界状态思考。
+        思考阶段只读取状态, 产生的操作在全部机器人思考完成后才统一处理,
+        结果按机器人 ID 排序返回, 保证运行结果与线程调度无关。
+        """
+        robot_ids = sorted(self.robots.keys())
+        robots = [self.robots[robot_id] for robot_id in robot_ids]
+        if self.robot_workers > 1 and len(robots) > 1:
+            if self._robot_executor is None:
+                self._robot_executor = ThreadPoolExecutor(max_workers=self.robot_workers, thread_name_prefix="robot")
+            # 工作线程沿用当前上下文 (对象表等), 每个任务各用一份副本
+            context = contextvars.copy_context()
+            results = list(self._robot_executor.map(lambda robot: context.copy().run(robot.tick, self.game), robots))
+        else:
+            results = [robot.tick(self.game) for robot in robots]
+        return list(zip(robot_ids, results))
+
     def tick(self):
         for player_id, player in self.players.items():
             player.calculate_available_manpower()
@@ -182,11 +379,8 @@ class PlayerManager(BaseObject):
 
             actions = player.tick(self.game)
             if actions is not None:
-                for action in actions:
-                    self.process_action_data(action)
+                self.process_actions(actions)
 
-        for robot_id, robot in self.robots.items():
-            actions = robot.tick(self.game)
+        for robot_id, actions in self.think_robots():
             if actions is not None:
-                for action in actions:
-                    self.process_action_data(action)
\ No newline at end of file
+                self.process_actions(actions)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from basic_types.enums import *
 from basic_types.resource import Resource
+from profiler import NULL_STOPWATCH
 from common import *
 import heapq
 
@@ -9,11 +10,26 @@ class Dest():
         self.value = value
 
 class Robot():
+    EXPLORE_CANDIDATES = 32  # 探索目标的近邻候选数量
+    EXPLORE_TOP_K = 8  # 每次思考最多返回的探索目标数量
+    MANPOWER_REBALANCE_THINKS = 30  # 每隔多少次思考做一次全局人力重分配
+    # 星球槽位价值权重
+    SLOT_WEIGHTS = {
+        BuildingType.RESOURCE: 0.8,
+        BuildingType.GENERAL: 0.5,
+        BuildingType.DEFENSE: 0.3,
+    }
+
     def __init__(self, player_id, game):
         self.object_id = player_id
         self.last_think = datetime.datetime.now()
         self.game = game
         self.dest : Dest = None
+        # 每个机器人独立的随机源, 并行思考时决策不依赖线程调度顺序
+        self.random = random.Random(player_id)
+        # 星球槽位价值只取决于静态的 building_slots, 缓存起来 {world_id: value}
+        self._planet_slot_values: Dict[str, float] = {}
+        self._thinks_since_rebalance = 0
 
     # 这里要做成一个tick内的判断，rule里也要对应修改
     def can_afford_building_cost(self, player, building_config):
@@ -102,7 +118,7 @@ class Robot():
             )
         ]
         if key_resource_buildings:
-            return random.choice(key_resource_buildings)
+            return self.random.choice(key_resource_buildings)
 
         resource_buildings = [
             b for b in level_1_buildings
@@ -113,13 +129,13 @@ class Robot():
             )
         ]
         if resource_buildings:
-            return random.choice(resource_buildings)
+            return self.random.choice(resource_buildings)
 
         # --- General 建筑选择 ---
         general_buildings = [b for b in level_1_buildings if b.type == BuildingType.GENERAL]
         if general_buildings:
             # 人口阈值 (示例：75%)
-            population_threshold = 0.75 * player.resources.get(Resource.get_resource_by_id("resource.population"), 0)
+            population_threshold = 0.75 * player.resources.get("resource.population", 0)
 
             if player.available_manpower < population_threshold:
                 # 人口不足，优先人口建筑
@@ -130,18 +146,18 @@ class Robot():
                            if modifier.modifier_type == ModifierType.PRODUCTION)
                 ]
                 if population_buildings:
-                    return random.choice(population_buildings)
+                    return self.random.choice(population_buildings)
 
             # 达到人口阈值，或没有可用的人口建筑，考虑配额
             # (简化实现：只在人口充足时才建造其他 General 建筑)
             if player.available_manpower >= population_threshold:
                 # 随机选择 (TODO: 未来可以根据配额更智能地选择)
-                return random.choice(general_buildings)
+                return self.random.choice(general_buildings)
             else:
                 return None
 
         # --- 其他情况 ---
-        return random.choice(level_1_buildings)  # 兜底
+        return self.random.choice(level_1_buildings)  # 兜底
         
     def calculate_building_upgrade_benefit(self, building_instance):
         """计算建筑升级的收益 (考虑多种升级路径和资源稀缺度)"""
@@ -237,26 +253,27 @@ class Robot():
 
         return best_building, best_benefit[1] # 如果没有值得升级的建筑，则返回 None
 
-    def evaluate_planet(self, planet):
+    def get_planet_slot_value(self, planet):
+        """星球槽位价值 (带缓存)"""
+        value = self._planet_slot_values.get(planet.object_id)
+        if value is None:
+            value = 0
+            for slot_type, slots in planet.building_slots.items():
+                # resource 类型是二级字典, general 和 defense 类型直接是槽位数量
+                num_slots = sum(slots.values()) if isinstance(slots, dict) else slots
+                value += num_slots * self.SLOT_WEIGHTS.get(slot_type, 0)
+            self._planet_slot_values[planet.object_id] = value
+        return value
+
+    def evaluate_planet(self, planet, distance=None):
         """评估星球的价值"""
         # 资源价值
-        resource_value = 0
-        for slot_type, slots in planet.building_slots.items():
-            # 根据槽位类型给予不同的权重 (可以根据您的游戏设计调整)
-            if slot_type == "resource":
-                # resource 类型需要累加二级字典中的所有值
-                for subtype, num_slots in slots.items():
-                    resource_value += num_slots * 0.8  # 资源槽位权重较高
-            elif slot_type == "general":
-                for subtype, num_slots in slots.items():
-                    resource_value += num_slots * 0.5  # 资源槽位权重较高
-            elif slot_type == "defense":
-                for subtype, num_slots in slots.items():
-                    resource_value += num_slots * 0.3  # 资源槽位权重较高
+        resource_value = self.get_planet_slot_value(planet)
 
         # 战略位置 (简化：距离出生点越近，价值越高)
-        player = self.game.player_manager.get_player_by_id(self.object_id)
-        distance = player.fleet.location.distance(planet.location)
+        if distance is None:
+            player = self.game.player_manager.get_player_by_id(self.object_id)
+            distance = player.fleet.location.distance(planet.location)
         strategic_value = 10 / (distance + 1)  # 避免除以零
 
         # 总价值
@@ -266,52 +283,44 @@ class Robot():
     def select_planet_to_explore(self):
         """选择要探索的星球 (返回星球列表，按优先级排序)"""
         player = self.game.player_manager.get_player_by_id(self.object_id)
-        # 获取未探索的星球
-        unexplored_planets = [
-            self.game.world_manager.get_world_by_id(planet_id)
-            for planet_id in self.game.world_manager.world_instances.keys()
-            if planet_id not in player.explored_planets and planet_id != player.fleet.landed_on
-        ]
+        fleet_location = player.fleet.location
+
+        # 只在舰队附近的未探索星球中挑选
+        candidates = self.game.world_manager.get_nearest_worlds(
+            fleet_location,
+            self.EXPLORE_CANDIDATES,
+            lambda world: world.object_id not in player.explored_planets and world.object_id != player.fleet.landed_on
+        )
 
-        if not unexplored_planets:
+        if not candidates:
             return []
 
-        # 根据距离和潜在价值进行评估，并排序
+        # 根据距离和潜在价值进行评估, 只取分数最高的 k 个
         planet_scores = []
-        for planet in unexplored_planets:
-            if not planet:
-                continue
-            distance = player.fleet.location.distance(planet.location)
-            potential_value = self.evaluate_planet(planet)  # 评估星球价值
+        for planet in candidates:
+            distance = fleet_location.distance(planet.location)
+            potential_value = self.evaluate_planet(planet, distance)  # 评估星球价值
             score = potential_value / (distance + 1)  # 距离越近，价值越高
-            planet_scores.append((planet, score))
+            planet_scores.append((score, planet.object_id, planet))
 
-        # 按分数从高到低排序
-        planet_scores.sort(key=lambda x: x[1], reverse=True)
-        return [planet for planet, score in planet_scores]
+        return [planet for _, _, planet in heapq.nlargest(self.EXPLORE_TOP_K, planet_scores)]
 
     def handle_event(self):
         """处理当前发生的事件 (简化版)"""
         player = self.game.player_manager.get_player_by_id(self.object_id)
-        # 获取当前玩家的事件
-        event = self.game.event_manager.active_events[ObjectType.PLAYER].get(player.object_id)
+        # 获取当前玩家需要选择的事件
+        event = self.game.event_manager.get_pending_choice_event(player.object_id)
         if not event:
             return None
 
-        current_phase = event.current_phase
-        if not current_phase:
-            return None
-
-        # 如果需要选择选项，则随机选择一个
-        if current_phase.options and current_phase.phase_id not in event.choices:
-            choice = random.choice(list(current_phase.options.keys()))
-            return {
-                "action": PlayerAction.CHOICE,
-                "player_id": player.object_id,
-                "choice": choice,
-            }
-
-        return None
+        # 随机选择一个选项
+        choice = self.random.choice(list(event.current_phase.options.keys()))
+        return {
+            "action": PlayerAction.CHOICE,
+            "player_id": player.object_id,
+            "event_object_id": event.object_id,
+            "choice": choice,
+        }
     
     def purchase_rare_resources(self):
             """尝试购买稀有资源"""
@@ -359,39 +368,87 @@ class Robot():
 
         return priority
 
+    def resource_weight(self, player, resource_id):
+        """资源权重 (越稀缺权重越高)"""
+        resource_amount = player.resources.get(resource_id, 1)
+        return 1 / resource_amount if resource_amount > 0 else 100
+
+    def calculate_marginal_value(self, building_instance, player):
+        """建筑上每名工人的边际产出价值 (产出和消耗都与投入的人力成正比)"""
+        building_config = building_instance.building_config
+        if building_config.manpower <= 0 or building_instance.remaining_secs > 0:
+            # 不需要人力, 或者还在建造中没有产出
+            return 0
+
+        value = 0
+        for modifier in building_config.modifier_configs:
+            if modifier.modifier_type == ModifierType.PRODUCTION:
+                value += modifier.quantity * self.resource_weight(player, modifier.data_type)
+            elif modifier.modifier_type == ModifierType.CONSUME:
+                value -= modifier.quantity * self.resource_weight(player, modifier.data_type)
+        return value / building_config.manpower
+
+    def solve_manpower_allocation(self, player, buildings, reallocate):
+        """
+        求解人力分配, 返回 {building_id: 目标人力}。
+        每名工人在同一建筑上的价值相同, 约束只有各建筑的人力上限和总人口,
+        因此这个有界背包 (线性规划) 按单位价值从高到低填满即为最优解。
+        reallocate 为 False 时只分配空闲人力, 不从已有建筑中抽调。
+        """
+        capacity = player.available_manpower
+        if reallocate:
+            capacity += sum(building_instance.manpower for building_instance in buildings)
+
+        targets = {}
+        candidates = []  # (-value, -priority, building_id, building_instance)
+        for building_instance in buildings:
+            floor = 0 if reallocate else building_instance.manpower
+            targets[building_instance.object_id] = floor
+            value = self.calculate_marginal_value(building_instance, player)
+            if value >= 0 and building_instance.building_config.manpower > floor:
+                priority = self.calculate_building_priority(building_instance, player)
+                candidates.append((-value, -priority, building_instance.object_id, building_instance))
+
+        # 只弹出实际用得上的候选, 代价与发生变化的建筑数量相关
+        heapq.heapify(candidates)
+        while candidates and capacity > 0:
+            _, _, building_id, building_instance = heapq.heappop(candidates)
+            allocate_count = min(capacity, building_instance.building_config.manpower - targets[building_id])
+            targets[building_id] += allocate_count
+            capacity -= allocate_count
+
+        return targets
+
     def allocate_manpower(self):
-        """分配人力 (全局视角)"""
+        """分配人力 (全局视角), 只对人力发生变化的建筑发出调整"""
         player = self.game.player_manager.get_player_by_id(self.object_id)
-        if player.available_manpower <= 0:
+        self._thinks_since_rebalance += 1
+        reallocate = self._thinks_since_rebalance >= self.MANPOWER_REBALANCE_THINKS
+        if player.available_manpower <= 0 and not reallocate:
             return None
-
-        building_queue = []  # 优先级队列 (-priority, building_id, building_instance)
-
-        for world_id in player.explored_planets:
-            world = self.game.world_manager.get_world_by_id(world_id)
-            if not world:
-                continue
-
-            for building_instance in self.game.building_manager.get_buildings_on_world(world_id):
-                if building_instance.manpower < building_instance.building_config.manpower:
-                    priority = self.calculate_building_priority(building_instance, player)
-                    heapq.heappush(building_queue, (-priority, building_instance.object_id, building_instance))
+        if reallocate:
+            self._thinks_since_rebalance = 0
+
+        # 只考虑自己拥有的星球 (其他玩家后来探索的星球归属会转移)
+        buildings = [
+            building_instance
+            for world in map(self.game.world_manager.get_world_by_id, player.explored_planets)
+            if world and world.owner == player.object_id  # 分片模式下星球可能在其他分片
+            for building_instance in self.game.building_manager.get_buildings_on_world(world.object_id)
+            if building_instance.building_config.manpower > 0
+        ]
+        targets = self.solve_manpower_allocation(player, buildings, reallocate)
 
         actions = []
-        available_manpower = player.available_manpower  # 创建本地副本
-
-        while building_queue and available_manpower > 0:  # 使用本地副本
-            _, _, building_instance = heapq.heappop(building_queue)  # 取出时忽略 building_id
-            delta = building_instance.building_config.manpower - building_instance.manpower
-            allocate_count = min(available_manpower, delta)  # 使用本地副本
-
-            actions.append({
-                "action": PlayerAction.ALLOCATE_MANPOWER,
-                "player_id": player.object_id,
-                "building_id": building_instance.object_id,
-                "amount": allocate_count,
-            })
-            available_manpower -= allocate_count  # 更新本地副本
+        for building_instance in buildings:
+            delta = targets[building_instance.object_id] - building_instance.manpower
+            if delta != 0:
+                actions.append({
+                    "action": PlayerAction.ALLOCATE_MANPOWER,
+                    "player_id": player.object_id,
+                    "building_id": building_instance.object_id,
+                    "amount": delta,
+                })
 
         return actions if actions else None
 
@@ -402,6 +459,8 @@ class Robot():
         #    return
         
         self.last_think = now
+        profiler = self.game.profiler
+        laps = profiler.stopwatch("robot.think") if profiler is not None else NULL_STOPWATCH
         actions = []
         player = self.game.player_manager.get_player_by_id(self.object_id)
         self.game.log.info(f"Robot {player.object_id} 开始思考...")
@@ -466,7 +525,7 @@ class Robot():
             planets_to_explore = self.select_planet_to_explore()
             if planets_to_explore:
                 for planet in planets_to_explore:
-                    end_location = planet.get_spawn_location()
+                    end_location = planet.get_spawn_location(self.random)
                     if not end_location:
                         self.game.log.warn(
                             f"Robot {player.object_id} 无法找到星球 {planet.object_id} 的可到达位置, 跳过该星球。")
@@ -509,13 +568,14 @@ class Robot():
                     self.game.log.warn(f"Robot {player.object_id} 已遍历所有目标星球，所有目标都无法到达。")
             else:
                 self.game.log.warn(f"Robot {player.object_id} 没有找到合适的移动目标。")
+        laps.lap("move")
 
- 
         # 处理事件
         event_action = self.handle_event()
         if event_action:
             self.game.log.info(f"Robot {player.object_id} 选择处理事件: ")
             actions.append(event_action)
+        laps.lap("event")
 
         # 尝试升级
         building_instance, next_level_building_config = self.select_building_to_upgrade()
@@ -527,6 +587,7 @@ class Robot():
                 "player_id": player.object_id,
                 "building_config_id": next_level_building_config.config_id,
             })
+        laps.lap("upgrade")
 
         # 尝试建造
         explored_planets = [self.game.world_manager.get_world_by_id(pid) for pid in player.explored_planets]
@@ -545,10 +606,13 @@ class Robot():
                         "building_config_id": building_config.config_id,
                         "player_id": player.object_id
                     })
+        laps.lap("build")
+
         # 尝试分配人力
         manpower_action = self.allocate_manpower()
         if manpower_action:
             actions.extend(manpower_action)
+        laps.lap("manpower")
 
         # 尝试购买稀有资源
         player = self.game.player_manager.get_player_by_id(self.object_id)
@@ -557,6 +621,7 @@ class Robot():
             if purchase_action:
                 self.game.log.info(f"Robot {player.object_id} 决定购买稀有资源。")
                 actions.append(purchase_action)
+        laps.lap("purchase")
 
         return actions
 
@@ -5,30 +5,28 @@ from basic_types.resource import Resource
 from common import *
 from basic_types.enums import *
 from .message_bus import MessageType, Message
+from .messages import IntersectionEvent, ModifierApplyRequest, PlayerFleetArrive, PlayerFleetMovementInterrupt
 import datetime
 
 
 class RulesManager(BaseObject):
-    _instance = None
 
     SUBSPACE_JUMP_COST = 10  # 假设的跃迁消耗
     ACTION_POINTS_PER_DISTANCE = 1
 
-    def __new__(cls, game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.game = game
-            cls._instance.game.rule_manager = cls._instance
-            cls._instance.fleet_spacetime = {}
+    def __init__(self, game):
+        super().__init__()
+        self.game = game
+        self.game.rule_manager = self
+        self.fleet_spacetime = {}
 
-            # 订阅消息
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_FLEET_MOVE_REQUEST, cls._instance.handle_fleet_move_request)
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_FLEET_MOVEMENT_INTERRUPT, cls._instance.handle_fleet_movement_interrupt)
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_FLEET_LAND_REQUEST, cls._instance.handle_fleet_land_request)
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_FLEET_TAKEOFF_REQUEST, cls._instance.handle_fleet_takeoff_request)
-            cls._instance.game.message_bus.subscribe(MessageType.PLAYER_EXPLORE_WORLD_REQUEST, cls._instance.handle_explore_world_request)
+        # 订阅消息
+        self.game.message_bus.subscribe(MessageType.PLAYER_FLEET_MOVE_REQUEST, self.handle_fleet_move_request)
+        self.game.message_bus.subscribe(MessageType.PLAYER_FLEET_MOVEMENT_INTERRUPT, self.handle_fleet_movement_interrupt)
+        self.game.message_bus.subscribe(MessageType.PLAYER_FLEET_LAND_REQUEST, self.handle_fleet_land_request)
+        self.game.message_bus.subscribe(MessageType.PLAYER_FLEET_TAKEOFF_REQUEST, self.handle_fleet_takeoff_request)
+        self.game.message_bus.subscribe(MessageType.PLAYER_EXPLORE_WORLD_REQUEST, self.handle_explore_world_request)
 
-        return cls._instance
 
     def tick(self):
         # 1. 处理碰撞检测
@@ -49,11 +47,11 @@ class RulesManager(BaseObject):
                 if self.game.world_manager.is_impenetrable(fleet.location):
                     world_id = self.game.world_manager.impenetrable_locations.get(fleet.location)
                     # 触发坠毁逻辑 (这里只是发送一个消息)
-                    self.game.message_bus.post_message(MessageType.INTERSECTION_EVENT, {
-                        "location": fleet.location,
-                        "objects": [player_id, world_id],  # 坠毁只涉及舰队和星球
-                        "crash": True  # 添加一个标志，表示坠毁
-                    }, self)
+                    self.game.message_bus.post_message(MessageType.INTERSECTION_EVENT, IntersectionEvent(
+                        location=fleet.location,
+                        objects=[player_id, world_id],  # 坠毁只涉及舰队和星球
+                        crash=True  # 添加一个标志，表示坠毁
+                    ), self)
                     # 可以在这里添加其他处理逻辑，例如：
                     # - 扣除舰队的耐久度
                     # - 将舰队从游戏中移除
@@ -65,32 +63,32 @@ class RulesManager(BaseObject):
                     if player_id != other_player_id:  # 排除自己
                         other_fleet = other_player.fleet
                         if fleet.location == other_fleet.location:
-                            self.game.message_bus.post_message(MessageType.INTERSECTION_EVENT, {
-                                "location": fleet.location,
-                                "objects": [player_id, other_player_id],  # 所有相交的舰队 ID
-                                "crash": False  # 不会坠毁
-                            }, self)
+                            self.game.message_bus.post_message(MessageType.INTERSECTION_EVENT, IntersectionEvent(
+                                location=fleet.location,
+                                objects=[player_id, other_player_id],  # 所有相交的舰队 ID
+                                crash=False  # 不会坠毁
+                            ), self)
 
     def handle_fleet_move_request(self, message: Message):
         """处理舰队移动请求, 只需要处理跃迁的资源消耗"""
-        player = self.game.player_manager.get_player_by_id(message.data["player_id"])
-        travel_method = message.data["travel_method"]
-        path = message.data["path"]
+        player = self.game.player_manager.get_player_by_id(message.data.player_id)
+        travel_method = message.data.travel_method
+        path = message.data.path
 
-        player.fleet.set_travel_method(travel_method)
         if not player:
             return
+        player.fleet.set_travel_method(travel_method)
 
         if travel_method == TravelMethod.SUBSPACEJUMP:
             # 亚空间跳跃情况下只能跳一次，如果有多个路径的话给予抹除？
-            player.set_path(path[:1])
-            if player.get_resource_amount("promethium") >= self.SUBSPACE_JUMP_COST:
+            player.fleet.set_path(path[:1])
+            if player.resources.get("resource.promethium", 0) >= self.SUBSPACE_JUMP_COST:
                 # 发送修改资源的消息 (扣除钷素)
-                modifier_config = ModifierConfig(ObjectType.PLAYER, Resource.get_resource_by_id("resource.promethium"), ModifierType.LOSS, self.SUBSPACE_JUMP_COST, 0, 0)
-                self.game.message_bus.post_message(MessageType.MODIFIER_PLAYER_RESOURCE_REQUEST, {
-                    "target_id": player.object_id,
-                    "modifier_config": modifier_config
-                }, self)
+                modifier_config = ModifierConfig(ObjectType.PLAYER, "resource.promethium", ModifierType.LOSS, self.SUBSPACE_JUMP_COST, 0, 0)
+                self.game.message_bus.post_message(MessageType.MODIFIER_APPLY_REQUEST, ModifierApplyRequest(
+                    target_id=player.object_id,
+                    modifier_config=modifier_config
+                ), self)
             else:
                 self.game.log.warn(f"玩家 {player.object_id} 尝试亚空间跳跃，但钷素不足")
         else:
@@ -99,7 +97,7 @@ class RulesManager(BaseObject):
 
     def handle_fleet_movement_interrupt(self, message: Message):
         """处理舰队移动中断"""
-        player = self.game.player_manager.get_player_by_id(message.data["player_id"])
+        player = self.game.player_manager.get_player_by_id(message.data.player_id)
         if not player:
             return
 
@@ -115,8 +113,8 @@ class RulesManager(BaseObject):
 
     def handle_explore_world_request(self, message: Message):
         """处理探索星球的请求"""
-        player = self.game.player_manager.get_player_by_id(message.data["player_id"])
-        world_id = message.data["world_id"]
+        player = self.game.player_manager.get_player_by_id(message.data.player_id)
+        world_id = message.data.world_id
         world = self.game.world_manager.get_world_by_id(world_id)
 
         if not player or not world:
@@ -133,9 +131,11 @@ class RulesManager(BaseObject):
             return
 
         # 标记为已探索
-        player.explored_planets.append(world_id)
+        player.explored_planets[world_id] = None
         self.game.log.info(f"玩家 {player.object_id} 成功探索星球 {world_id}！")
         world.owner = player.object_id
+        self.game.snapshots.mark_player(player.object_id)
+        self.game.snapshots.mark_world(world_id)
 
         # 计算并应用探索奖励
         for reward in world.exploration_rewards:
@@ -159,21 +159,21 @@ class RulesManager(BaseObject):
             # 发送奖励消息
             self.game.message_bus.post_message(
                 MessageType.MODIFIER_APPLY_REQUEST,
-                {
-                    "target_id": player.object_id,
-                    "modifier_config": modifier_config
-                },
+                ModifierApplyRequest(
+                    target_id=player.object_id,
+                    modifier_config=modifier_config
+                ),
                 self
             )
             self.game.log.info(f"应用探索奖励: {quantity} {resource.name_id}")
 
     def handle_fleet_land_request(self, message: Message):
         """处理降落请求, 检查舰队当前位置是否在星球表面"""
-        player = self.game.player_manager.get_player_by_id(message.data["player_id"])
+        player = self.game.player_manager.get_player_by_id(message.data.player_id)
         if not player:
             return
 
-        world_id = message.data["world_id"]
+        world_id = message.data.world_id
         world = self.game.world_manager.get_world_by_id(world_id)
         if not world:
             return
@@ -186,14 +186,14 @@ class RulesManager(BaseObject):
             # 添加到星球的 docked_fleets
             if world.object_id not in world.docked_fleets:
                 world.docked_fleets[player.object_id] = player.fleet.location
-            self.game.log.info(f"玩家 {message.data['player_id']} 的舰队降落在星球 {world.world_config.world_id}！")
+            self.game.log.info(f"玩家 {message.data.player_id} 的舰队降落在星球 {world.world_config.world_id}！")
         else:
-            self.game.log.warn(f"玩家 {message.data['player_id']} 的舰队未到达星球 {world_id} 表面，无法降落。")
+            self.game.log.warn(f"玩家 {message.data.player_id} 的舰队未到达星球 {world_id} 表面，无法降落。")
         pass
 
     def handle_fleet_takeoff_request(self, message: Message):
         """处理起飞请求"""
-        player = self.game.player_manager.get_player_by_id(message.data["player_id"])
+        player = self.game.player_manager.get_player_by_id(message.data.player_id)
         if not player:
             return
 
@@ -244,11 +244,11 @@ class RulesManager(BaseObject):
 
             # 检查是否到达终点
             if not fleet.path:
-                self.game.message_bus.post_message(MessageType.PLAYER_FLEET_ARRIVE, {
-                    "player_id": player_id,
-                    "location": fleet.location,
-                    "arrival_type": "coordinate",
-                }, self)
+                self.game.message_bus.post_message(MessageType.PLAYER_FLEET_ARRIVE, PlayerFleetArrive(
+                    player_id=player_id,
+                    location=fleet.location,
+                    arrival_type="coordinate",
+                ), self)
 
     def _handle_subspace_jump(self, player, next_location):
         """处理亚空间跳跃，仅验证合法性"""
@@ -285,13 +285,14 @@ class RulesManager(BaseObject):
             next_location = fleet.path[0]
             if not self._is_single_step_valid(current_location, next_location):
                 # 移动失败处理
-                self.game.message_bus.post_message(MessageType.PLAYER_FLEET_MOVEMENT_INTERRUPT, {
-                    "player_id": player_id,
-                }, self)
+                self.game.message_bus.post_message(MessageType.PLAYER_FLEET_MOVEMENT_INTERRUPT, PlayerFleetMovementInterrupt(
+                    player_id=player_id,
+                ), self)
                 return False, actual_steps 
 
             current_location = next_location
             fleet.move_to_next_cell()
+            self.game.snapshots.mark_player(player_id)
             self.fleet_spacetime[player_id] = (current_location, now)
 
         return True, actual_steps
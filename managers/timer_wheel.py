@@ -0,0 +1,48 @@
+from common import *
+
+class TimerWheel:
+    """
+    按到期 tick 分桶的定时器。
+    每个定时器只在到期的那个 tick 被取出并回调一次, 没有到期的定时器不产生任何每 tick 开销。
+    取消的定时器只从索引中删除, 留在桶里的 ID 在到期时被跳过。
+    """
+    def __init__(self, game):
+        self.game = game
+        self.current_tick = 0
+        self.buckets: Dict[int, List[int]] = {}  # {due_tick: [timer_id, ...]}
+        self.timers: Dict[int, Tuple[int, Callable, tuple]] = {}  # {timer_id: (due_tick, callback, args)}
+        self._next_timer_id = 0
+
+    def schedule(self, delay: int, callback: Callable, *args) -> int:
+        """delay 个 tick 之后回调 callback(*args), 返回定时器 ID"""
+        return self.schedule_at(self.current_tick + max(int(delay), 1), callback, *args)
+
+    def schedule_at(self, due_tick: int, callback: Callable, *args) -> int:
+        """在 due_tick 回调 callback(*args), 已经过去的 tick 顺延到下一个 tick"""
+        due_tick = max(due_tick, self.current_tick + 1)
+        self._next_timer_id += 1
+        timer_id = self._next_timer_id
+        self.timers[timer_id] = (due_tick, callback, args)
+        self.buckets.setdefault(due_tick, []).append(timer_id)
+        return timer_id
+
+    def cancel(self, timer_id: Optional[int]) -> bool:
+        """取消定时器, 返回是否取消成功 (已经触发或不存在时返回 False)"""
+        return self.timers.pop(timer_id, None) is not None
+
+    def get_due_tick(self, timer_id: int) -> Optional[int]:
+        timer = self.timers.get(timer_id)
+        return timer[0] if timer else None
+
+    def advance(self):
+        """前进一个 tick, 触发这个 tick 到期的所有定时器 (按登记顺序)"""
+        self.current_tick += 1
+        bucket = self.buckets.pop(self.current_tick, None)
+        if not bucket:
+            return
+        for timer_id in bucket:
+            timer = self.timers.pop(timer_id, None)
+            if timer is None:
+                continue  # 已取消
+            _, callback, args = timer
+            callback(*args)
@@ -3,23 +3,28 @@ from basic_types.basic_typs import Vector3
 from basic_types.enums import BuildingSubTypeResource, BuildingType
 from common import *
 from basic_types.world import WorldInstance
+from basic_types.target_index import TargetIndex
 from managers.message_bus import MessageType
+from managers.messages import WorldAdded, WorldRemoved
+import heapq
 
 class WorldManager(BaseObject):
-    _instance = None
-
-    def __new__(cls, world_configs, game):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.impenetrable_locations: Dict[Vector3, str] = {} # type: ignore
-
-            cls._instance.world_configs = world_configs
-            cls._instance.world_instances: Dict[str, WorldInstance] = {} # type: ignore
-            cls._instance.game = game
-            cls._instance.game.world_manager = cls._instance
-            cls._instance._dirty_impenetrable_grid = True
-            
-        return cls._instance
+    WORLD_GRID_CELL = 32  # 星球空间索引的网格边长 (单元格数)
+
+    def __init__(self, world_configs, game):
+        super().__init__()
+        self.impenetrable_locations: Dict[Vector3, str] = {} # type: ignore
+
+        self.world_configs = world_configs
+        self.world_instances: Dict[str, WorldInstance] = {} # type: ignore
+        self.targets = TargetIndex()  # 所有星球的 ID, 用于随机选取
+        self.game = game
+        self.game.world_manager = self
+        self._dirty_impenetrable_grid = True
+        # 星球空间索引, 用于近邻查询 {网格坐标: [world_id, ...]}
+        self.world_grid: Dict[Tuple[int, int, int], List[str]] = {} # type: ignore
+        self._grid_bounds = None  # 已占用网格的范围 (min_key, max_key), 只扩不缩
+
 
     def generate_world(self, world_config, location, reachable_half_extent, impenetrable_half_extent):
         """生成单个星球 (进行碰撞检测和安全距离检查)"""
@@ -63,15 +68,15 @@ class WorldManager(BaseObject):
         # 没有碰撞，添加到管理器
         self._dirty_impenetrable_grid = True 
         self.world_instances[temp_world.object_id] = temp_world
-        for dx in range(-temp_world.impenetrable_half_extent, temp_world.impenetrable_half_extent + 1):
-            for dy in range(-temp_world.impenetrable_half_extent, temp_world.impenetrable_half_extent + 1):
-                for dz in range(-temp_world.impenetrable_half_extent, temp_world.impenetrable_half_extent + 1):
-                    self.impenetrable_locations[(temp_world.location.x + dx, temp_world.location.y + dy, temp_world.location.z + dz)] = temp_world.object_id
+        self.targets.add(temp_world.object_id)
+        self._index_world(temp_world)
+        self._index_impenetrable(temp_world)
+        self.game.snapshots.mark_world(temp_world.object_id)
         self.game.log.info(f"成功生成星球 {temp_world.world_config.world_id}，位置：{temp_world.location}")
 
         self.game.message_bus.post_message(
             MessageType.WORLD_ADDED,
-            {"world": temp_world},
+            WorldAdded(world=temp_world),
             self
         )
         return temp_world
@@ -82,11 +87,15 @@ class WorldManager(BaseObject):
             # 发送世界移除消息
             self.game.message_bus.post_message(
                 MessageType.WORLD_REMOVED,
-                {"world": world},
+                WorldRemoved(world=world),
                 self
             )
             self._dirty_impenetrable_grid = True 
             del self.world_instances[world_id]
+            self.targets.remove(world_id)
+            self.game.snapshots.mark_world(world_id)
+            self._unindex_world(world)
+            self.game.registry.remove(world_id)
             # 移除不可穿透位置
             for loc in world.impenetrable_locations:
                 if loc in self.impenetrable_locations:
@@ -126,7 +135,90 @@ class WorldManager(BaseObject):
         return object_id in self.world_instances
 
     def add_world_instance(self, world_instance):
+        """添加已有的星球实例 (例如从存档恢复), 不做碰撞检测, 也不发送消息"""
+        self._dirty_impenetrable_grid = True
         self.world_instances[world_instance.object_id] = world_instance
+        self.targets.add(world_instance.object_id)
+        self._index_world(world_instance)
+        self._index_impenetrable(world_instance)
+        self.game.snapshots.mark_world(world_instance.object_id)
+
+    def _index_impenetrable(self, world: WorldInstance):
+        """登记星球不可穿透区域的坐标"""
+        for dx in range(-world.impenetrable_half_extent, world.impenetrable_half_extent + 1):
+            for dy in range(-world.impenetrable_half_extent, world.impenetrable_half_extent + 1):
+                for dz in range(-world.impenetrable_half_extent, world.impenetrable_half_extent + 1):
+                    self.impenetrable_locations[(world.location.x + dx, world.location.y + dy, world.location.z + dz)] = world.object_id
+
+    def _grid_key(self, location: Vector3) -> Tuple[int, int, int]:
+        cell = self.WORLD_GRID_CELL
+        return (int(location.x // cell), int(location.y // cell), int(location.z // cell))
+
+    def _index_world(self, world: WorldInstance):
+        """将星球加入空间索引"""
+        key = self._grid_key(world.location)
+        self.world_grid.setdefault(key, []).append(world.object_id)
+        if self._grid_bounds is None:
+            self._grid_bounds = (key, key)
+        else:
+            low, high = self._grid_bounds
+            self._grid_bounds = (
+                tuple(min(a, b) for a, b in zip(low, key)),
+                tuple(max(a, b) for a, b in zip(high, key)),
+            )
+
+    def _unindex_world(self, world: WorldInstance):
+        """将星球从空间索引中移除"""
+        key = self._grid_key(world.location)
+        world_ids = self.world_grid.get(key)
+        if world_ids and world.object_id in world_ids:
+            world_ids.remove(world.object_id)
+            if not world_ids:
+                del self.world_grid[key]
+
+    @staticmethod
+    def _ring_cells(center: Tuple[int, int, int], ring: int):
+        """遍历与 center 的切比雪夫距离恰好为 ring 的所有网格"""
+        cx, cy, cz = center
+        for dx in range(-ring, ring + 1):
+            for dy in range(-ring, ring + 1):
+                if abs(dx) == ring or abs(dy) == ring:
+                    dzs = range(-ring, ring + 1)
+                else:
+                    dzs = (-ring, ring) if ring else (0,)
+                for dz in dzs:
+                    yield (cx + dx, cy + dy, cz + dz)
+
+    def get_nearest_worlds(self, location: Vector3, k: int, predicate: Optional[Callable[[WorldInstance], bool]] = None) -> List[WorldInstance]:
+        """
+        k 近邻查询: 返回离 location 最近且满足 predicate 的至多 k 个星球 (由近到远)。
+        从 location 所在网格开始逐圈向外搜索, 当第 k 近的距离不超过下一圈的最小可能距离时停止。
+        """
+        if k <= 0 or not self.world_grid:
+            return []
+
+        cell = self.WORLD_GRID_CELL
+        center = self._grid_key(location)
+        low, high = self._grid_bounds
+        max_ring = max(max(abs(c - l), abs(h - c)) for c, l, h in zip(center, low, high))
+
+        nearest = []  # 大小为 k 的最大堆 (-distance, world_id)
+        for ring in range(max_ring + 1):
+            for key in self._ring_cells(center, ring):
+                for world_id in self.world_grid.get(key, ()):
+                    world = self.world_instances[world_id]
+                    if predicate is not None and not predicate(world):
+                        continue
+                    item = (-location.distance(world.location), world_id)
+                    if len(nearest) < k:
+                        heapq.heappush(nearest, item)
+                    elif item > nearest[0]:
+                        heapq.heapreplace(nearest, item)
+            # 下一圈网格中的任意位置与 location 的距离至少为 ring * cell
+            if len(nearest) >= k and -nearest[0][0] <= ring * cell:
+                break
+
+        return [self.world_instances[world_id] for _, world_id in sorted(nearest, reverse=True)]
 
     def get_world_by_id(self, world_id):
         return self.world_instances.get(world_id)
@@ -212,9 +304,7 @@ class WorldManager(BaseObject):
             return False
       
     def pick(self):
-        if self.world_instances:
-            return random.choice(list(self.world_instances.keys()))
-        return None
+        return self.targets.pick()
 
     def tick(self, tick_counter):
         pass
\ No newline at end of file
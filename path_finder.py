@@ -3,6 +3,7 @@ import math
 from basic_types.basic_typs import *
 from common import *
 from cachetools import LRUCache
+import threading
 
 class OctreeNode:
     # ... (OctreeNode 类保持不变, 和之前给出的一样) ...
@@ -95,10 +96,29 @@ class Pathfinder:
 
         # 诊断系统
         self.search_counter = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.last_search_steps = 0  # 最近一次搜索扩展的节点数 (命中缓存时为 0)
         self._octree = None
 
+        # 机器人可能在线程池中并行寻路, 搜索状态(_node_data)和缓存是共享的, 需要串行化
+        self._lock = threading.Lock()
+
     def find_path(self, start_location: Vector3, end_location: Vector3, speed: int = 1):
+        with self._lock:
+            profiler = self.game.profiler
+            if profiler is None:
+                return self._find_path(start_location, end_location, speed)
+            hits = self.cache_hits
+            with profiler.measure("path_finder.find_path"):
+                path = self._find_path(start_location, end_location, speed)
+            profiler.count("path_finder.cache_hit" if self.cache_hits != hits else "path_finder.cache_miss")
+            profiler.record_value("path_finder.search_steps", self.last_search_steps)
+            return path
+
+    def _find_path(self, start_location: Vector3, end_location: Vector3, speed: int = 1):
         self._node_data.clear()  # 确保开始时是空的, 只在开头清除
+        steps = 0
         try:
             self.search_counter += 1
             log_header = f"[Search#{self.search_counter}] {start_location}->{end_location}"
@@ -111,7 +131,9 @@ class Pathfinder:
             # 缓存检查
             cache_key = (start_location, end_location, speed)
             if cache_key in self._path_cache:
+                self.cache_hits += 1
                 return self._path_cache[cache_key]
+            self.cache_misses += 1
 
             # 立即完成检查
             if self._is_goal(start_location, end_location):
@@ -164,6 +186,7 @@ class Pathfinder:
 
             return None  # No path found
         finally:
+            self.last_search_steps = steps
             self._node_data.clear()  # 确保即使发生异常也会清空
 
     def _get_jump_points(self, current: Vector3, end: Vector3, speed: int) -> List[Vector3]:
@@ -0,0 +1,181 @@
+"""
+tick 性能分析: 记录每个管理器 tick()、每个消息订阅者回调 (按 MessageType)、寻路和机器人思考各阶段的墙钟时间与 CPU 时间,
+每项保留最近的若干个样本, 定期输出 p50/p95/p99 的简要报告, 也可以把报告逐行追加到 JSON 文件中。
+
+Game.profiler 为 None 时各处只多一次判断, 不做任何计时。
+消息回调的时间包含回调中同步发布的其他消息的处理时间。
+"""
+from collections import deque
+import json
+import threading
+import time
+
+
+class RollingHistogram:
+    """最近 window 个样本, 以及全部样本的数量和总和"""
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentiles(self, *quantiles):
+        """最近样本的分位数 (nearest-rank), 没有样本时为 0"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for _ in quantiles]
+        last = len(ordered) - 1
+        return [ordered[min(last, int(q * len(ordered)))] for q in quantiles]
+
+
+class _Measure:
+    """计时的上下文管理器"""
+    __slots__ = ("profiler", "name", "wall", "cpu")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+        return False
+
+
+class Stopwatch:
+    """
+    分段计时: 每次 lap(stage) 记录从上一次 lap (或创建) 到现在的时间, 名称为 "前缀.stage"。
+    适合把一个长函数按阶段切开, 不需要改变代码结构。
+    """
+    __slots__ = ("profiler", "prefix", "wall", "cpu")
+
+    def __init__(self, profiler, prefix):
+        self.profiler = profiler
+        self.prefix = prefix
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def lap(self, stage: str):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.profiler.record(f"{self.prefix}.{stage}", wall - self.wall, cpu - self.cpu)
+        self.wall, self.cpu = wall, cpu
+
+
+class _NullStopwatch:
+    """未启用性能分析时使用, lap 什么也不做"""
+    __slots__ = ()
+
+    def lap(self, stage: str):
+        pass
+
+
+NULL_STOPWATCH = _NullStopwatch()
+
+
+class TickProfiler:
+    """
+    window: 每项保留的最近样本数
+    report_interval: 每隔多少个 tick 输出一次报告 (0 为不自动输出)
+    export_path: 设置后每次报告追加一行 JSON
+    """
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, game, window: int = 1024, report_interval: int = 600, export_path=None):
+        self.game = game
+        self.window = window
+        self.report_interval = report_interval
+        self.export_path = export_path
+        self.timings = {}  # {名称: (墙钟时间直方图, CPU 时间直方图)}, 单位秒
+        self.values = {}  # {名称: 直方图}, 计时以外的数值 (例如寻路的搜索步数)
+        self.counters = {}  # {名称: 计数}
+        self._lock = threading.Lock()  # 机器人在线程池中并行思考时也会记录
+        self.last_report_tick = game.tick_counter
+
+    def measure(self, name: str) -> _Measure:
+        return _Measure(self, name)
+
+    def stopwatch(self, prefix: str) -> Stopwatch:
+        return Stopwatch(self, prefix)
+
+    def record(self, name: str, wall: float, cpu: float):
+        with self._lock:
+            histograms = self.timings.get(name)
+            if histograms is None:
+                histograms = self.timings[name] = (RollingHistogram(self.window), RollingHistogram(self.window))
+            histograms[0].add(wall)
+            histograms[1].add(cpu)
+
+    def record_value(self, name: str, value: float):
+        with self._lock:
+            histogram = self.values.get(name)
+            if histogram is None:
+                histogram = self.values[name] = RollingHistogram(self.window)
+            histogram.add(value)
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def tick(self):
+        """在 tick 结束时调用, 到达报告间隔时输出报告"""
+        if self.report_interval and self.game.tick_counter - self.last_report_tick >= self.report_interval:
+            self.last_report_tick = self.game.tick_counter
+            self.log_report()
+
+    def report(self):
+        """当前的统计结果 (时间单位为毫秒), 按墙钟总时间从大到小排列"""
+        with self._lock:
+            timings = []
+            for name, (wall, cpu) in self.timings.items():
+                timings.append({
+                    "name": name,
+                    "count": wall.count,
+                    "total_ms": wall.total * 1000,
+                    "wall_ms": [value * 1000 for value in wall.percentiles(*self.QUANTILES)],
+                    "cpu_ms": [value * 1000 for value in cpu.percentiles(*self.QUANTILES)],
+                })
+            values = {name: {"count": histogram.count, "mean": histogram.total / histogram.count if histogram.count else 0,
+                             "p": histogram.percentiles(*self.QUANTILES)}
+                      for name, histogram in self.values.items()}
+            counters = dict(self.counters)
+        timings.sort(key=lambda item: item["total_ms"], reverse=True)
+
+        hits = counters.get("path_finder.cache_hit", 0)
+        lookups = hits + counters.get("path_finder.cache_miss", 0)
+        return {
+            "tick": self.game.tick_counter,
+            "time": time.time(),
+            "timings": timings,
+            "values": values,
+            "counters": counters,
+            "path_cache_hit_rate": hits / lookups if lookups else None,
+        }
+
+    def log_report(self, top: int = 20):
+        """输出简要报告, 只列出总时间最多的 top 项"""
+        report = self.report()
+        log = self.game.log
+        log.info(f"==== 性能统计 tick {report['tick']} (最近 {self.window} 个样本的 p50/p95/p99, 毫秒) ====")
+        for item in report["timings"][:top]:
+            wall, cpu = item["wall_ms"], item["cpu_ms"]
+            log.info(f"  {item['name']}: 次数 {item['count']}, 总计 {item['total_ms']:.1f}, "
+                     f"墙钟 {wall[0]:.3f}/{wall[1]:.3f}/{wall[2]:.3f}, CPU {cpu[0]:.3f}/{cpu[1]:.3f}/{cpu[2]:.3f}")
+        for name, value in report["values"].items():
+            p = value["p"]
+            log.info(f"  {name}: 次数 {value['count']}, 平均 {value['mean']:.1f}, p50/p95/p99 {p[0]:.0f}/{p[1]:.0f}/{p[2]:.0f}")
+        if report["path_cache_hit_rate"] is not None:
+            log.info(f"  寻路缓存命中率: {report['path_cache_hit_rate']:.1%}")
+        if self.export_path:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report, ensure_ascii=False) + "\n")
+        return report
@@ -0,0 +1,117 @@
+import asyncio
+import json
+from basic_types.basic_typs import Vector3
+from basic_types.enums import PlayerAction, TravelMethod
+from managers.async_bridge import AsyncBridge, AsyncConsumer
+from managers.player_manager import PlayerManager
+
+class GameServer:
+    """
+    本地 TCP 服务 (每行一个 JSON, 作为 WebSocket 的替代)。
+    每个连接是一个会话: 登录某个玩家后只收到与该玩家相关的消息, 未登录时收到所有对外消息。
+    客户端 -> 服务器:
+        {"op": "login", "player_id": 1}
+        {"op": "action", "action": "MOVE", "path": [[x, y, z], ...], "travel_method": "SLOWTRAVEL"}
+    服务器 -> 客户端:
+        {"type": "EVENT_NEED_OPTION", "data": {...}}
+        {"type": "ERROR", "message": "..."}
+    """
+    QUEUE_SIZE = 256  # 每个会话的发送队列长度, 满了丢弃最旧的消息
+
+    def __init__(self, game, host: str = "127.0.0.1", port: int = 8765):
+        self.game = game
+        self.host = host
+        self.port = port
+        self.bridge = AsyncBridge(game.message_bus)
+        self.server = None
+        self.sessions = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.game.log.info(f"服务已启动: {self.host}:{self.port}")
+
+    async def serve(self, tick_interval: float = 0):
+        """启动服务并运行异步游戏循环"""
+        await self.start()
+        async with self.server:
+            await self.game.run_async(tick_interval)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.sessions += 1
+        consumer = self.bridge.add_consumer(maxsize=self.QUEUE_SIZE)
+        player_id = None
+        sender = asyncio.create_task(self._send_loop(consumer, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    self._send(writer, {"type": "ERROR", "message": "无效的 JSON"})
+                    continue
+                if not isinstance(request, dict):
+                    self._send(writer, {"type": "ERROR", "message": "请求必须是 JSON 对象"})
+                    continue
+
+                op = request.get("op")
+                if op == "login":
+                    player_id = request.get("player_id")
+                    if not self.game.player_manager.get_player_by_id(player_id):
+                        self._send(writer, {"type": "ERROR", "message": f"未知玩家: {player_id}"})
+                        player_id = None
+                        continue
+                    # 换成只接收该玩家消息的队列
+                    self.bridge.remove_consumer(consumer)
+                    sender.cancel()
+                    consumer = self.bridge.add_consumer(player_id=player_id, maxsize=self.QUEUE_SIZE)
+                    sender = asyncio.create_task(self._send_loop(consumer, writer))
+                    self._send(writer, {"type": "LOGIN", "player_id": player_id})
+                elif op == "action":
+                    if player_id is None:
+                        self._send(writer, {"type": "ERROR", "message": "请先登录"})
+                        continue
+                    try:
+                        action_data = self.parse_action(request, player_id)
+                    except (KeyError, TypeError, ValueError) as e:
+                        self._send(writer, {"type": "ERROR", "message": f"无效的操作: {e}"})
+                        continue
+                    self.game.player_manager.get_player_by_id(player_id).submit_actions([action_data])
+                else:
+                    self._send(writer, {"type": "ERROR", "message": f"未知操作: {op}"})
+        except ConnectionError:
+            pass
+        finally:
+            self.bridge.remove_consumer(consumer)
+            sender.cancel()
+            writer.close()
+            self.sessions -= 1
+            if consumer.dropped:
+                self.game.log.warn(f"会话 (玩家 {player_id}) 丢弃了 {consumer.dropped} 条过时的消息")
+
+    def parse_action(self, request, player_id) -> dict:
+        """把客户端的操作转换为 PlayerManager 使用的操作数据, 缺少字段或类型不对时抛出 ValueError"""
+        action_data = {key: value for key, value in request.items() if key != "op"}
+        action_data["action"] = PlayerAction[request["action"]]
+        action_data["player_id"] = player_id  # 只能操作自己登录的玩家
+        if "path" in action_data:
+            path = action_data["path"]
+            if not isinstance(path, list) or not all(isinstance(location, list) and len(location) == 3 and all(type(c) is int for c in location) for location in path):
+                raise ValueError("path 必须是 [[x, y, z], ...]")
+            action_data["path"] = [Vector3(*location) for location in path]
+        if "travel_method" in action_data:
+            action_data["travel_method"] = TravelMethod[action_data["travel_method"]]
+        problem = PlayerManager.validate_action(action_data)
+        if problem is not None:
+            raise ValueError(problem)
+        return action_data
+
+    async def _send_loop(self, consumer: AsyncConsumer, writer: asyncio.StreamWriter):
+        while True:
+            item = await consumer.get()
+            self._send(writer, item)
+            await writer.drain()
+
+    def _send(self, writer: asyncio.StreamWriter, item):
+        writer.write(json.dumps(item, ensure_ascii=False).encode() + b"\n")
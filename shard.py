@@ -0,0 +1,223 @@
+import bisect
+import logging
+import multiprocessing
+import pickle
+import random
+import time
+from logger import Log
+
+class RegionMap:
+    """
+    按 x 坐标把星系切成若干个星域 (slab), 边界取星球 x 坐标的分位数, 让每个星域的星球数量大致相同。
+    """
+    def __init__(self, boundaries):
+        self.boundaries = boundaries  # 长度为 分片数 - 1, 升序
+
+    @classmethod
+    def from_worlds(cls, worlds, shards: int) -> "RegionMap":
+        xs = sorted(world.location.x for world in worlds)
+        if not xs:
+            return cls([])
+        return cls([xs[len(xs) * i // shards] for i in range(1, shards)])
+
+    def region_of(self, location) -> int:
+        return bisect.bisect_right(self.boundaries, location.x)
+
+
+class ShardWorker:
+    """
+    在一个进程中运行某个星域的模拟。
+    所有分片用相同的随机种子执行同样的初始化, 因此星球、建筑和玩家的 ID 在各分片间一致,
+    初始化之后每个分片只保留自己星域里的星球和舰队, 新对象的 ID 从各自独立的区间开始分配。
+    """
+    ID_RANGE = 10 ** 9  # 每个分片新建对象的 ID 区间大小
+
+    def __init__(self, index: int, shards: int, create_game, robots: int, seed: int):
+        self.index = index
+        self.shards = shards
+        Log(level=logging.DEBUG, filename=f"log.shard{index}.txt")  # Log 是单例, 先于 Game 创建以使用分片自己的日志文件
+        random.seed(seed)
+        self.game = create_game(robots)
+        self.region_map = RegionMap.from_worlds(self.game.world_manager.world_instances.values(), shards)
+        self._prune()
+        self.game.registry.next_id = (index + 1) * self.ID_RANGE
+
+    def _prune(self):
+        """移除不属于本星域的星球和舰队"""
+        game = self.game
+        for world_id, world in list(game.world_manager.world_instances.items()):
+            if self.region_map.region_of(world.location) != self.index:
+                game.building_manager.remove_world_buildings(world_id)
+                game.world_manager.remove_world(world_id)
+        game.path_finder.update_octree()
+
+        for player_id, player in list(game.player_manager.players.items()):
+            if self.region_map.region_of(player.fleet.location) != self.index:
+                game.player_manager.detach_player(player_id)
+                game.registry.remove(player_id)
+        self._pick_status_player()
+
+    def _pick_status_player(self):
+        """管理员状态输出使用的玩家, 本分片没有玩家时为 None"""
+        players = self.game.player_manager.players
+        if self.game.robot is None or self.game.robot.object_id not in players:
+            self.game.robot = next(iter(players.values()), None)
+
+    def local_player_ids(self):
+        return list(self.game.player_manager.players)
+
+    def step(self, inbound_players, inbound_deltas):
+        """
+        执行一个 tick。
+        inbound_players: 其他分片移交过来的玩家 (序列化后的数据)
+        inbound_deltas: 其他分片转交过来的资源变化 {player_id: {resource: quantity}}
+        返回 (移交出去的玩家 [(目标分片, player_id, 数据)], 需要转交的资源变化)
+        """
+        for packet in inbound_players:
+            self._attach(packet)
+        self.game.player_manager.apply_remote_resource_deltas(inbound_deltas)
+
+        self.game.tick()
+
+        outbound_players = []
+        for player_id, player in list(self.game.player_manager.players.items()):
+            region = self.region_map.region_of(player.fleet.location)
+            if region != self.index:
+                outbound_players.append((region, player_id, self._detach(player_id)))
+        if outbound_players:
+            self._pick_status_player()
+        return outbound_players, self.game.player_manager.take_remote_resource_deltas()
+
+    def _detach(self, player_id) -> bytes:
+        game = self.game
+        player, robot = game.player_manager.detach_player(player_id)
+        game.registry.remove(player_id)
+        game.rule_manager.fleet_spacetime.pop(player_id, None)
+        # 玩家相关的事件留在原分片无法继续, 直接结束
+        for event in game.event_manager.active_events.for_target(player.type, player_id):
+            game.event_manager.end_event(event, notify=False)
+        # 配置在每个分片都有, 不随玩家传输
+        player.avaliable_building_config = None
+        player.available_purchases = None
+        if robot is not None:
+            robot.game = None
+        return pickle.dumps((player, robot))
+
+    def _attach(self, packet: bytes):
+        game = self.game
+        player, robot = pickle.loads(packet)
+        player.avaliable_building_config = game.building_manager.building_configs
+        player.available_purchases = game.purchase_manager.purchase_configs
+        # 原来的目标和路径基于原分片的星球, 到新星域后重新规划
+        player.fleet.set_path([])
+        player.fleet.landed_on = None
+        game.registry.add(player)
+        if robot is not None:
+            robot.game = game
+            robot.dest = None
+            robot._planet_slot_values = {}
+        game.player_manager.attach_player(player, robot)
+        game.log.info(f"分片 {self.index} 接收玩家 {player.object_id}, 位置 {player.fleet.location}")
+        if game.robot is None:
+            game.robot = player
+
+    def stats(self):
+        game = self.game
+        return {
+            "shard": self.index,
+            "tick": game.tick_counter,
+            "worlds": len(game.world_manager.world_instances),
+            "buildings": len(game.building_manager.building_instances),
+            "players": len(game.player_manager.players),
+        }
+
+
+def _worker_main(conn, index, shards, create_game, robots, seed):
+    worker = ShardWorker(index, shards, create_game, robots, seed)
+    conn.send(worker.local_player_ids())
+    while True:
+        command, *args = conn.recv()
+        if command == "tick":
+            conn.send(worker.step(*args))
+        elif command == "stats":
+            conn.send(worker.stats())
+        elif command == "stop":
+            conn.send(worker.stats())
+            break
+    conn.close()
+
+
+class ShardCoordinator:
+    """
+    分片模式的协调者: 为每个星域启动一个工作进程, 通过管道让所有分片按 tick 同步推进,
+    并在 tick 之间转发跨星域移动的玩家和跨分片的资源变化。
+    """
+    STATS_INTERVAL = 15  # 输出各分片状态的间隔 (秒)
+
+    def __init__(self, shards: int, create_game, robots: int = 1, seed=None):
+        self.shards = shards
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        # fork 让子进程继承同样的字符串哈希种子, 各分片的初始化才完全一致
+        context = multiprocessing.get_context("fork")
+        self.connections = []
+        self.processes = []
+        for index in range(shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_conn, index, shards, create_game, robots, self.seed), daemon=True)
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+        self.player_shard = {}  # {player_id: 分片编号}
+        for index, conn in enumerate(self.connections):
+            for player_id in conn.recv():
+                self.player_shard[player_id] = index
+        self.inbound_players = [[] for _ in range(shards)]
+        self.inbound_deltas = [{} for _ in range(shards)]
+        self.tick_counter = 0
+        self.handoffs = 0
+
+    def tick(self):
+        # 所有分片并行执行同一个 tick
+        for index, conn in enumerate(self.connections):
+            conn.send(("tick", self.inbound_players[index], self.inbound_deltas[index]))
+        self.inbound_players = [[] for _ in range(self.shards)]
+        self.inbound_deltas = [{} for _ in range(self.shards)]
+
+        # 收集结果, 在下一个 tick 之前转发
+        for index, conn in enumerate(self.connections):
+            outbound_players, outbound_deltas = conn.recv()
+            for region, player_id, packet in outbound_players:
+                self.player_shard[player_id] = region
+                self.inbound_players[region].append(packet)
+                self.handoffs += 1
+            for player_id, changes in outbound_deltas.items():
+                target = self.inbound_deltas[self.player_shard[player_id]].setdefault(player_id, {})
+                for resource, quantity in changes.items():
+                    target[resource] = target.get(resource, 0) + quantity
+        self.tick_counter += 1
+
+    def stats(self):
+        for conn in self.connections:
+            conn.send(("stats",))
+        return [conn.recv() for conn in self.connections]
+
+    def stop(self):
+        for conn in self.connections:
+            conn.send(("stop",))
+        results = [conn.recv() for conn in self.connections]
+        for process in self.processes:
+            process.join()
+        return results
+
+    def run(self, ticks=None):
+        last_report = time.time()
+        try:
+            while ticks is None or self.tick_counter < ticks:
+                self.tick()
+                if time.time() - last_report >= self.STATS_INTERVAL:
+                    last_report = time.time()
+                    print(f"tick {self.tick_counter}, 跨星域移交 {self.handoffs} 次, 分片状态: {self.stats()}")
+        finally:
+            if ticks is not None:
+                print(self.stop())
@@ -0,0 +1,257 @@
+"""
+游戏状态快照: 每个 tick 结束时发布一份不可变的状态视图, 供管理员状态输出、统计分析等只读的使用者读取。
+快照之间共享没有变化的部分 (结构共享): 管理器在修改星球、建筑、玩家时调用 SnapshotPublisher.mark_* 登记,
+发布时只为登记过的对象重新生成记录, 其余记录、没有变化的星球建筑列表和整张表都直接沿用上一份快照。
+发布只是替换 SnapshotPublisher.latest 的引用, 其他线程随时读取 latest 都能得到一份完整一致的快照, 不需要加锁。
+快照只包含普通的元组和字典, 可以序列化后发送给其他进程。
+"""
+from types import MappingProxyType
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set, Tuple
+import time
+
+
+class FrozenDict(dict):
+    """只读的字典, 修改时抛出 TypeError, 可以序列化"""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("快照中的数据是只读的")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class BuildingView(NamedTuple):
+    object_id: int
+    config_id: str
+    name_id: str
+    level: int
+    world_id: int
+    durability: int
+    max_durability: int
+    manpower: int
+    max_manpower: int
+    under_construction: bool
+
+
+class WorldView(NamedTuple):
+    object_id: int
+    world_config_id: str
+    location: Tuple[int, int, int]
+    owner: Optional[int]
+
+
+class PlayerView(NamedTuple):
+    object_id: int
+    resources: FrozenDict  # {资源 ID: 数量}, 只读
+    explored_planets: Tuple[int, ...]  # 按探索顺序
+    location: Tuple[int, int, int]
+    is_robot: bool
+
+
+class GameSnapshot:
+    """一个 epoch 的不可变状态视图"""
+    __slots__ = ("epoch", "tick", "created_at", "robot_id", "_worlds", "_world_buildings", "_buildings", "_players", "_stats")
+
+    def __init__(self, epoch, tick, robot_id, worlds, world_buildings, buildings, players, stats):
+        self.epoch = epoch
+        self.tick = tick
+        self.created_at = time.time()
+        self.robot_id = robot_id  # 管理员状态输出使用的玩家
+        self._worlds: Dict[int, WorldView] = worlds
+        self._world_buildings: Dict[int, Tuple[BuildingView, ...]] = world_buildings
+        self._buildings: Dict[int, BuildingView] = buildings
+        self._players: Dict[int, PlayerView] = players
+        self._stats: Dict[str, Any] = stats
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def worlds(self):
+        return MappingProxyType(self._worlds)
+
+    @property
+    def buildings(self):
+        return MappingProxyType(self._buildings)
+
+    @property
+    def players(self):
+        return MappingProxyType(self._players)
+
+    @property
+    def stats(self):
+        """各管理器的规模统计"""
+        return MappingProxyType(self._stats)
+
+    def get_world(self, world_id) -> Optional[WorldView]:
+        return self._worlds.get(world_id)
+
+    def get_player(self, player_id) -> Optional[PlayerView]:
+        return self._players.get(player_id)
+
+    def get_buildings_on_world(self, world_id) -> Tuple[BuildingView, ...]:
+        return self._world_buildings.get(world_id, ())
+
+
+def _patch(table: Dict, dirty: Set, build: Callable[[Any], Any]) -> Dict:
+    """
+    只为 dirty 中的 key 重新生成记录 (build 返回 None 表示对象已不存在), 与旧记录相同时沿用旧记录。
+    没有任何记录变化时返回原来的表, 否则复制一份再修改, 已发布的表不会被改动。
+    """
+    patched = None
+    for key in dirty:
+        old = table.get(key)
+        record = build(key)
+        if record is None:
+            if old is None:
+                continue
+        elif old == record:
+            continue
+        if patched is None:
+            patched = dict(table)
+        if record is None:
+            del patched[key]
+        else:
+            patched[key] = record
+    return table if patched is None else patched
+
+
+class SnapshotPublisher:
+    """
+    在 tick 结束时发布快照。interval 为发布间隔 (tick 数)。
+    tick 线程之外的使用者只读取 latest, 不要访问管理器中的实时数据。
+    修改了快照中包含的状态 (星球所有者, 建筑的配置/耐久/人力/建造状态, 玩家资源/已探索星球/位置, 以及对象的增删) 的代码
+    需要调用对应的 mark_* 方法, 否则下一份快照仍然沿用旧记录。第一次发布 (以及 invalidate 之后) 生成全部记录。
+    """
+    def __init__(self, game, interval: int = 1):
+        self.game = game
+        self.interval = max(1, interval)
+        self.epoch = 0
+        self.latest: Optional[GameSnapshot] = None
+        self._dirty_worlds: Set[int] = set()
+        self._dirty_buildings: Set[int] = set()
+        self._dirty_world_buildings: Set[int] = set()  # 建筑列表需要重新生成的星球
+        self._dirty_players: Set[int] = set()
+        self._full = True  # 下一次发布重新生成所有记录
+
+    def mark_world(self, world_id):
+        self._dirty_worlds.add(world_id)
+        self._dirty_world_buildings.add(world_id)
+
+    def mark_building(self, building_id, world_id):
+        self._dirty_buildings.add(building_id)
+        self._dirty_world_buildings.add(world_id)
+
+    def mark_player(self, player_id):
+        self._dirty_players.add(player_id)
+
+    def invalidate(self):
+        """绕过 mark_* 大量修改状态后 (例如从存档恢复) 调用, 下一次发布重新生成所有记录"""
+        self._full = True
+
+    def tick(self):
+        if self.latest is None or self.game.tick_counter - self.latest.tick >= self.interval:
+            self.publish()
+
+    def _world_view(self, world_id) -> Optional[WorldView]:
+        world = self.game.world_manager.world_instances.get(world_id)
+        if world is None:
+            return None
+        location = world.location
+        return WorldView(world_id, world.world_config.world_id, (location.x, location.y, location.z), world.owner)
+
+    def _building_view(self, building_id) -> Optional[BuildingView]:
+        building = self.game.building_manager.building_instances.get(building_id)
+        if building is None:
+            return None
+        config = building.building_config
+        return BuildingView(building_id, config.config_id, config.name_id, config.level, building.build_on,
+                            building.durability, config.durability, building.manpower, config.manpower,
+                            building.remaining_secs > 0)
+
+    def _player_view(self, player_id, old_view: Optional[PlayerView]) -> Optional[PlayerView]:
+        player_manager = self.game.player_manager
+        player = player_manager.players.get(player_id)
+        if player is None:
+            return None
+        # 已探索的星球只增不减, 数量不变时沿用旧的元组
+        if old_view is not None and len(old_view.explored_planets) == len(player.explored_planets):
+            explored = old_view.explored_planets
+        else:
+            explored = tuple(player.explored_planets)
+        resources = player.resources.to_dict()  # 快照中按资源 ID 保存
+        if old_view is not None and old_view.resources == resources:
+            resources = old_view.resources
+        else:
+            resources = FrozenDict(resources)
+        location = player.fleet.location
+        return PlayerView(player_id, resources, explored, (location.x, location.y, location.z), player_id in player_manager.robots)
+
+    def publish(self) -> GameSnapshot:
+        game = self.game
+        previous = self.latest
+        if previous is None or self._full:
+            # 所有对象都重新生成, 与旧记录相同的仍然沿用
+            self._dirty_worlds.update(game.world_manager.world_instances)
+            self._dirty_buildings.update(game.building_manager.building_instances)
+            self._dirty_world_buildings.update(game.building_manager.world_buildings)
+            self._dirty_players.update(game.player_manager.players)
+            if previous is not None:
+                self._dirty_worlds.update(previous._worlds)
+                self._dirty_buildings.update(previous._buildings)
+                self._dirty_world_buildings.update(previous._world_buildings)
+                self._dirty_players.update(previous._players)
+            self._full = False
+        old_worlds = previous._worlds if previous else {}
+        old_world_buildings = previous._world_buildings if previous else {}
+        old_buildings = previous._buildings if previous else {}
+        old_players = previous._players if previous else {}
+
+        worlds = _patch(old_worlds, self._dirty_worlds, self._world_view)
+        buildings = _patch(old_buildings, self._dirty_buildings, self._building_view)
+
+        def world_building_views(world_id):
+            slot_table = game.building_manager.world_buildings.get(world_id)
+            if slot_table is None:
+                return None
+            views = tuple(view for view in (buildings.get(building.object_id) for building in slot_table.get_buildings()) if view is not None)
+            old_views = old_world_buildings.get(world_id)
+            if old_views is not None and len(views) == len(old_views) and all(view is old_view for view, old_view in zip(views, old_views)):
+                return old_views
+            return views
+        world_buildings = _patch(old_world_buildings, self._dirty_world_buildings, world_building_views)
+
+        players = _patch(old_players, self._dirty_players, lambda player_id: self._player_view(player_id, old_players.get(player_id)))
+
+        self._dirty_worlds.clear()
+        self._dirty_buildings.clear()
+        self._dirty_world_buildings.clear()
+        self._dirty_players.clear()
+
+        stats = {
+            "worlds": len(game.world_manager.world_instances),
+            "buildings": len(game.building_manager.building_instances),
+            "players": len(game.player_manager.players),
+            "robots": len(game.player_manager.robots),
+            "active_events": len(game.event_manager.active_events),
+            "active_events_by_type": game.event_manager.active_events.count_by_type(),
+            "modifiers": len(game.modifier_manager.modifiers),
+            "delayed_messages": len(game.message_bus.messages),
+            "pending_messages": len(game.message_bus.pending_messages),
+            "path_cache": len(game.path_finder._path_cache),
+        }
+
+        self.epoch += 1
+        snapshot = GameSnapshot(
+            self.epoch, game.tick_counter, game.robot.object_id if game.robot is not None else None,
+            worlds, world_buildings, buildings, players, stats,
+        )
+        self.latest = snapshot  # 替换引用即完成发布
+        return snapshot